@@ -1,18 +1,50 @@
-from k0emu.devices import BaseDevice
+import copy
+import heapq
+
+from k0emu.devices import BaseDevice, MemoryDevice, PendingInterrupt
 
 
 class Bus(object):
     ADDRESS_SPACE_SIZE = 2**16  # 64K address space
+    PAGE_SIZE = 2**8
+    NUM_PAGES = ADDRESS_SPACE_SIZE // PAGE_SIZE
+
+    NEVER = float("inf")  # next_deadline when no events are scheduled
 
     def __init__(self, processor):
         self.processor = processor
         self._unmapped = BaseDevice("unmapped")
+        self._unmapped.clocked = False  # always reads 0
+        self._unmapped.volatile = False
         self._devices_by_address = [self._unmapped] * self.ADDRESS_SPACE_SIZE
         self._device_registers_by_address = [0] * self.ADDRESS_SPACE_SIZE
+        self._addresses_by_device = {}  # id(device) -> [address of register]
+        self._indexes_by_device = {}  # id(device) -> index in _all_devices
         self._all_devices = []
+        self._clocked_devices = []
+        self._map_listeners = []
         self._intc = None
+
+        # pages wholly backed by a memory device that does not override
+        # read() or write() are read and written directly through views of
+        # its data.  all others use the device.
+        self._read_pages = [None] * self.NUM_PAGES  # memoryview of data
+        self._write_pages = [None] * self.NUM_PAGES  # (data, watched) views
         self.pending_interrupt = None
 
+        # scheduler
+        self.cycles = 0  # cycles elapsed since the bus was created
+        self.next_deadline = self.NEVER
+        self._deadlines = []  # deadline of each device in _all_devices
+        self._events = []  # heap of (deadline, index in _all_devices)
+        self.tick_quantum = None
+        self._ticked_at = 0  # bus cycle when clocked devices were last ticked
+        self._next_boundary = self.NEVER  # next multiple of tick_quantum
+
+        # (kinds, shapes) of the states saved by the devices, for checking
+        # states in load_state()
+        self._state_layout = None
+
     def __getitem__(self, address):
         return self.read(address)
 
@@ -30,6 +62,7 @@ class Bus(object):
                 be mapped to non-contigous addresses in the memory map.
         """
         register = 0
+        addresses = []
         for start, end in address_ranges:
             if (start < 0) or (end >= self.ADDRESS_SPACE_SIZE) or (start > end):
                 raise ValueError("address range 0x%04X-0x%04X out of bounds" %
@@ -43,14 +76,101 @@ class Bus(object):
 
                 self._devices_by_address[address] = device
                 self._device_registers_by_address[address] = register
+                addresses.append(address)
                 register += 1
 
         if register != device.size:
             raise ValueError("%s: ranges cover %d bytes but device size is %d" %
                              (device.name, register, device.size))
 
+        if _is_plain_memory(device):
+            # map the pages that fall wholly within one of its ranges
+            register = 0
+            for start, end in address_ranges:
+                first_page = (start + self.PAGE_SIZE - 1) // self.PAGE_SIZE
+                last_page = (end + 1) // self.PAGE_SIZE - 1
+                for page in range(first_page, last_page + 1):
+                    page_register = register + (page * self.PAGE_SIZE - start)
+                    self._map_page(page, device, page_register)
+                register += end - start + 1
+
         device.bus = self
+        self._addresses_by_device[id(device)] = addresses
+        self._indexes_by_device[id(device)] = len(self._all_devices)
         self._all_devices.append(device)
+        self._deadlines.append(None)
+        if getattr(device, "clocked", True):
+            self._clocked_devices.append(device)
+        self._state_layout = None
+        for callback in self._map_listeners:
+            callback()
+
+    def _map_page(self, page, device, register):
+        """Map a page wholly backed by the consecutive registers of a memory
+        device, starting at the given register, for direct access."""
+        end = register + self.PAGE_SIZE
+        self._read_pages[page] = memoryview(device.data)[register:end]
+        if device.writable:
+            self._write_pages[page] = (memoryview(device.data)[register:end],
+                                       memoryview(device.watched)[register:end])
+
+    def __deepcopy__(self, memo):
+        """Copy the bus and every device on it, for Processor.clone().  The
+        data of read-only memory devices, including any buffer backing them,
+        is shared with the copy."""
+        for device in self._all_devices:
+            if isinstance(device, MemoryDevice):
+                if not device.writable:
+                    memo[id(device.data)] = device.data
+                elif not isinstance(device.data, bytearray):
+                    # writable memory backed by a buffer is copied into
+                    # a bytearray of its own
+                    memo[id(device.data)] = bytearray(device.data)
+        clone = object.__new__(type(self))
+        memo[id(self)] = clone
+        state = dict(self.__dict__)
+        for name in self._ADDRESS_TABLES:
+            del state[name]
+        clone.__dict__.update(copy.deepcopy(state, memo))
+
+        # every device has been copied.  the table of devices by address is
+        # rebuilt a device at a time, assigning a slice for each one whose
+        # registers are at consecutive addresses, as most memory is.
+        devices_by_address = [clone._unmapped] * self.ADDRESS_SPACE_SIZE
+        for key, addresses in self._addresses_by_device.items():
+            device = memo[key]
+            if addresses and addresses[-1] - addresses[0] == len(addresses) - 1:
+                devices_by_address[addresses[0]:addresses[-1] + 1] = (
+                    [device] * len(addresses))
+            else:
+                for address in addresses:
+                    devices_by_address[address] = device
+        clone._devices_by_address = devices_by_address
+        clone._device_registers_by_address = list(
+            self._device_registers_by_address)
+        clone._addresses_by_device = dict(
+            (id(memo[key]), addresses)
+            for key, addresses in self._addresses_by_device.items())
+        clone._indexes_by_device = dict(
+            (id(memo[key]), index)
+            for key, index in self._indexes_by_device.items())
+        clone._read_pages = [None] * self.NUM_PAGES
+        clone._write_pages = [None] * self.NUM_PAGES
+        for page, view in enumerate(self._read_pages):
+            if view is not None:
+                device, register = clone.device_at(page * self.PAGE_SIZE)
+                clone._map_page(page, device, register)
+        return clone
+
+    # tables copied by __deepcopy__() itself
+    _ADDRESS_TABLES = ("_devices_by_address", "_device_registers_by_address",
+                       "_addresses_by_device", "_indexes_by_device",
+                       "_read_pages", "_write_pages")
+
+    def add_map_listener(self, callback):
+        """Register a callback to be called with no arguments each time
+        a device is added to the bus."""
+        self._map_listeners.append(callback)
 
     def device(self, name):
         """Get a device by name."""
@@ -59,6 +179,27 @@ class Bus(object):
                 return dev
         raise KeyError("No device named %r" % name)
 
+    def device_at(self, address):
+        """Return a (device, register) tuple for the given bus address."""
+        return (self._devices_by_address[address],
+                self._device_registers_by_address[address])
+
+    def memory_at(self, address, length):
+        """Return a (device, register) tuple if the given range of bus
+        addresses is backed by consecutive registers of a single memory
+        device, or None otherwise."""
+        device, register = self.device_at(address)
+        if not isinstance(device, MemoryDevice):
+            return None
+        for offset in range(1, length):
+            if self.device_at(address + offset) != (device, register + offset):
+                return None
+        return device, register
+
+    def address_of(self, device, register):
+        """Return the bus address of a device register."""
+        return self._addresses_by_device[id(device)][register]
+
     def memory_map(self):
         """Return a list of (start, end, device) tuples describing the
         memory map.  Contiguous addresses mapped to the same device
@@ -81,22 +222,221 @@ class Bus(object):
             device.reset()
         self.processor.reset()
 
+    # timing
+
     def tick(self, cycles):
-        """Inform all devices that cycles have elapsed."""
-        for device in self._all_devices:
+        """Inform devices that cycles have elapsed.  Clocked devices are
+        ticked every time; other devices are only synced once the cycle
+        they scheduled has been reached."""
+        self.cycles += cycles
+        for device in self._clocked_devices:
             device.tick(cycles)
+        if self.cycles >= self.next_deadline:
+            self._dispatch_events()
+
+    def set_tick_quantum(self, cycles):
+        """Trade the timing accuracy of device events for speed by only
+        ticking devices once every quantum of cycles, instead of after
+        every instruction.  None (the default) restores exact timing.
+
+        Clocked devices are ticked once each time the bus cycle count
+        passes a multiple of the quantum, with all of the cycles since they
+        were last ticked.  The deadline of every event is rounded up to the
+        next multiple of the quantum, so an event (such as a timer that
+        requests an interrupt) comes due up to a quantum late.  An interrupt
+        that is requested by an event is posted by the interrupt controller
+        at the next multiple after that, so it is dispatched up to two
+        quanta later than with exact timing.  Devices that are synced by
+        reading or writing their registers still see the exact cycle
+        count, and interrupts that are already pending are dispatched as
+        soon as the PSW allows it."""
+        if cycles is not None and cycles < 1:
+            raise ValueError("tick quantum must be at least 1 cycle")
+        self._tick_clocked_devices()
+        self.tick_quantum = cycles
+        if cycles is None:
+            if "tick" in self.__dict__:
+                del self.tick
+            self._next_boundary = self.NEVER
+            return
+        self.tick = self._tick_quantum
+        self._next_boundary = self._round_to_quantum(self.cycles + 1)
+
+        # move the pending events to the boundaries where they come due
+        events = []
+        for index, deadline in enumerate(self._deadlines):
+            if deadline is not None:
+                deadline = self._quantum_deadline(deadline)
+                self._deadlines[index] = deadline
+                events.append((deadline, index))
+        heapq.heapify(events)
+        self._events = events
+        self.next_deadline = events[0][0] if events else self.NEVER
+
+    def _round_to_quantum(self, cycle):
+        quantum = self.tick_quantum
+        if quantum is None:
+            return cycle
+        return -(-cycle // quantum) * quantum
+
+    def _quantum_deadline(self, deadline):
+        """Round a deadline up to the next boundary where events can be
+        dispatched"""
+        return max(self._round_to_quantum(deadline), self._next_boundary)
+
+    def _tick_quantum(self, cycles):
+        """tick() when a tick quantum is set.  Every deadline is a multiple
+        of the quantum, so events are only dispatched at a boundary."""
+        self.cycles += cycles
+        if self.cycles >= self._next_boundary:
+            self._next_boundary = self._round_to_quantum(self.cycles + 1)
+            self._tick_clocked_devices()
+            if self.cycles >= self.next_deadline:
+                self._dispatch_events()
+
+    def _tick_clocked_devices(self):
+        """Tick the clocked devices with the cycles since they were last
+        ticked, when a tick quantum is set"""
+        cycles = self.cycles - self._ticked_at
+        self._ticked_at = self.cycles
+        if self.tick_quantum is not None and cycles:
+            for device in self._clocked_devices:
+                device.tick(cycles)
+
+    def schedule(self, device, deadline):
+        """Sync the device when the bus cycle count reaches the deadline,
+        replacing any earlier deadline for it.  None cancels the event.
+
+        Events with the same deadline are dispatched in the order the
+        devices were added to the bus."""
+        index = self._indexes_by_device[id(device)]
+        if deadline is not None and self.tick_quantum is not None:
+            deadline = self._quantum_deadline(deadline)
+        if self._deadlines[index] == deadline:
+            return
+        self._deadlines[index] = deadline
+        if deadline is not None:
+            # a replaced event stays in the heap and is skipped when popped
+            heapq.heappush(self._events, (deadline, index))
+            if deadline < self.next_deadline:
+                self.next_deadline = deadline
+
+    def _dispatch_events(self):
+        events = self._events
+        deadlines = self._deadlines
+        while events and events[0][0] <= self.cycles:
+            deadline, index = heapq.heappop(events)
+            if deadlines[index] == deadline:
+                deadlines[index] = None
+                self._all_devices[index].sync()
+        self.next_deadline = events[0][0] if events else self.NEVER
+
+    # snapshots
+
+    def save_state(self):
+        """Return the state of the bus and every device on it as values
+        that marshal can serialize, for Processor.snapshot()"""
+        pending = self.pending_interrupt
+        if pending is not None:
+            pending = (pending.source_index, pending.high_priority,
+                       pending.vector_address)
+        devices = self._all_devices
+        return (self._device_kinds(),
+                tuple(device.save_state() for device in devices),
+                self.cycles, tuple(self._deadlines), pending,
+                self._ticked_at, self._next_boundary)
+
+    def load_state(self, state):
+        """Restore a state returned by save_state().  The devices on the bus
+        must have the same names and types, in the same order, as when it
+        was saved.  The whole state is checked before any of it is
+        restored, so if it raises ValueError, nothing has changed."""
+        try:
+            (kinds, device_states, cycles, deadlines, pending,
+             ticked_at, next_boundary) = state
+        except (TypeError, ValueError):
+            raise ValueError("Not a bus state")
+        devices = self._all_devices
+        if self._state_layout is None:
+            # the shape of the state a device saves does not change, so it
+            # is found once instead of saving the state of every device
+            self._state_layout = (
+                self._device_kinds(),
+                tuple(_shape(device.save_state()) for device in devices))
+        expected_kinds, shapes = self._state_layout
+        if kinds != expected_kinds:
+            raise ValueError("State is of a bus with different devices")
+        if not (isinstance(device_states, tuple) and
+                isinstance(deadlines, tuple) and
+                len(device_states) == len(deadlines) == len(devices) and
+                (pending is None or _shape(pending) == (None, None, None))):
+            raise ValueError("Not a bus state")
+        if _shape(device_states) != shapes:
+            for device, device_state, shape in zip(devices, device_states,
+                                                   shapes):
+                if _shape(device_state) != shape:
+                    raise ValueError("State of device %r does not match it"
+                                     % device.name)
+        if pending is not None:
+            source_index, high_priority, vector_address = pending
+            if self._intc is None:
+                pending = PendingInterrupt(source_index, high_priority,
+                                           vector_address)
+            else:
+                # the controller's own object, as when it was requested
+                try:
+                    pending = self._intc.preallocated_interrupt(
+                        source_index, high_priority)
+                except (IndexError, TypeError):
+                    raise ValueError("Not a bus state")
+
+        for device, device_state in zip(devices, device_states):
+            device.load_state(device_state)
+
+        self.cycles = cycles
+        self._ticked_at = ticked_at
+        self._next_boundary = next_boundary
+        self.pending_interrupt = pending
+
+        self._deadlines = list(deadlines)
+        events = [(deadline, index) for index, deadline in enumerate(deadlines)
+                  if deadline is not None]
+        heapq.heapify(events)
+        self._events = events
+        self.next_deadline = events[0][0] if events else self.NEVER
+
+    def _device_kinds(self):
+        return tuple((device.name, type(device).__qualname__)
+                     for device in self._all_devices)
 
     # data operations
 
     def is_high_speed(self, address):
         return self._devices_by_address[address].high_speed
 
+    def is_volatile(self, address):
+        """True if a read of the address may give a different value without
+        a write or a scheduled device event"""
+        device = self._devices_by_address[address]
+        return (getattr(device, "clocked", True) or
+                getattr(device, "volatile", True))
+
     def read(self, address):
+        page = self._read_pages[address >> 8]
+        if page is not None:
+            return page[address & 0xFF]
         device = self._devices_by_address[address]
         register = self._device_registers_by_address[address]
         return device.read(register)
 
     def write(self, address, value):
+        page = self._write_pages[address >> 8]
+        if page is not None:
+            data, watched = page
+            offset = address & 0xFF
+            if not watched[offset]:  # watchers are informed by the device
+                data[offset] = value
+                return
         device = self._devices_by_address[address]
         register = self._device_registers_by_address[address]
         device.write(register, value)
@@ -106,6 +446,11 @@ class Bus(object):
     def set_interrupt_controller(self, intc_device):
         self._intc = intc_device
 
+    @property
+    def interrupt_controller(self):
+        """The interrupt controller device, or None if there is none"""
+        return self._intc
+
     def interrupt(self, device, device_int):
         """Request an interrupt.  Called by peripheral devices."""
         self._intc.interrupt(device, device_int)
@@ -116,13 +461,23 @@ class Bus(object):
         self.pending_interrupt = None
 
 
-class PendingInterrupt(object):
-    """Interrupt waiting to be serviced.
+def _is_plain_memory(device):
+    """Check that a device is a memory device that does not override read()
+    or write(), so its pages can be read and written directly"""
+    cls = type(device)
+    return (isinstance(device, MemoryDevice) and
+            cls.read is MemoryDevice.read and cls.write is MemoryDevice.write)
+
+
+def _shape(state):
+    """Shape of a saved state: its nested tuples, with the length of each
+    bytes object and None for every other value"""
+    if type(state) is tuple:
+        return tuple([_shape(item) if type(item) in _CONTAINERS else None
+                      for item in state])
+    if type(state) is bytes:
+        return len(state)
+    return None
+
 
-    Created by the interrupt controller during tick() and placed
-    on the bus for the processor to consume.
-    """
-    def __init__(self, source_index, high_priority, vector_address):
-        self.source_index = source_index
-        self.high_priority = high_priority
-        self.vector_address = vector_address
+_CONTAINERS = (tuple, bytes)
@@ -0,0 +1,89 @@
+"""Directories of cached values that are expensive to compute, such as
+translated blocks and machine snapshots, shared by the processes that run
+the same ROM image.
+"""
+import hashlib
+import marshal
+import os
+import sys
+import tempfile
+import zlib
+
+
+class FileCache(object):
+    """Directory with one compressed file for each key, holding a value that
+    marshal can serialize.  Files are replaced atomically, so processes can
+    share the directory, and the least recently used files are removed once
+    the files with this SUFFIX hold more than max_size bytes.
+
+    marshal is not secure against malicious data, so the directory must
+    only be writable by the user running the emulator.  store() creates it
+    with owner-only permissions if it does not exist."""
+
+    SUFFIX = ".k0cache"
+
+    def __init__(self, directory, max_size=64 * 1024 * 1024):
+        self.directory = directory
+        self.max_size = max_size
+
+    def load(self, key):
+        """Return the value saved for the key, or None if there is none or
+        it cannot be read"""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = marshal.loads(zlib.decompress(f.read()))
+            os.utime(path)  # most recently used
+        except (OSError, EOFError, ValueError, TypeError, zlib.error):
+            return None
+        return value
+
+    def store(self, key, value):
+        """Save the value for the key, replacing any saved before"""
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(zlib.compress(marshal.dumps(value)))
+            os.replace(temp_path, self._path(key))
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        self._evict(self._path(key))
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + self.SUFFIX)
+
+    def _evict(self, keep):
+        """Remove the least recently used files, except keep, until the
+        directory is no larger than max_size"""
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(self.SUFFIX):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:  # removed by another process
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for mtime, size, path in files)
+        for mtime, size, path in sorted(files):
+            if total <= self.max_size:
+                break
+            if path != keep:
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+                total -= size
+
+
+def fingerprint(modules):
+    """Hash of the sources of the modules and of the Python version, for
+    keys of values that are only valid for the code that computed them"""
+    digest = hashlib.sha256(sys.implementation.cache_tag.encode("ascii"))
+    digest.update(b"marshal %d" % marshal.version)
+    for module in modules:
+        with open(module.__file__, "rb") as f:
+            digest.update(f.read())
+    return digest.digest()
@@ -0,0 +1,90 @@
+"""Checkpoints of the machine at named milestones.
+
+Reaching a milestone such as the end of the firmware's initialization can
+take tens of millions of cycles.  A CheckpointCache saves a snapshot of the
+machine once a milestone is reached, and the next process that starts from
+the same state restores the snapshot instead of running to the milestone
+again.
+"""
+import hashlib
+import importlib
+
+from k0emu.cache import FileCache, fingerprint
+
+
+class CheckpointCache(FileCache):
+    """Directory of snapshots taken at milestones by reach().
+
+    A snapshot is keyed by the name of its milestone and by everything that
+    decides the state of the machine when the milestone is reached: the
+    state it was reached from (including the ROM image), the memory map and
+    interrupt connections of the devices, the cycle mode and tick quantum,
+    and the code of the emulator, including the block translator.
+    Changing any of them invalidates the snapshot.  Targets attached to the
+    I2C and SPI controllers, and call hooks, are not part of the key, so
+    milestones reached with different ones must have different names."""
+
+    SUFFIX = ".k0checkpoint"
+
+    def reach(self, proc, milestone, run):
+        """Bring the processor to the milestone: restore the snapshot saved
+        for it if there is one, otherwise call run(proc) and save a snapshot
+        afterward.  Returns True if the snapshot was restored."""
+        key = self._key(proc, milestone)
+        snapshot = self.load(key)
+        if isinstance(snapshot, bytes):
+            try:
+                proc.restore(snapshot)
+                return True
+            except ValueError:
+                # a snapshot of an older format.  restore() checks the
+                # whole snapshot before changing anything, so the machine
+                # is still in the state the milestone is run from.
+                pass
+        run(proc)
+        self.store(key, proc.snapshot())
+        return False
+
+    def _key(self, proc, milestone):
+        digest = hashlib.sha256(_fingerprint())
+        digest.update(b"milestone %s\n" % milestone.encode("utf-8"))
+        digest.update(b"cycle mode %d\n" % proc.cycle_mode)
+        digest.update(b"tick quantum %r\n" % proc.bus.tick_quantum)
+        for line in _wiring(proc.bus):
+            digest.update(line.encode("utf-8") + b"\n")
+        digest.update(proc.snapshot())
+        return digest.hexdigest()
+
+
+def _wiring(bus):
+    """Lines describing the memory map of the bus and the interrupt
+    connections of its devices"""
+    for start, end, device in bus.memory_map():
+        yield "%04X-%04X %s %s" % (start, end, device.name,
+                                   type(device).__qualname__)
+    intc = bus.interrupt_controller
+    if intc is not None:
+        connections = []
+        for device, device_int, source in intc.connections():
+            name = getattr(device, "name", "?")
+            connections.append("%s %d -> %d" % (name, device_int, source))
+        for line in sorted(connections):
+            yield line
+
+
+# modules whose code decides the state of the machine at a milestone,
+# including the translator that Runner.advance() may reach it with
+_EMULATOR_MODULES = ("k0emu.bus", "k0emu.checkpoint", "k0emu.devices",
+                     "k0emu.i2c", "k0emu.isa", "k0emu.processor", "k0emu.spi",
+                     "k0emu.translate")
+
+_FINGERPRINT = None
+
+
+def _fingerprint():
+    """Hash of the sources of the modules that emulate the machine"""
+    global _FINGERPRINT
+    if _FINGERPRINT is None:
+        _FINGERPRINT = fingerprint(importlib.import_module(name)
+                                   for name in _EMULATOR_MODULES)
+    return _FINGERPRINT
@@ -9,8 +9,9 @@ class BaseDevice(object):
         self.name = name
         self.bus = None
         self.size = 0
-        self.ticks = 0
         self.high_speed = high_speed
+        self._ticks = 0
+        self._synced_at = 0  # bus cycle at the last sync()
 
     def _check_bounds(self, register):
         if register < 0 or register >= self.size:
@@ -27,18 +28,118 @@ class BaseDevice(object):
         pass
 
     def tick(self, cycles):
-        self.ticks += cycles
+        self._ticks += cycles
+
+    @property
+    def ticks(self):
+        """Total cycles the device has seen, including those elapsed on
+        the bus since it was last synced."""
+        return self._ticks + self._unsynced_cycles()
+
+    @ticks.setter
+    def ticks(self, value):
+        self._ticks = value - self._unsynced_cycles()
+
+    # scheduling
+
+    # If True, the bus ticks the device after every instruction.  A device
+    # that sets it to False is only ticked when synced: by the bus when an
+    # event the device scheduled comes due, or by the device itself when
+    # its registers are accessed.  The built-in devices work this way.
+    clocked = True
+
+    # If True, reading the device's registers may give a different value
+    # without a write or a scheduled event, or may change the device, so a
+    # loop that polls it is never fast-forwarded.  Clocked devices are
+    # treated as volatile.
+    volatile = True
+
+    def _unsynced_cycles(self):
+        if self.bus is None:
+            return 0
+        return self.bus.cycles - self._synced_at
+
+    def sync(self):
+        """Tick the device with the cycles that have elapsed on the bus
+        since it was last synced."""
+        cycles = self._unsynced_cycles()
+        self._synced_at += cycles
+        self.tick(cycles)
+
+    def schedule(self, cycles):
+        """Ask the bus to sync the device after the given number of cycles,
+        replacing any earlier request.  None cancels the request."""
+        if self.bus is not None:
+            deadline = None if cycles is None else self.bus.cycles + cycles
+            self.bus.schedule(self, deadline)
+
+    # snapshots
+
+    def save_state(self):
+        """Return the state of the device as values that marshal can
+        serialize, for Processor.snapshot().  Devices extend it with the
+        state of their registers."""
+        return (self._ticks, self._synced_at)
+
+    def load_state(self, state):
+        """Restore a state returned by save_state()"""
+        self._ticks, self._synced_at = state
 
 
 class MemoryDevice(BaseDevice):
     """A generic read/write memory device (RAM or ROM).
     Covers a contiguous address range on the bus."""
 
-    def __init__(self, name, *, size, fill=0x00, writable=True, high_speed=False):
+    # memory is never ticked
+    clocked = False
+    volatile = False
+
+    def __init__(self, name, *, size=None, fill=0x00, writable=True,
+                 high_speed=False, buffer=None):
+        """buffer, if given, is an object that supports the buffer protocol,
+        such as an mmap or the buf of a multiprocessing SharedMemory, to use
+        as the backing store instead of a new bytearray filled with fill.
+        Its contents are used as they are, and size defaults to its length.
+        A read-only buffer, such as an mmap of a ROM image opened with
+        ACCESS_READ, can only back a device that is not writable, and
+        cannot be loaded."""
         super().__init__(name, high_speed=high_speed)
+        if buffer is None:
+            if size is None:
+                raise TypeError("size is required without a buffer")
+            data = bytearray([fill]) * size
+        else:
+            data = memoryview(buffer).cast("B")
+            if size is None:
+                size = len(data)
+            if len(data) < size:
+                raise ValueError("%s: buffer has %d bytes but device size is %d"
+                                 % (name, len(data), size))
+            if data.readonly and writable:
+                raise ValueError("%s: read-only buffer cannot back a writable "
+                                 "device" % name)
+            data = data[:size]
         self.size = size
-        self._data = bytearray([fill]) * size
+        self._data = data
         self._writable = writable
+        self._watched = bytearray(size)
+        self._watchers = []
+
+    @property
+    def data(self):
+        """The bytearray, or the memoryview of the buffer, backing this
+        device.  Changes made directly to it bypass write protection and are
+        not seen by watchers."""
+        return self._data
+
+    @property
+    def writable(self):
+        return self._writable
+
+    @property
+    def watched(self):
+        """The bytearray of watch flags, nonzero for each watched register."""
+        return self._watched
 
     def read(self, register):
         self._check_bounds(register)
@@ -48,13 +149,61 @@ class MemoryDevice(BaseDevice):
         self._check_bounds(register)
         if self._writable:
             self._data[register] = value
+            if self._watched[register]:
+                self._modified(register, register + 1)
 
     def load(self, register, data):
         """Write directly to backing store, bypassing the writable flag.
         Used for loading firmware images and test code."""
         self._check_bounds(register)
         self._check_bounds(register + len(data) - 1)
-        self._data[register:register + len(data)] = data
+        end = register + len(data)
+        self._data[register:end] = data
+        if self._watched.find(1, register, end) != -1:
+            self._modified(register, end)
+
+    # write watching
+
+    def add_watcher(self, callback):
+        """Register a callback to be informed when watched bytes change.
+        The callback is called as callback(device, start, end) with the
+        range of registers [start, end) that were modified."""
+        if callback not in self._watchers:
+            self._watchers.append(callback)
+
+    def watch(self, register):
+        """Mark a register as watched.  The next write or load that
+        modifies it will inform the watchers.  A watch is cleared once it
+        has fired, so watchers must re-watch if they are still interested."""
+        self._watched[register] = 1
+
+    def _modified(self, start, end):
+        self._watched[start:end] = bytes(end - start)
+        for callback in self._watchers:
+            callback(self, start, end)
+
+    # snapshots
+
+    def save_state(self):
+        return (super().save_state(), bytes(self._data))
+
+    def load_state(self, state):
+        """Restore the data in place.  Watchers are informed of each
+        watched register that changes."""
+        base, data = state
+        super().load_state(base)
+        if self._data == data:
+            return
+        changed = []
+        watched = self._watched
+        register = watched.find(1)
+        while register != -1:
+            if self._data[register] != data[register]:
+                changed.append(register)
+            register = watched.find(1, register + 1)
+        self._data[:] = data
+        for register in changed:
+            self._modified(register, register + 1)
 
 
 class RegisterFileDevice(MemoryDevice):
@@ -76,12 +225,59 @@ class ProcessorStatusDevice(MemoryDevice):
         0: SPL  (FF1C) - stack pointer low byte
         1: SPH  (FF1D) - stack pointer high byte
         2: PSW  (FF1E) - program status word
+
+    The processor holds SP and PSW in fields.  Once attached to the
+    processor, this device is a view of those fields; until then it
+    stores the registers itself.
     """
 
     SIZE = 3
 
+    # Local register offsets
+    SPL = 0
+    SPH = 1
+    PSW = 2
+
     def __init__(self, name, high_speed=False):
         super().__init__(name, size=self.SIZE, high_speed=high_speed)
+        self.processor = None
+
+    def attach(self, processor):
+        """Make the registers a view of the processor's SP and PSW."""
+        self.processor = processor
+
+    def read(self, register):
+        proc = self.processor
+        if proc is None:
+            return super().read(register)
+        self._check_bounds(register)
+        if register == self.PSW:
+            return proc.read_psw()
+        if register == self.SPH:
+            return proc.read_sp() >> 8
+        return proc.read_sp() & 0xFF
+
+    def write(self, register, value):
+        proc = self.processor
+        if proc is None:
+            super().write(register, value)
+            return
+        self._check_bounds(register)
+        if register == self.PSW:
+            proc.write_psw(value)
+        elif register == self.SPH:
+            proc.write_sp((value << 8) | (proc.read_sp() & 0xFF))
+        else:
+            proc.write_sp((proc.read_sp() & 0xFF00) | value)
+
+    def load(self, register, data):
+        if self.processor is None:
+            super().load(register, data)
+            return
+        self._check_bounds(register)
+        self._check_bounds(register + len(data) - 1)
+        for offset, value in enumerate(data):
+            self.write(register + offset, value)
 
 
 class WatchdogDevice(BaseDevice):
@@ -99,8 +295,15 @@ class WatchdogDevice(BaseDevice):
     Writing WDTM with RUN=1 clears the counter and restarts counting.
     RUN, WDTM4, and WDTM3 are one-way latches: once set to 1, they
     cannot be cleared to 0 by software.  Only hardware reset clears them.
+
+    The counter is not ticked after every instruction.  While running,
+    the device schedules a sync with the bus for the cycle it overflows.
     """
 
+    # synced when it overflows or its registers are accessed
+    clocked = False
+    volatile = False
+
     # Local register offsets
     WDCS = 0   # FF42: clock selection
     WDTM = 1   # FFF9: mode control
@@ -139,6 +342,7 @@ class WatchdogDevice(BaseDevice):
         self._wdcs = 0x00
         self._wdtm = 0x00
         self._counter = 0
+        self.schedule(None)
 
     def read(self, register):
         self._check_bounds(register)
@@ -148,6 +352,7 @@ class WatchdogDevice(BaseDevice):
 
     def write(self, register, value):
         self._check_bounds(register)
+        self.sync()
         if register == self.WDCS:
             self._wdcs = value & 0x07
         elif register == self.WDTM:
@@ -155,12 +360,27 @@ class WatchdogDevice(BaseDevice):
             self._wdtm |= value & (self.RUN | self.WDTM4 | self.WDTM3)
             if value & self.RUN:
                 self._counter = 0  # kick: clear counter and restart
+        self._reschedule()
 
     def tick(self, cycles):
         if self.running:
             self._counter += cycles
             if self._counter >= self.interval:
                 self._overflow()
+        self._reschedule()
+
+    def _reschedule(self):
+        if self.running:
+            self.schedule(max(self.interval - self._counter, 0))
+        else:
+            self.schedule(None)
+
+    def save_state(self):
+        return (super().save_state(), self._wdcs, self._wdtm, self._counter)
+
+    def load_state(self, state):
+        base, self._wdcs, self._wdtm, self._counter = state
+        super().load_state(base)
 
     @property
     def mode(self):
@@ -195,7 +415,15 @@ class FreeRunningTimerDevice(BaseDevice):
 
     Increments by the number of elapsed CPU clocks on each tick.
     Read as a 16-bit word (low byte at register 0, high byte at register 1).
-    Wraps at 0xFFFF -> 0x0000."""
+    Wraps at 0xFFFF -> 0x0000.
+
+    The counter is not ticked after every instruction.  It is synced with
+    the bus when it is read."""
+
+    # synced when read, not ticked after every instruction.  the count
+    # changes without a write or an event.
+    clocked = False
+    volatile = True
 
     def __init__(self, name):
         super().__init__(name)
@@ -204,6 +432,7 @@ class FreeRunningTimerDevice(BaseDevice):
 
     def read(self, register):
         self._check_bounds(register)
+        self.sync()
         if register == 0:
             return self._counter & 0xFF
         return (self._counter >> 8) & 0xFF
@@ -214,6 +443,13 @@ class FreeRunningTimerDevice(BaseDevice):
     def tick(self, cycles):
         self._counter = (self._counter + cycles) & 0xFFFF
 
+    def save_state(self):
+        return (super().save_state(), self._counter)
+
+    def load_state(self, state):
+        base, self._counter = state
+        super().load_state(base)
+
 
 class WatchTimerDevice(BaseDevice):
     """Watch timer.
@@ -233,8 +469,16 @@ class WatchTimerDevice(BaseDevice):
 
     Setting WTNM00=0 stops everything and clears both counters.
     Setting WTNM01=0 stops and clears only the watch timer counter.
+
+    The counters are not ticked after every instruction.  While enabled,
+    the device schedules a sync with the bus for the cycle of its next
+    interrupt.
     """
 
+    # synced when an interval ends or its registers are accessed
+    clocked = False
+    volatile = False
+
     # Local register offsets
     WTNM0 = 0  # FF41: mode control
 
@@ -261,8 +505,9 @@ class WatchTimerDevice(BaseDevice):
 
     def reset(self):
         self._wtnm0 = 0x00
-        self._prescaler_counter = 0
-        self._watch_counter = 0
+        self._prescaler_count = 0
+        self._watch_count = 0
+        self.schedule(None)
 
     def read(self, register):
         self._check_bounds(register)
@@ -270,41 +515,79 @@ class WatchTimerDevice(BaseDevice):
 
     def write(self, register, value):
         self._check_bounds(register)
+        self.sync()
         old = self._wtnm0
         self._wtnm0 = value
 
         if not (value & self.WTNM00):
             # Timer disabled: clear both counters
-            self._prescaler_counter = 0
-            self._watch_counter = 0
+            self._prescaler_count = 0
+            self._watch_count = 0
         elif not (old & self.WTNM00):
             # Just enabled: clear both counters
-            self._prescaler_counter = 0
-            self._watch_counter = 0
+            self._prescaler_count = 0
+            self._watch_count = 0
 
         if not (value & self.WTNM01):
             # 5-bit counter stopped: clear it
-            self._watch_counter = 0
+            self._watch_count = 0
+
+        self._reschedule()
 
     def tick(self, cycles):
+        self._count(cycles)
+        self._reschedule()
+
+    def _count(self, cycles):
         if not (self._wtnm0 & self.WTNM00):
             return
 
         prescaler_interval = self.prescaler_interval
-        self._prescaler_counter += cycles
-        if self._prescaler_counter >= prescaler_interval:
-            self._prescaler_counter %= prescaler_interval
+        self._prescaler_count += cycles
+        if self._prescaler_count >= prescaler_interval:
+            self._prescaler_count %= prescaler_interval
             self.bus.interrupt(self, self.INT_PRESCALER)
 
         if not (self._wtnm0 & self.WTNM01):
             return
 
         watch_interval = self.watch_interval
-        self._watch_counter += cycles
-        if self._watch_counter >= watch_interval:
-            self._watch_counter %= watch_interval
+        self._watch_count += cycles
+        if self._watch_count >= watch_interval:
+            self._watch_count %= watch_interval
             self.bus.interrupt(self, self.INT_WATCH)
 
+    def _reschedule(self):
+        if not (self._wtnm0 & self.WTNM00):
+            self.schedule(None)
+            return
+
+        cycles = self.prescaler_interval - self._prescaler_count
+        if self._wtnm0 & self.WTNM01:
+            cycles = min(cycles, self.watch_interval - self._watch_count)
+        self.schedule(max(cycles, 0))
+
+    def save_state(self):
+        return (super().save_state(),
+                self._wtnm0, self._prescaler_count, self._watch_count)
+
+    def load_state(self, state):
+        base, self._wtnm0, self._prescaler_count, self._watch_count = state
+        super().load_state(base)
+
+    @property
+    def _prescaler_counter(self):
+        """Prescaler count brought up to date with the bus.  Assigning
+        it reschedules the next interrupt."""
+        self.sync()
+        return self._prescaler_count
+
+    @_prescaler_counter.setter
+    def _prescaler_counter(self, value):
+        self.sync()
+        self._prescaler_count = value
+        self._reschedule()
+
     @property
     def _fw_divisor(self):
         """CPU cycles per fW clock tick."""
@@ -344,6 +627,11 @@ class I2CControllerDevice(BaseDevice):
     Each completed byte transfer sets the IICIF0 interrupt flag.
     """
 
+    # transfers complete as the registers are written, so it is never
+    # ticked
+    clocked = False
+    volatile = False
+
     # Register offsets
     IIC0   = 0  # FF1F: shift register
     IICC0  = 1  # FFA8: control
@@ -391,6 +679,22 @@ class I2CControllerDevice(BaseDevice):
         self._waiting = False
         self._start_pending = False
 
+    def save_state(self):
+        # the active target is saved as its address
+        address = None
+        for i2c_address, target in self._targets.items():
+            if target is self._active_target:
+                address = i2c_address
+        return (super().save_state(),
+                self._iic0, self._iicc0, self._iics0, self._iiccl0, address,
+                self._is_read, self._waiting, self._start_pending)
+
+    def load_state(self, state):
+        (base, self._iic0, self._iicc0, self._iics0, self._iiccl0, address,
+         self._is_read, self._waiting, self._start_pending) = state
+        self._active_target = self._targets.get(address)
+        super().load_state(base)
+
     def read(self, register):
         self._check_bounds(register)
         if register == self.IIC0:
@@ -515,6 +819,10 @@ class BasePortDevice(BaseDevice):
       - Input-mode pins (PMn bit = 1): pin reflects external_inputs
     """
 
+    # pins only change when written or set with set_external_input()
+    clocked = False
+    volatile = False
+
     DATA = 0
     MODE = 1
 
@@ -556,6 +864,14 @@ class BasePortDevice(BaseDevice):
         self._mode = 0xFF
         self.external_inputs = 0xFF
 
+    def save_state(self):
+        return (super().save_state(),
+                self._latch, self._mode, self.external_inputs)
+
+    def load_state(self, state):
+        base, self._latch, self._mode, self.external_inputs = state
+        super().load_state(base)
+
 
 class PortWithPullupsDevice(BasePortDevice):
     """GPIO port with an additional pull-up resistor option register (PUn)."""
@@ -582,6 +898,13 @@ class PortWithPullupsDevice(BasePortDevice):
         super().reset()
         self._pullup = 0x00
 
+    def save_state(self):
+        return (super().save_state(), self._pullup)
+
+    def load_state(self, state):
+        base, self._pullup = state
+        super().load_state(base)
+
 
 class PortWithEdgeDetectionDevice(PortWithPullupsDevice):
     """GPIO port with pull-ups and external interrupt edge detection.
@@ -623,6 +946,13 @@ class PortWithEdgeDetectionDevice(PortWithPullupsDevice):
         self._egp = 0x00
         self._egn = 0x00
 
+    def save_state(self):
+        return (super().save_state(), self._egp, self._egn)
+
+    def load_state(self, state):
+        base, self._egp, self._egn = state
+        super().load_state(base)
+
     def set_external_input(self, pin, state):
         """Set one external input pin and fire an interrupt if the edge matches EGP/EGN."""
         mask = 1 << pin
@@ -660,6 +990,11 @@ class SPIControllerDevice(BaseDevice):
     as the chip select (active high).
     """
 
+    # transfers complete as the registers are written, so it is never
+    # ticked
+    clocked = False
+    volatile = False
+
     SIO  = 0
     CSIM = 1
 
@@ -675,6 +1010,13 @@ class SPIControllerDevice(BaseDevice):
         self._sio = 0x00
         self._csim = 0x00
 
+    def save_state(self):
+        return (super().save_state(), self._sio, self._csim)
+
+    def load_state(self, state):
+        base, self._sio, self._csim = state
+        super().load_state(base)
+
     def read(self, register):
         self._check_bounds(register)
         if register == self.SIO:
@@ -708,6 +1050,11 @@ class ADCDevice(BaseDevice):
     controller.  ADCR00 returns a fixed value.
     """
 
+    # conversions complete as the registers are written, so it is never
+    # ticked
+    clocked = False
+    volatile = False
+
     ADCR00 = 0  # FF17: result
     ADM00  = 1  # FF80: mode
     ADS00  = 2  # FF81: channel select
@@ -725,6 +1072,13 @@ class ADCDevice(BaseDevice):
         self._adm00 = 0x00
         self._ads00 = 0x00
 
+    def save_state(self):
+        return (super().save_state(), self._adcr00, self._adm00, self._ads00)
+
+    def load_state(self, state):
+        base, self._adcr00, self._adm00, self._ads00 = state
+        super().load_state(base)
+
     def read(self, register):
         self._check_bounds(register)
         if register == self.ADCR00:
@@ -747,6 +1101,22 @@ class ADCDevice(BaseDevice):
             self._ads00 = value
 
 
+class PendingInterrupt(object):
+    """Interrupt waiting to be serviced.
+
+    Posted by the interrupt controller during tick() on the bus for
+    the processor to consume.  The controller preallocates one for each
+    source and priority, so they are shared and must not be modified.
+    """
+    def __init__(self, source_index, high_priority, vector_address):
+        self.source_index = source_index
+        self.high_priority = high_priority
+        self.vector_address = vector_address
+
+    def __deepcopy__(self, memo):
+        return self  # immutable
+
+
 class InterruptControllerDevice(BaseDevice):
     """Interrupt controller for the uPD780833Y subseries.
 
@@ -771,6 +1141,8 @@ class InterruptControllerDevice(BaseDevice):
     with a fixed vector address.  Peripherals request interrupts via
     bus.interrupt().  The interrupt controller evaluates pending
     interrupts during tick() and posts the result to bus.pending_interrupt.
+    It is not ticked after every instruction; whenever its state changes,
+    it schedules a tick for the end of the current instruction.
 
     Priority: each source has a default priority (position in _SOURCES).
     The PR bit selects high (0) or low (1) priority.  High-priority
@@ -778,6 +1150,11 @@ class InterruptControllerDevice(BaseDevice):
     sources, default priority order wins.
     """
 
+    # synced at the end of an instruction that changes a flag, to find
+    # the pending interrupt
+    clocked = False
+    volatile = False
+
     # Register offsets
     IF0L = 0   # FFE0
     IF0H = 1   # FFE1
@@ -865,38 +1242,99 @@ class InterruptControllerDevice(BaseDevice):
 
     NUM_SOURCES = len(_SOURCES)
 
+    # Mask of each source in the 32-bit IF, MK, and PR flags, where bit
+    # (register offset * 8 + n) is bit n of that register.  Sources are in
+    # ascending bit order, so the lowest set bit of the flags is the source
+    # with the highest default priority.
+    _SOURCE_MASKS = [bit << (reg_offset * 8) for reg_offset, bit, _ in _SOURCES]
+    _ALL_SOURCES_MASK = sum(_SOURCE_MASKS)
+
+    # Indexes into _flags for each group of four registers
+    _IF = 0
+    _MK = 1
+    _PR = 2
+
     def __init__(self, name):
         super().__init__(name)
         self.size = self.SIZE
         self._connections = {}  # (device, device_int) -> source_index
+
+        # preallocated PendingInterrupt for each source mask and priority
+        self._low_priority = {}
+        self._high_priority = {}
+        for index, (reg_offset, bit, vector) in enumerate(self._SOURCES):
+            mask = self._SOURCE_MASKS[index]
+            self._low_priority[mask] = PendingInterrupt(index, False, vector)
+            self._high_priority[mask] = PendingInterrupt(index, True, vector)
+
         self.reset()
 
     def connect(self, device, device_int, source_index):
         """Connect a device interrupt to a source channel."""
-        self._connections[(id(device), device_int)] = source_index
+        self._connections[(device, device_int)] = source_index
+
+    def connections(self):
+        """Return a list of (device, device_int, source_index) tuples for
+        the connected device interrupts."""
+        return [(device, device_int, source_index)
+                for (device, device_int), source_index
+                in self._connections.items()]
+
+    def preallocated_interrupt(self, source_index, high_priority):
+        """Return the PendingInterrupt this controller posts to the bus for
+        a source and priority."""
+        if not 0 <= source_index < len(self._SOURCES):
+            raise IndexError("No interrupt source %r" % source_index)
+        mask = self._SOURCE_MASKS[source_index]
+        if high_priority:
+            return self._high_priority[mask]
+        return self._low_priority[mask]
 
     def interrupt(self, device, device_int):
         """Set the IF flag for a connected device interrupt."""
-        source_index = self._connections[(id(device), device_int)]
-        reg_offset, bit, vector = self._SOURCES[source_index]
-        self._regs[reg_offset] |= bit
+        source_index = self._connections[(device, device_int)]
+        mask = self._SOURCE_MASKS[source_index]
+        flags = self._flags
+        if not (flags[self._IF] & mask):
+            flags[self._IF] |= mask
+            self._changed()
 
     def reset(self):
-        self._regs = bytearray(self.SIZE)
-        # MK registers reset to 0xFF (all interrupts masked)
-        for i in range(4, 8):
-            self._regs[i] = 0xFF
-        # PR registers reset to 0xFF (all low priority)
-        for i in range(8, 12):
-            self._regs[i] = 0xFF
+        # MK and PR registers reset to 0xFF (all interrupts masked,
+        # all low priority)
+        self._flags = [0x00000000, 0xFFFFFFFF, 0xFFFFFFFF]
+        self._changed()
+
+    def save_state(self):
+        return (super().save_state(), tuple(self._flags))
+
+    def load_state(self, state):
+        base, flags = state
+        self._flags = list(flags)
+        super().load_state(base)
 
     def read(self, register):
         self._check_bounds(register)
-        return self._regs[register]
+        shift = (register & 3) * 8
+        return (self._flags[register >> 2] >> shift) & 0xFF
 
     def write(self, register, value):
         self._check_bounds(register)
-        self._regs[register] = value
+        shift = (register & 3) * 8
+        flags = self._flags
+        group = register >> 2
+        old = flags[group]
+        new = (old & ~(0xFF << shift)) | (value << shift)
+        if new != old:
+            flags[group] = new
+            self._changed()
+
+    def _changed(self):
+        # Every instruction ticks the bus with at least one cycle, so the
+        # change is evaluated at the end of the current instruction.  A
+        # change made by another device's event at the end of an
+        # instruction is evaluated at the end of the next one.
+        self.schedule(1)
 
     def tick(self, cycles):
         """Evaluate pending interrupts and post result to the bus.
@@ -904,32 +1342,21 @@ class InterruptControllerDevice(BaseDevice):
         if self.bus.pending_interrupt is not None:
             return
 
-        from k0emu.bus import PendingInterrupt
-        best = None
-
-        for index, (reg_offset, bit, vector) in enumerate(self._SOURCES):
-            if_val = self._regs[reg_offset]
-            mk_val = self._regs[reg_offset + 4]
-            pr_val = self._regs[reg_offset + 8]
-
-            if not (if_val & bit):
-                continue  # not requested
-            if mk_val & bit:
-                continue  # masked
-
-            is_high = not (pr_val & bit)  # PR bit 0 = high priority
-
-            if is_high:
-                best = PendingInterrupt(index, True, vector)
-                break
-
-            if best is None:
-                best = PendingInterrupt(index, False, vector)
-            # First match wins (default priority order)
+        flags = self._flags
+        requested = flags[self._IF] & ~flags[self._MK] & self._ALL_SOURCES_MASK
+        if not requested:
+            return
 
-        self.bus.pending_interrupt = best
+        # PR bit 0 = high priority.  Within a priority, the lowest bit
+        # wins (default priority order).
+        high = requested & ~flags[self._PR]
+        if high:
+            self.bus.pending_interrupt = self._high_priority[high & -high]
+        else:
+            self.bus.pending_interrupt = self._low_priority[requested & -requested]
 
     def acknowledge_interrupt(self, source_index):
         """Clear the IF flag for the given source."""
-        reg_offset, bit, vector = self._SOURCES[source_index]
-        self._regs[reg_offset] &= ~bit
+        self._flags[self._IF] &= ~self._SOURCE_MASKS[source_index]
+        # always re-evaluated since the bus no longer has a pending interrupt
+        self._changed()
@@ -0,0 +1,204 @@
+"""Run many scenarios in parallel, one process per core.
+
+A scenario runs a ROM image from reset, applies a timeline of input events,
+and stops after a number of cycles, or earlier when PC reaches an address
+or the display shows some text.  Scenarios are read from a file with one
+JSON object on each line:
+
+    {"name": "power on", "rom": "rom.bin", "max_cycles": 41900000,
+     "events": [{"at": 8380000, "clear": [65280, 16]}],
+     "until_display": "   FM1 887 "}
+
+Events are applied at a cycle count since reset ("at") and either write a
+value to an address ("write": [address, value]), or set or clear the bits
+of a mask at an address ("set" or "clear": [address, mask]).  ROM paths
+are relative to the file.  The result of each scenario is written as a line
+of JSON, in the order of the scenarios, as soon as it and those before it
+have finished.
+
+Each worker process loads a ROM image once and clones the machine for each
+scenario that runs it.  An image that fills the ROM is mapped from the file
+instead, so the workers share one copy of it.
+"""
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import mmap
+import os
+import sys
+
+from k0emu.devices import MemoryDevice
+from k0emu.processor import StopReason
+from k0emu.run import display_text
+from k0emu.system import make_processor
+
+
+class Scenario(object):
+    # display and stop conditions are checked once per interval (~1ms)
+    CHECK_INTERVAL_CYCLES = 4190
+
+    def __init__(self, name, rom, max_cycles, events=(), until_pc=None,
+                 until_display=None):
+        """rom is the path of the ROM image.  events are (at, action,
+        address, value) tuples where action is "write", "set", or "clear".
+        until_pc is an address or a list of addresses."""
+        self.name = name
+        self.rom = rom
+        self.max_cycles = max_cycles
+        self.events = sorted(events, key=lambda event: event[0])
+        self.until_pc = until_pc
+        self.until_display = until_display
+
+    @classmethod
+    def from_json(cls, data, directory=""):
+        """Make a scenario from a decoded line of a scenario file.  The ROM
+        path is relative to the directory."""
+        events = []
+        for event in data.get("events", ()):
+            actions = [action for action in ("write", "set", "clear")
+                       if action in event]
+            if len(actions) != 1:
+                raise ValueError("Event needs one of write, set, or clear: %r"
+                                 % (event,))
+            address, value = event[actions[0]]
+            events.append((event["at"], actions[0], address, value))
+        until_pc = data.get("until_pc")
+        if isinstance(until_pc, list):
+            until_pc = tuple(until_pc)
+        return cls(data["name"], os.path.join(directory, data["rom"]),
+                   data["max_cycles"], events, until_pc,
+                   data.get("until_display"))
+
+    def run(self):
+        """Run the scenario in a clone of the machine for its ROM image and
+        return its result as a dict for JSON"""
+        result = {"name": self.name}
+        proc = None
+        try:
+            proc = _machine(self.rom).clone()
+            result["stop"] = self._run(proc)
+        except Exception as exc:
+            result["stop"] = "error"
+            result["error"] = "%s: %s" % (type(exc).__name__, exc)
+        if proc is not None:
+            result["cycles"] = proc.total_cycles
+            result["pc"] = proc.pc
+            result["display"] = display_text(proc)
+            result["ram_sha256"] = _ram_hash(proc)
+        return result
+
+    def _run(self, proc):
+        """Returns the reason the scenario stopped: "cycles", "pc", or
+        "display" """
+        bus = proc.bus
+        for at, action, address, value in self.events:
+            stop = self._run_until(proc, min(at, self.max_cycles))
+            if stop is not None:
+                return stop
+            if proc.total_cycles >= self.max_cycles:
+                return "cycles"
+            if action == "set":
+                value = bus.read(address) | value
+            elif action == "clear":
+                value = bus.read(address) & ~value
+            bus.write(address, value)
+        return self._run_until(proc, self.max_cycles) or "cycles"
+
+    def _run_until(self, proc, cycles):
+        """Run until the total cycles reach the given count.  Returns the
+        stop condition that was met first, or None."""
+        while proc.total_cycles < cycles:
+            max_cycles = min(cycles - proc.total_cycles,
+                             self.CHECK_INTERVAL_CYCLES)
+            reason, _ = proc.run(max_cycles, until_pc=self.until_pc)
+            if reason == StopReason.UNTIL_PC:
+                return "pc"
+            if (self.until_display is not None and
+                    display_text(proc) == self.until_display):
+                return "display"
+        return None
+
+
+# machines at reset in this process, by ROM path
+_MACHINES = {}
+
+# size of the ROM in make_processor()
+_ROM_SIZE = 0xF000
+
+
+def _machine(rom):
+    proc = _MACHINES.get(rom)
+    if proc is None:
+        with open(rom, "rb") as f:
+            if os.fstat(f.fileno()).st_size == _ROM_SIZE:
+                # an image that fills the ROM is mapped instead of loaded,
+                # so every worker shares the pages of the file
+                rom_buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                proc = make_processor(rom_buffer=rom_buffer)
+            else:
+                proc = make_processor()
+                proc.bus.device("rom").load(0, f.read())
+        proc.bus.reset()
+        _MACHINES[rom] = proc
+    return proc
+
+
+def _ram_hash(proc):
+    """Hash of the data in every writable memory device"""
+    digest = hashlib.sha256()
+    devices = []
+    for start, end, device in proc.bus.memory_map():
+        if (isinstance(device, MemoryDevice) and device.writable and
+                device not in devices):
+            devices.append(device)
+            digest.update(device.data)
+    return digest.hexdigest()
+
+
+def _run_scenario(scenario):
+    return scenario.run()
+
+
+def run_scenarios(scenarios, workers=None):
+    """Run the scenarios in a pool of worker processes, one for each core
+    unless the number of workers is given.  Yields the result of each
+    scenario, in order."""
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        for result in executor.map(_run_scenario, scenarios):
+            yield result
+
+
+def read_scenarios(path):
+    """Read the scenarios from a file with one JSON object on each line"""
+    directory = os.path.dirname(path)
+    scenarios = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                scenarios.append(Scenario.from_json(json.loads(line),
+                                                    directory))
+    return scenarios
+
+
+def main(args=None, output=None):
+    if output is None:
+        output = sys.stdout
+    parser = argparse.ArgumentParser(
+        prog="k0emu --farm",
+        description="Run scenarios in parallel and print their results "
+                    "as JSON lines")
+    parser.add_argument("scenarios", help="file of scenarios, one JSON "
+                                          "object on each line")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="number of worker processes (default: "
+                             "one for each core)")
+    options = parser.parse_args(args)
+    scenarios = read_scenarios(options.scenarios)
+    for result in run_scenarios(scenarios, options.workers):
+        output.write(json.dumps(result, sort_keys=True) + "\n")
+        output.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,634 @@
+"""78K0 instruction set.
+
+A declarative table of every instruction the processor implements.  Each
+row describes one instruction, or one family of instructions whose opcode
+encodes an operand (a register, register pair, bit number, register bank,
+or CALLF/CALLT address), and gives its mnemonic, length, cycles, and the
+Processor method that executes it.  The processor builds its dispatch
+tables from this table.
+
+describe() decodes an instruction from its bytes and describes its
+operands, the registers, flags, and memory it reads and writes, and its
+effect on the flow of control, without executing it.
+"""
+
+import re
+
+
+class Instruction(object):
+    def __init__(self, prefix, opcodes, mnemonic, length, cycles,
+                 slow_cycles, handler):
+        """
+        prefix: the prefix byte (0x31, 0x61, or 0x71), or None.
+        opcodes: the opcode bytes (after the prefix, if any).
+        mnemonic: template in the format used by k0dasm, e.g.
+            "mov {reg},{imm8}".
+        length: number of bytes, including the prefix.
+        cycles: cycles when any data operands are in high-speed memory.
+        slow_cycles: cycles when all data operands are in other memory.
+        handler: name of the Processor method that executes it.
+        """
+        self.prefix = prefix
+        self.opcodes = opcodes
+        self.mnemonic = mnemonic
+        self.length = length
+        self.cycles = cycles
+        self.slow_cycles = slow_cycles
+        self.handler = handler
+        self._fields = tuple(name for name in OPCODE_FIELDS
+                             if "{%s}" % name in mnemonic)
+
+    def fields(self, opcode):
+        """Operands encoded in the opcode, as a dict of their names in the
+        mnemonic to their values"""
+        return dict((name, OPCODE_FIELDS[name](opcode))
+                    for name in self._fields)
+
+
+# operands that are encoded in the opcode, by their name in a mnemonic
+OPCODE_FIELDS = {
+    "reg": lambda opcode: opcode & 0b111,
+    "regpair": lambda opcode: (opcode >> 1) & 0b11,
+    "bit": lambda opcode: (opcode >> 4) & 0b111,
+    "bank": lambda opcode: ((opcode >> 3) & 0b01) | ((opcode >> 4) & 0b10),
+    # callt: address of the vector
+    "addr5": lambda opcode: 0x40 + (opcode & 0b00111110),
+    # callf: high bits of the address; the low byte follows the opcode
+    "addr11": lambda opcode: 0x0800 + ((opcode >> 4) << 8),
+}
+
+# step between the opcodes of a family, by the operand its opcodes encode
+_FAMILY_STEPS = {"reg": 1, "regpair": 2, "bit": 0x10, "bank": None,
+                 "addr5": 2, "addr11": 0x10}
+
+
+def _parse_opcodes(text, mnemonic):
+    """Parse the opcodes of a table row: a single opcode ("8e"), a list
+    ("d0,d8,f0,f8"), or a family ("40-47") where the step between opcodes
+    depends on the operand they encode.  A family may list opcodes to
+    leave out ("60-67 !61")."""
+    text, _, excluded = text.partition(" !")
+    if "-" in text:
+        first, last = [int(opcode, 16) for opcode in text.split("-")]
+        step, = [_FAMILY_STEPS[name] for name in OPCODE_FIELDS
+                 if "{%s}" % name in mnemonic]
+        opcodes = range(first, last + 1, step)
+    else:
+        opcodes = [int(opcode, 16) for opcode in text.split(",")]
+    excluded = [int(opcode, 16) for opcode in excluded.split(",") if opcode]
+    return tuple(opcode for opcode in opcodes if opcode not in excluded)
+
+
+# handler: the name of the Processor method after "_opcode_" and the prefix
+_UNPREFIXED = (
+    # opcode      mnemonic                         length, cycles, handler
+    ("00",        "nop",                           1,  2,  2, "0x00"),
+    ("01",        "not1 cy",                       1,  2,  2, "0x01"),
+    ("02",        "movw ax,{addr16p}",             3, 10, 12, "0x02"),
+    ("03",        "movw {addr16p},ax",             3, 10, 12, "0x03"),
+    ("04",        "dbnz {saddr},{reltarget}",      3,  8, 10, "0x04"),
+    ("05",        "xch a,[de]",                    1,  4,  6, "0x05"),
+    ("07",        "xch a,[hl]",                    1,  4,  6, "0x07"),
+    ("08",        "add a,{addr16}",                3,  8,  9, "0x08"),
+    ("09",        "add a,[hl+{offset}]",           2,  8,  9, "0x09"),
+    ("0a-7a",     "set1 {saddr}.{bit}",            2,  4,  6, "0x0a_to_0x7a_set1"),
+    ("0b-7b",     "clr1 {saddr}.{bit}",            2,  4,  6, "0x0b_to_0x7b_clr"),
+    ("0c-7c",     "callf {addr11}",                2,  5,  5, "0x0c_to_0x7c_callf"),
+    ("0d",        "add a,{imm8}",                  2,  4,  4, "0x0d"),
+    ("0e",        "add a,{saddr}",                 2,  4,  5, "0x0e"),
+    ("0f",        "add a,[hl]",                    1,  4,  5, "0x0f"),
+    ("10-16",     "movw {regpair},{imm16}",        3,  6,  6, "0x10_to_0x16_movw"),
+    ("11",        "mov {saddr},{imm8}",            3,  6,  7, "0x11"),
+    ("13",        "mov {sfr},{imm8}",              3,  6,  7, "0x13"),
+    ("18",        "sub a,{addr16}",                3,  8,  9, "0x18"),
+    ("19",        "sub a,[hl+{offset}]",           2,  8,  9, "0x19"),
+    ("1d",        "sub a,{imm8}",                  2,  4,  4, "0x1d"),
+    ("1e",        "sub a,{saddr}",                 2,  4,  5, "0x1e"),
+    ("1f",        "sub a,[hl]",                    1,  4,  5, "0x1f"),
+    ("20",        "set1 cy",                       1,  2,  2, "0x20"),
+    ("21",        "clr1 cy",                       1,  2,  2, "0x21"),
+    ("22",        "push psw",                      1,  2,  2, "0x22"),
+    ("23",        "pop psw",                       1,  2,  2, "0x23"),
+    ("24",        "ror a,1",                       1,  2,  2, "0x24"),
+    ("25",        "rorc a,1",                      1,  2,  2, "0x25"),
+    ("26",        "rol a,1",                       1,  2,  2, "0x26"),
+    ("27",        "rolc a,1",                      1,  2,  2, "0x27"),
+    ("28",        "addc a,{addr16}",               3,  8,  9, "0x28"),
+    ("29",        "addc a,[hl+{offset}]",          2,  8,  9, "0x29"),
+    ("2d",        "addc a,{imm8}",                 2,  4,  4, "0x2d"),
+    ("2e",        "addc a,{saddr}",                2,  4,  5, "0x2e"),
+    ("2f",        "addc a,[hl]",                   1,  4,  5, "0x2f"),
+    ("30-37 !31", "xch a,{reg}",                   1,  2,  2, "0x30_to_0x37_except_0x31"),
+    ("38",        "subc a,{addr16}",               3,  8,  9, "0x38"),
+    ("39",        "subc a,[hl+{offset}]",          2,  8,  9, "0x39"),
+    ("3d",        "subc a,{imm8}",                 2,  4,  4, "0x3d"),
+    ("3e",        "subc a,{saddr}",                2,  4,  5, "0x3e"),
+    ("3f",        "subc a,[hl]",                   1,  4,  5, "0x3f"),
+    ("40-47",     "inc {reg}",                     1,  2,  2, "0x40_to_0x47_inc"),
+    ("48",        "cmp a,{addr16}",                3,  8,  9, "0x48"),
+    ("49",        "cmp a,[hl+{offset}]",           2,  8,  9, "0x49"),
+    ("4d",        "cmp a,{imm8}",                  2,  4,  4, "0x4d"),
+    ("4e",        "cmp a,{saddr}",                 2,  4,  5, "0x4e"),
+    ("4f",        "cmp a,[hl]",                    1,  4,  5, "0x4f"),
+    ("50-57",     "dec {reg}",                     1,  2,  2, "0x50_to_0x57_dec"),
+    ("58",        "and a,{addr16}",                3,  8,  9, "0x58"),
+    ("59",        "and a,[hl+{offset}]",           2,  8,  9, "0x59"),
+    ("5d",        "and a,{imm8}",                  2,  4,  4, "0x5d"),
+    ("5e",        "and a,{saddr}",                 2,  4,  5, "0x5e"),
+    ("5f",        "and a,[hl]",                    1,  4,  5, "0x5f"),
+    ("60-67 !61", "mov a,{reg}",                   1,  2,  2, "0x60_to_0x67_except_0x61"),
+    ("68",        "or a,{addr16}",                 3,  8,  9, "0x68"),
+    ("69",        "or a,[hl+{offset}]",            2,  8,  9, "0x69"),
+    ("6d",        "or a,{imm8}",                   2,  4,  4, "0x6d"),
+    ("6e",        "or a,{saddr}",                  2,  4,  5, "0x6e"),
+    ("6f",        "or a,[hl]",                     1,  4,  5, "0x6f"),
+    ("70-77 !71", "mov {reg},a",                   1,  2,  2, "0x70_to_0x77_except_0x71"),
+    ("78",        "xor a,{addr16}",                3,  8,  9, "0x78"),
+    ("79",        "xor a,[hl+{offset}]",           2,  8,  9, "0x79"),
+    ("7d",        "xor a,{imm8}",                  2,  4,  4, "0x7d"),
+    ("7e",        "xor a,{saddr}",                 2,  4,  5, "0x7e"),
+    ("7f",        "xor a,[hl]",                    1,  4,  5, "0x7f"),
+    ("80-86",     "incw {regpair}",                1,  4,  4, "0x80_to_0x86_incw"),
+    ("81",        "inc {saddr}",                   2,  4,  6, "0x81"),
+    ("83",        "xch a,{saddr}",                 2,  4,  6, "0x83"),
+    ("85",        "mov a,[de]",                    1,  4,  5, "0x85"),
+    ("87",        "mov a,[hl]",                    1,  4,  5, "0x87"),
+    ("88",        "add {saddr},{imm8}",            3,  6,  8, "0x88"),
+    ("89",        "movw ax,{saddrp}",              2,  6,  8, "0x89"),
+    ("8a",        "dbnz c,{reltarget}",            2,  6,  6, "0x8a"),
+    ("8b",        "dbnz b,{reltarget}",            2,  6,  6, "0x8b"),
+    ("8c-fc",     "bt {saddr}.{bit},{reltarget}",  3,  8,  9, "0x8c_to_0xfc_bt"),
+    ("8d",        "bc {reltarget}",                2,  6,  6, "0x8d"),
+    ("8e",        "mov a,{addr16}",                3,  8,  9, "0x8e"),
+    ("8f",        "reti",                          1,  6,  6, "0x8f"),
+    ("90-96",     "decw {regpair}",                1,  4,  4, "0x90_to_0x96_decw"),
+    ("91",        "dec {saddr}",                   2,  4,  6, "0x91"),
+    ("93",        "xch a,{sfr}",                   2,  4,  6, "0x93"),
+    ("95",        "mov [de],a",                    1,  4,  5, "0x95"),
+    ("97",        "mov [hl],a",                    1,  4,  5, "0x97"),
+    ("98",        "sub {saddr},{imm8}",            3,  6,  8, "0x98"),
+    ("99",        "movw {saddrp},ax",              2,  6,  8, "0x99"),
+    ("9a",        "call {addr16}",                 3,  7,  7, "0x9a"),
+    ("9b",        "br {addr16}",                   3,  6,  6, "0x9b"),
+    ("9d",        "bnc {reltarget}",               2,  6,  6, "0x9d"),
+    ("9e",        "mov {addr16},a",                3,  8,  9, "0x9e"),
+    ("9f",        "retb",                          1,  6,  6, "0x9f"),
+    ("a0-a7",     "mov {reg},{imm8}",              2,  4,  4, "0xa0_to_0xa7"),
+    ("a8",        "addc {saddr},{imm8}",           3,  6,  8, "0xa8"),
+    ("a9",        "movw ax,{sfrp}",                2,  6,  8, "0xa9"),
+    ("aa",        "mov a,[hl+c]",                  1,  6,  7, "0xaa"),
+    ("ab",        "mov a,[hl+b]",                  1,  6,  7, "0xab"),
+    ("ad",        "bz {reltarget}",                2,  6,  6, "0xad"),
+    ("ae",        "mov a,[hl+{offset}]",           2,  8,  9, "0xae"),
+    ("af",        "ret",                           1,  6,  6, "0xaf"),
+    ("b0-b6",     "pop {regpair}",                 1,  4,  4, "0xb0_to_0xb6_pop_rp"),
+    ("b1-b7",     "push {regpair}",                1,  4,  4, "0xb1_to_0xb7_push_rp"),
+    ("b8",        "subc {saddr},{imm8}",           3,  6,  8, "0xb8"),
+    ("b9",        "movw {sfrp},ax",                2,  6,  8, "0xb9"),
+    ("ba",        "mov [hl+c],a",                  1,  6,  7, "0xba"),
+    ("bb",        "mov [hl+b],a",                  1,  6,  7, "0xbb"),
+    ("bd",        "bnz {reltarget}",               2,  6,  6, "0xbd"),
+    ("be",        "mov [hl+{offset}],a",           2,  8,  9, "0xbe"),
+    ("bf",        "brk",                           1,  6,  6, "0xbf"),
+    ("c1-ff",     "callt {addr5}",                 1,  6,  6, "0xc1_to_0xff_callt"),
+    ("c2-c6",     "movw ax,{regpair}",             1,  4,  4, "0xc2_to_0xc6_movw"),
+    ("c8",        "cmp {saddr},{imm8}",            3,  6,  8, "0xc8"),
+    ("ca",        "addw ax,{imm16}",               3,  6,  6, "0xca"),
+    ("ce",        "xch a,{addr16}",                3,  8, 10, "0xce"),
+    ("d2-d6",     "movw {regpair},ax",             1,  4,  4, "0xd2_to_0xd6_movw"),
+    ("d8",        "and {saddr},{imm8}",            3,  6,  8, "0xd8"),
+    ("da",        "subw ax,{imm16}",               3,  6,  6, "0xda"),
+    ("de",        "xch a,[hl+{offset}]",           2,  8, 10, "0xde"),
+    ("e2-e6",     "xchw ax,{regpair}",             1,  4,  4, "0xe2_to_0xe6_xchw"),
+    ("e8",        "or {saddr},{imm8}",             3,  6,  8, "0xe8"),
+    ("ea",        "cmpw ax,{imm16}",               3,  6,  6, "0xea"),
+    ("ee",        "movw {saddrp},{imm16}",         4,  8, 10, "0xee"),
+    ("f0",        "mov a,{saddr}",                 2,  4,  5, "0xf0"),
+    ("f2",        "mov {saddr},a",                 2,  4,  5, "0xf2"),
+    ("f4",        "mov a,{sfr}",                   2,  4,  5, "0xf4"),
+    ("f6",        "mov {sfr},a",                   2,  4,  5, "0xf6"),
+    ("f8",        "xor {saddr},{imm8}",            3,  6,  8, "0xf8"),
+    ("fa",        "br {reltarget}",                2,  6,  6, "0xfa"),
+    ("fe",        "movw {sfrp},{imm16}",           4,  8, 10, "0xfe"),
+)
+
+_PREFIX_0x31 = (
+    # opcode      mnemonic                         length, cycles, handler
+    ("01-71",     "btclr {saddr}.{bit},{reltarget}",4, 10, 12, "0x01_to_0x71_btclr"),
+    ("03-73",     "bf {saddr}.{bit},{reltarget}",  4, 10, 11, "0x03_to_0x73_bf"),
+    ("05-75",     "btclr {sfr}.{bit},{reltarget}", 4, 10, 12, "0x05_to_0x75_btclr"),
+    ("06-76",     "bt {sfr}.{bit},{reltarget}",    4, 10, 11, "0x06_to_0x76_bt"),
+    ("07-77",     "bf {sfr}.{bit},{reltarget}",    4, 10, 11, "0x07_to_0x77_bf"),
+    ("0a",        "add a,[hl+c]",                  2,  8,  9, "0x0a_add"),
+    ("0b",        "add a,[hl+b]",                  2,  8,  9, "0x0b_add"),
+    ("0d-7d",     "btclr a.{bit},{reltarget}",     3,  8,  8, "0x0d_to_0x7d_btclr"),
+    ("0e-7e",     "bt a.{bit},{reltarget}",        3,  8,  8, "0x0e_to_0x7e_bt"),
+    ("0f-7f",     "bf a.{bit},{reltarget}",        3,  8,  8, "0x0f_to_0x7f_bf"),
+    ("1a",        "sub a,[hl+c]",                  2,  8,  9, "0x1a_sub"),
+    ("1b",        "sub a,[hl+b]",                  2,  8,  9, "0x1b_sub"),
+    ("2a",        "addc a,[hl+c]",                 2,  8,  9, "0x2a_addc"),
+    ("2b",        "addc a,[hl+b]",                 2,  8,  9, "0x2b_addc"),
+    ("3a",        "subc a,[hl+c]",                 2,  8,  9, "0x3a_subc"),
+    ("3b",        "subc a,[hl+b]",                 2,  8,  9, "0x3b_subc"),
+    ("4a",        "cmp a,[hl+c]",                  2,  8,  9, "0x4a_cmp"),
+    ("4b",        "cmp a,[hl+b]",                  2,  8,  9, "0x4b_cmp"),
+    ("5a",        "and a,[hl+c]",                  2,  8,  9, "0x5a_and"),
+    ("5b",        "and a,[hl+b]",                  2,  8,  9, "0x5b_and"),
+    ("6a",        "or a,[hl+c]",                   2,  8,  9, "0x6a_or"),
+    ("6b",        "or a,[hl+b]",                   2,  8,  9, "0x6b_or"),
+    ("7a",        "xor a,[hl+c]",                  2,  8,  9, "0x7a_xor"),
+    ("7b",        "xor a,[hl+b]",                  2,  8,  9, "0x7b_xor"),
+    ("80",        "rol4 [hl]",                     2, 10, 12, "0x80_rol4"),
+    ("82",        "divuw c",                       2, 25, 25, "0x82_divuw"),
+    ("85-f5",     "btclr [hl].{bit},{reltarget}",  3, 10, 12, "0x85_to_0xf5_btclr"),
+    ("86-f6",     "bt [hl].{bit},{reltarget}",     3, 10, 11, "0x86_to_0xf6_bt"),
+    ("87-f7",     "bf [hl].{bit},{reltarget}",     3, 10, 11, "0x87_to_0xf7_bf"),
+    ("88",        "mulu x",                        2, 16, 16, "0x88_mulu"),
+    ("8a",        "xch a,[hl+c]",                  2,  8, 10, "0x8a_xch"),
+    ("8b",        "xch a,[hl+b]",                  2,  8, 10, "0x8b_xch"),
+    ("90",        "ror4 [hl]",                     2, 10, 12, "0x90_ror4"),
+    ("98",        "br ax",                         2,  8,  8, "0x98_br"),
+)
+
+_PREFIX_0x61 = (
+    # opcode      mnemonic                         length, cycles, handler
+    ("00-07",     "add {reg},a",                   2,  4,  4, "0x00_to_0x07_add"),
+    ("08-0f !09", "add a,{reg}",                   2,  4,  4, "0x08_to_0x0f_add"),
+    ("10-17",     "sub {reg},a",                   2,  4,  4, "0x10_to_0x17_sub"),
+    ("18-1f !19", "sub a,{reg}",                   2,  4,  4, "0x18_to_0x1f_except_0x11"),
+    ("20-27",     "addc {reg},a",                  2,  4,  4, "0x20_to_0x27_addc"),
+    ("28-2f !29", "addc a,{reg}",                  2,  4,  4, "0x28_to_0x2f_addc"),
+    ("30-37",     "subc {reg},a",                  2,  4,  4, "0x30_to_0x37_subc"),
+    ("38-3f !39", "subc a,{reg}",                  2,  4,  4, "0x38_to_0x3f_subc"),
+    ("40-47",     "cmp {reg},a",                   2,  4,  4, "0x40_to_0x47_cmp"),
+    ("48-4f !49", "cmp a,{reg}",                   2,  4,  4, "0x48_to_0x4f_cmp"),
+    ("50-57",     "and {reg},a",                   2,  4,  4, "0x50_to_0x57_and"),
+    ("58-5f !59", "and a,{reg}",                   2,  4,  4, "0x58_to_0x5f_and"),
+    ("60-67",     "or {reg},a",                    2,  4,  4, "0x61_to_0x67_or"),
+    ("68-6f !69", "or a,{reg}",                    2,  4,  4, "0x68_to_0x6f_or"),
+    ("70-77",     "xor {reg},a",                   2,  4,  4, "0x70_to_0x77_xor"),
+    ("78-7f !79", "xor a,{reg}",                   2,  4,  4, "0x78_to_0x7f_xor"),
+    ("80",        "adjba",                         2,  4,  4, "0x80_adjba"),
+    ("89-f9",     "mov1 a.{bit},cy",               2,  4,  4, "0x89_to_0xf9_mov1"),
+    ("8a-fa",     "set1 a.{bit}",                  2,  4,  4, "0x8a_to_0xfa_set1"),
+    ("8b-fb",     "clr1 a.{bit}",                  2,  4,  4, "0x8b_to_0xfb_clr1"),
+    ("8c-fc",     "mov1 cy,a.{bit}",               2,  4,  4, "0x8c_to_0xfc_mov1"),
+    ("8d-fd",     "and1 cy,a.{bit}",               2,  4,  4, "0x8d_to_0xfd_and1"),
+    ("8e-fe",     "or1 cy,a.{bit}",                2,  4,  4, "0x8e_to_0xfe_or1"),
+    ("8f-ff",     "xor1 cy,a.{bit}",               2,  4,  4, "0x8f_to_0xff_xor1"),
+    ("90",        "adjbs",                         2,  4,  4, "0x90_adjbs"),
+    ("d0,d8,f0,f8","sel rb{bank}",                  2,  4,  4, "0xd0_to_0xf8_sel_rb"),
+)
+
+_PREFIX_0x71 = (
+    # opcode      mnemonic                         length, cycles, handler
+    ("01-71",     "mov1 {saddr}.{bit},cy",         3,  6,  8, "0x01_to_0x71_mov1"),
+    ("04-74",     "mov1 cy,{saddr}.{bit}",         3,  6,  7, "0x04_to_0x74_mov1"),
+    ("05-75",     "and1 cy,{saddr}.{bit}",         3,  6,  7, "0x05_to_0x75_and1"),
+    ("06-76",     "or1 cy,{saddr}.{bit}",          3,  6,  7, "0x06_to_0x76_or1"),
+    ("07-77",     "xor1 cy,{saddr}.{bit}",         3,  6,  7, "0x07_to_0x77_xor1"),
+    ("09-79",     "mov1 {sfr}.{bit},cy",           3,  6,  8, "0x09_to_0x79_mov1"),
+    ("0a-7a",     "set1 {sfr}.{bit}",              3,  6,  8, "0x0a_to_0x7a_set1"),
+    ("0b-7b",     "clr1 {sfr}.{bit}",              3,  6,  8, "0x0b_to_0x7b_clr1"),
+    ("0c-7c",     "mov1 cy,{sfr}.{bit}",           3,  6,  7, "0x0c_to_0x7c_mov1"),
+    ("0d-7d",     "and1 cy,{sfr}.{bit}",           3,  6,  7, "0x0d_to_0x7d_and1"),
+    ("0e-7e",     "or1 cy,{sfr}.{bit}",            3,  6,  7, "0x0e_to_0x7e_or1"),
+    ("0f-7f",     "xor1 cy,{sfr}.{bit}",           3,  6,  7, "0x0f_to_0x7f"),
+    ("10",        "halt",                          2,  3,  3, "0x10_halt"),
+    ("81-f1",     "mov1 [hl].{bit},cy",            2,  6,  8, "0x81_to_0xf1_mov1"),
+    ("82-f2",     "set1 [hl].{bit}",               2,  6,  8, "0x82_to_0xf2_set1"),
+    ("83-f3",     "clr1 [hl].{bit}",               2,  6,  8, "0x83_to_0xf3_clr1"),
+    ("84-f4",     "mov1 cy,[hl].{bit}",            2,  6,  7, "0x84_to_0xf4_mov1"),
+    ("85-f5",     "and1 cy,[hl].{bit}",            2,  6,  7, "0x85_to_0xf5_and1"),
+    ("86-f6",     "or1 cy,[hl].{bit}",             2,  6,  7, "0x86_to_0xf6_or1"),
+    ("87-f7",     "xor1 cy,[hl].{bit}",            2,  6,  7, "0x87_to_0xf7_xor1"),
+)
+
+
+def _build(prefix, rows):
+    name = "_opcode_" if prefix is None else "_opcode_0x%02x_" % prefix
+    return [Instruction(prefix, _parse_opcodes(opcodes, mnemonic), mnemonic,
+                        length, cycles, slow_cycles, name + handler)
+            for opcodes, mnemonic, length, cycles, slow_cycles, handler
+            in rows]
+
+
+INSTRUCTIONS = tuple(_build(None, _UNPREFIXED) +
+                     _build(0x31, _PREFIX_0x31) +
+                     _build(0x61, _PREFIX_0x61) +
+                     _build(0x71, _PREFIX_0x71))
+
+MAX_LENGTH = max(instruction.length for instruction in INSTRUCTIONS)
+
+_BY_OPCODE = dict(((instruction.prefix, opcode), instruction)
+                  for instruction in INSTRUCTIONS
+                  for opcode in instruction.opcodes)
+
+
+# describing instructions
+
+class Flow(object):
+    CONTINUE = 0
+    BRANCH = 1
+    CONDITIONAL_BRANCH = 2
+    CALL = 3
+    RETURN = 4
+    HALT = 5
+
+
+REGISTER_NAMES = ("x", "a", "c", "b", "e", "d", "l", "h")
+REGISTER_PAIR_NAMES = ("ax", "bc", "de", "hl")
+FLAG_NAMES = ("cy", "isp", None, "rbs0", "ac", "rbs1", "z", "ie")  # by bit
+
+_PAIRS = {"ax": ("x", "a"), "bc": ("c", "b"),
+          "de": ("e", "d"), "hl": ("l", "h")}
+_PSW = frozenset(name for name in FLAG_NAMES if name is not None)
+
+# special function registers in the saddr area that hold processor state
+_SP_ADDRESS = 0xFF1C
+_PSW_ADDRESS = 0xFF1E
+
+_BRK_VECTOR_ADDRESS = 0x003E
+
+# what each operation does: how it accesses each of its operands ("r" reads,
+# "w" writes, "rw" both, "t" branches to it), the registers and flags it
+# reads and writes besides its operands ("psw" is all of the flags), the
+# number of bytes it pushes (positive) or pops (negative) with None for the
+# size of its operand, and its flow
+_OPERATIONS = {
+    # operation  operands       reads        writes         stack  flow
+    "nop":      ((),           "",          "",              0,   Flow.CONTINUE),
+    "mov":      (("w", "r"),   "",          "",              0,   Flow.CONTINUE),
+    "movw":     (("w", "r"),   "",          "",              0,   Flow.CONTINUE),
+    "xch":      (("rw", "rw"), "",          "",              0,   Flow.CONTINUE),
+    "xchw":     (("rw", "rw"), "",          "",              0,   Flow.CONTINUE),
+    "add":      (("rw", "r"),  "",          "z ac cy",       0,   Flow.CONTINUE),
+    "addc":     (("rw", "r"),  "cy",        "z ac cy",       0,   Flow.CONTINUE),
+    "sub":      (("rw", "r"),  "",          "z ac cy",       0,   Flow.CONTINUE),
+    "subc":     (("rw", "r"),  "cy",        "z ac cy",       0,   Flow.CONTINUE),
+    "cmp":      (("r", "r"),   "",          "z ac cy",       0,   Flow.CONTINUE),
+    "and":      (("rw", "r"),  "",          "z",             0,   Flow.CONTINUE),
+    "or":       (("rw", "r"),  "",          "z",             0,   Flow.CONTINUE),
+    "xor":      (("rw", "r"),  "",          "z",             0,   Flow.CONTINUE),
+    "addw":     (("rw", "r"),  "",          "z ac cy",       0,   Flow.CONTINUE),
+    "subw":     (("rw", "r"),  "",          "z ac cy",       0,   Flow.CONTINUE),
+    "cmpw":     (("r", "r"),   "",          "z ac cy",       0,   Flow.CONTINUE),
+    "inc":      (("rw",),      "",          "z ac",          0,   Flow.CONTINUE),
+    "dec":      (("rw",),      "",          "z ac",          0,   Flow.CONTINUE),
+    "incw":     (("rw",),      "",          "",              0,   Flow.CONTINUE),
+    "decw":     (("rw",),      "",          "",              0,   Flow.CONTINUE),
+    "mulu":     (("r",),       "a",         "x a",           0,   Flow.CONTINUE),
+    "divuw":    (("rw",),      "x a",       "x a",           0,   Flow.CONTINUE),
+    "ror":      (("rw", "r"),  "",          "cy",            0,   Flow.CONTINUE),
+    "rol":      (("rw", "r"),  "",          "cy",            0,   Flow.CONTINUE),
+    "rorc":     (("rw", "r"),  "cy",        "cy",            0,   Flow.CONTINUE),
+    "rolc":     (("rw", "r"),  "cy",        "cy",            0,   Flow.CONTINUE),
+    "ror4":     (("rw",),      "a",         "a",             0,   Flow.CONTINUE),
+    "rol4":     (("rw",),      "a",         "a",             0,   Flow.CONTINUE),
+    "adjba":    ((),           "a ac cy",   "a z ac cy",     0,   Flow.CONTINUE),
+    "adjbs":    ((),           "a ac cy",   "a z ac cy",     0,   Flow.CONTINUE),
+    "set1":     (("w",),       "",          "",              0,   Flow.CONTINUE),
+    "clr1":     (("w",),       "",          "",              0,   Flow.CONTINUE),
+    "not1":     (("rw",),      "",          "",              0,   Flow.CONTINUE),
+    "mov1":     (("w", "r"),   "",          "",              0,   Flow.CONTINUE),
+    "and1":     (("rw", "r"),  "",          "",              0,   Flow.CONTINUE),
+    "or1":      (("rw", "r"),  "",          "",              0,   Flow.CONTINUE),
+    "xor1":     (("rw", "r"),  "",          "",              0,   Flow.CONTINUE),
+    "sel":      (("w",),       "",          "",              0,   Flow.CONTINUE),
+    "push":     (("r",),       "sp",        "sp",         None,   Flow.CONTINUE),
+    "pop":      (("w",),       "sp",        "sp",         None,   Flow.CONTINUE),
+    "br":       (("t",),       "",          "",              0,   Flow.BRANCH),
+    "bc":       (("t",),       "cy",        "",              0,   Flow.CONDITIONAL_BRANCH),
+    "bnc":      (("t",),       "cy",        "",              0,   Flow.CONDITIONAL_BRANCH),
+    "bz":       (("t",),       "z",         "",              0,   Flow.CONDITIONAL_BRANCH),
+    "bnz":      (("t",),       "z",         "",              0,   Flow.CONDITIONAL_BRANCH),
+    "bt":       (("r", "t"),   "",          "",              0,   Flow.CONDITIONAL_BRANCH),
+    "bf":       (("r", "t"),   "",          "",              0,   Flow.CONDITIONAL_BRANCH),
+    "btclr":    (("rw", "t"),  "",          "",              0,   Flow.CONDITIONAL_BRANCH),
+    "dbnz":     (("rw", "t"),  "",          "",              0,   Flow.CONDITIONAL_BRANCH),
+    "call":     (("t",),       "sp",        "sp",            2,   Flow.CALL),
+    "callf":    (("t",),       "sp",        "sp",            2,   Flow.CALL),
+    "callt":    (("t",),       "sp",        "sp",            2,   Flow.CALL),
+    "brk":      ((),           "sp psw",    "sp ie",         3,   Flow.CALL),
+    "ret":      ((),           "sp",        "sp",           -2,   Flow.RETURN),
+    "reti":     ((),           "sp",        "sp psw",       -3,   Flow.RETURN),
+    "retb":     ((),           "sp",        "sp psw",       -3,   Flow.RETURN),
+    "halt":     ((),           "",          "",              0,   Flow.HALT),
+    "stop":     ((),           "",          "",              0,   Flow.HALT),
+}
+
+
+class Description(object):
+    """An instruction decoded by describe()"""
+
+    def __init__(self, instruction, address, operands):
+        """
+        instruction: the Instruction in the table.
+        address: where the instruction is located.
+        operands: dict of the operand values by their names in the
+            mnemonic.  Registers and register pairs are numbers (see
+            REGISTER_NAMES and REGISTER_PAIR_NAMES), and saddr, sfr, and
+            relative branch operands are resolved to addresses.
+        """
+        self.instruction = instruction
+        self.address = address
+        self.operands = operands
+        self.mnemonic = instruction.mnemonic
+        self.length = instruction.length
+        self.cycles = instruction.cycles
+        self.slow_cycles = instruction.slow_cycles
+
+        operation = self.mnemonic.split(" ")[0]
+        accesses, reads, writes, stack, self.flow = _OPERATIONS[operation]
+        self.reads = set(_names(reads))
+        self.writes = set(_names(writes))
+        self.memory_reads = set()
+        self.memory_writes = set()
+        self.target = None
+
+        texts = self.mnemonic.partition(" ")[2].split(",")
+        for access, text in zip(accesses, texts):
+            if access == "t":
+                self.target = self._target(text)
+                if self.target is not None:
+                    continue
+                access = "r"  # br ax, or the vector of a callt
+            names, memory, pointers = self._locate(text)
+            self.reads.update(pointers)
+            if "." in text and "w" in access and not names & _PSW:
+                access = "rw"  # the rest of its byte is written back
+            if self.mnemonic == "cmp {saddr},{imm8}":
+                access = "rw"  # the hardware writes it back unchanged
+            if "r" in access:
+                self.reads.update(names)
+                if memory is not None:
+                    self.memory_reads.add(memory)
+            if "w" in access:
+                self.writes.update(names)
+                if memory is not None:
+                    self.memory_writes.add(memory)
+
+        if stack is None:  # push or pop
+            stack = 1 if texts[0] == "psw" else 2
+            if operation == "pop":
+                stack = -stack
+        if stack > 0:
+            self.memory_writes.add(("[sp]", stack))
+        elif stack < 0:
+            self.memory_reads.add(("[sp]", -stack))
+        if operation == "brk":
+            self.memory_reads.add((_BRK_VECTOR_ADDRESS, 2))
+
+        self.reads = frozenset(self.reads)
+        self.writes = frozenset(self.writes)
+        self.memory_reads = frozenset(self.memory_reads)
+        self.memory_writes = frozenset(self.memory_writes)
+
+    def __str__(self):
+        text = self.mnemonic
+        for name, value in self.operands.items():
+            text = text.replace("{%s}" % name, _FORMATS[name](value))
+        return text
+
+    def _target(self, text):
+        """Return the address branched to by an operand, or None if it is
+        not given by the instruction"""
+        if text in ("{addr11}", "{addr16}", "{reltarget}"):
+            return self.operands[text[1:-1]]
+        return None
+
+    def _locate(self, text):
+        """Return a tuple of (registers and flags, memory operand, pointers)
+        for an operand of the mnemonic, where the memory operand is None if
+        the operand is not in memory and pointers are the registers that
+        address it"""
+        text, dot, _ = text.partition(".")
+        operands = self.operands
+        names, memory, pointers = frozenset(), None, frozenset()
+        if text in REGISTER_NAMES:
+            names = frozenset([text])
+        elif text in _PAIRS:
+            names = frozenset(_PAIRS[text])
+        elif text == "cy":
+            names = frozenset(["cy"])
+        elif text == "psw":
+            names = _PSW
+        elif text == "{reg}":
+            names = frozenset([REGISTER_NAMES[operands["reg"]]])
+        elif text == "{regpair}":
+            pair = REGISTER_PAIR_NAMES[operands["regpair"]]
+            names = frozenset(_PAIRS[pair])
+        elif text == "rb{bank}":
+            names = frozenset(["rbs0", "rbs1"])
+        elif text.startswith("["):  # [de], [hl], [hl+b], [hl+c], [hl+byte]
+            pointers = frozenset(
+                name for pair in ("de", "hl") if pair in text
+                for name in _PAIRS[pair])
+            if text.endswith("+b]") or text.endswith("+c]"):
+                pointers |= frozenset([text[-2]])
+            if "{offset}" in text:
+                text = text.format(offset="0x%02x" % operands["offset"])
+            memory = (text, 1)
+        elif text in ("{saddr}", "{sfr}", "{addr16}"):
+            names, memory = _direct(operands[text[1:-1]], 1)
+        elif text in ("{saddrp}", "{sfrp}", "{addr16p}", "{addr5}"):
+            names, memory = _direct(operands[text[1:-1]], 2)
+        if dot and names == _PSW:
+            names = frozenset([FLAG_NAMES[operands["bit"]]]) - frozenset([None])
+        return names, memory, pointers
+
+
+def _names(text):
+    names = set()
+    for name in text.split():
+        if name == "psw":
+            names.update(_PSW)
+        else:
+            names.add(name)
+    return names
+
+
+def _direct(address, size):
+    """Return a tuple of (registers and flags, memory operand) for a byte
+    or word at an address given by the instruction"""
+    if _SP_ADDRESS <= address < _SP_ADDRESS + 2:
+        return frozenset(["sp"]), None
+    if address == _PSW_ADDRESS:
+        return _PSW, None
+    return frozenset(), (address, size)
+
+
+_FORMATS = {
+    "reg": lambda value: REGISTER_NAMES[value],
+    "regpair": lambda value: REGISTER_PAIR_NAMES[value],
+    "bit": lambda value: "%d" % value,
+    "bank": lambda value: "%d" % value,
+    "saddr": lambda value: "0x%04x" % value,
+    "saddrp": lambda value: "0x%04x" % value,
+    "sfr": lambda value: "0x%04x" % value,
+    "sfrp": lambda value: "0x%04x" % value,
+    "reltarget": lambda value: "0x%04x" % value,
+    "addr5": lambda value: "[0x%04x]" % value,
+    "addr11": lambda value: "!0x%04x" % value,
+    "addr16": lambda value: "!0x%04x" % value,
+    "addr16p": lambda value: "!0x%04x" % value,
+    "offset": lambda value: "0x%02x" % value,
+    "imm8": lambda value: "#0x%02x" % value,
+    "imm16": lambda value: "#0x%04x" % value,
+}
+
+
+def describe(code, address=0):
+    """Describe the instruction at the start of code, a sequence of bytes
+    located at address.  Raises ValueError if code does not start with a
+    whole instruction that the processor implements.
+
+    Returns a Description with the instruction's mnemonic, length, cycles,
+    operands, flow, and target (the address it branches to, or None if it
+    does not branch or the address is not given by the instruction).  Its
+    reads and writes are the names of the registers (in the current
+    register bank), SP, and flags that it reads and writes, and its
+    memory_reads and memory_writes are the memory operands as tuples of
+    (address, size).  The address of a memory operand is a number if it is
+    given by the instruction, or its addressing as a string otherwise:
+    "[de]", "[hl]", "[hl+b]", "[hl+c]", "[hl+0x12]", or "[sp]" for the
+    stack."""
+    data = bytes(code[:MAX_LENGTH])
+    prefix = None
+    position = 0
+    if data[:1] in (b"\x31", b"\x61", b"\x71"):
+        prefix = data[0]
+        position = 1
+    opcode = data[position] if len(data) > position else None
+    instruction = _BY_OPCODE.get((prefix, opcode))
+    if instruction is None or len(data) < instruction.length:
+        raise ValueError("Illegal or incomplete instruction: %s" %
+                         " ".join("%02x" % byte for byte in data))
+
+    operands = instruction.fields(opcode)
+    position += 1
+    for name in _PLACEHOLDER.findall(instruction.mnemonic):
+        if name in operands and name != "addr11":  # encoded in the opcode
+            continue
+        low = data[position]
+        if name in ("imm16", "addr16", "addr16p"):
+            operands[name] = low | (data[position + 1] << 8)
+            position += 2
+            continue
+        position += 1
+        if name in ("saddr", "saddrp"):
+            operands[name] = 0xFE00 + low + (0x100 if low < 0x20 else 0)
+        elif name in ("sfr", "sfrp"):
+            operands[name] = 0xFF00 + low
+        elif name == "addr11":
+            operands[name] += low
+        elif name == "reltarget":
+            displacement = low - 0x100 if low & 0x80 else low
+            operands[name] = (address + instruction.length +
+                              displacement) & 0xFFFF
+        else:  # imm8, offset
+            operands[name] = low
+    return Description(instruction, address, operands)
+
+
+_PLACEHOLDER = re.compile(r"\{(\w+)\}")
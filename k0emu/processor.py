@@ -1,24 +1,58 @@
+import copy
 import itertools
+import marshal
+import types
+from array import array
+from k0emu import isa
 from k0emu.bus import Bus
+from k0emu.devices import MemoryDevice, ProcessorStatusDevice
 
 class Processor(object):
     RESET_VECTOR_ADDRESS = 0x0000
     BRK_VECTOR_ADDRESS = 0x003E
+    REGISTER_FILE_ADDRESS = 0xFEE0
     REGISTERS_BASE_ADDRESS = 0xFEF8
     SP_ADDRESS = 0xFF1C
     PSW_ADDRESS = 0xFF1E
 
-    def __init__(self, bus=None):
+    # backward branches between looking for an idle loop
+    IDLE_LOOP_CHECK_INTERVAL = 8
+
+    # most NOPs in the body of a DBNZ delay loop
+    MAX_DELAY_LOOP_NOPS = 8
+
+    def __init__(self, bus=None, cycle_mode=None, tick_quantum=None):
+        """cycle_mode is CycleMode.EXACT (the default) to count the cycles of
+        every bus access, or CycleMode.LITE to charge each instruction a
+        fixed number of cycles for faster execution.  tick_quantum, if
+        given, is passed to bus.set_tick_quantum() to tick the devices
+        once every quantum of cycles instead of after every instruction."""
         if bus is None:
             bus = Bus(self)
+        if cycle_mode is None:
+            cycle_mode = CycleMode.EXACT
+        if tick_quantum is not None:
+            bus.set_tick_quantum(tick_quantum)
         self.bus = bus
-        self._init_opcodes()
+        self.cycle_mode = cycle_mode
+        self._decoded = [None] * Bus.ADDRESS_SPACE_SIZE
         self._total_cycles = 0
         self._inst_cycles = 0
         self._interrupt_delayed = False
         self._halt_rewind_pending = False
+        self._idle_countdown = self.IDLE_LOOP_CHECK_INTERVAL
+        self._idle_candidate = None  # (loop, state) at last backward branch
+        self._idle_trace = None  # (loop, state, cycles, deadline) if tracing
+        self._idle_trace_clean = False
+        self._resets = 0
+        self._call_hooks = {}  # address: (function, cycles)
+        self._sp = 0
+        self._psw = 0
         self.run_state = RunState.RUNNING
         self.pc = 0
+        bus.add_map_listener(self._map_changed)
+        self._map_changed()
+        self._bind_data_access()
 
     @property
     def total_cycles(self):
@@ -34,22 +68,165 @@ class Processor(object):
         self.pc = self.read_memory_word(self.RESET_VECTOR_ADDRESS)
         self._total_cycles = 0
         self._inst_cycles = 0
+        self._resets += 1
         self.run_state = RunState.RUNNING
 
+    def hook_call(self, address, function, cycles=0):
+        """Replace the subroutine at address with a Python function.  When
+        a CALL, CALLF, or CALLT branches to address, function(processor) is
+        called and the return address is popped, as if the subroutine had
+        run and returned.  The call is charged its own cycles plus the given
+        cycles, or the number of cycles returned by the function if it
+        returns one."""
+        self._call_hooks[address] = (function, cycles)
+
+    def unhook_call(self, address):
+        """Remove the hook for the subroutine at address"""
+        del self._call_hooks[address]
+
+    def clone(self):
+        """Return an independent copy of the machine: the processor, the bus,
+        and every device on it, in the same state.  The data of read-only
+        memory devices is shared, so loading new data into a ROM affects
+        every copy.  Objects attached to devices, such as I2C and SPI
+        targets, are copied too; functions, such as call hooks and
+        callbacks, are shared.  A BlockTranslator watching the code is
+        copied without its blocks, so make a new one to run the copy."""
+        return copy.deepcopy(self)
+
+    def __deepcopy__(self, memo):
+        clone = object.__new__(type(self))
+        memo[id(self)] = clone
+        state = dict(self.__dict__)
+        del state["_decoded"]
+        clone.__dict__.update(copy.deepcopy(state, memo))
+        # the decoded instructions are immutable and are still valid,
+        # since the copied memory devices watch the same code
+        clone._decoded = list(self._decoded)
+        return clone
+
+    def snapshot(self):
+        """Return the state of the processor, the bus, and every device on
+        the bus as a bytes object that can be passed to restore().
+        Configuration, such as the cycle mode, hooks, and the targets of
+        the I2C and SPI controllers, is not included."""
+        state = (self.pc, self._sp, self._psw, self._total_cycles,
+                 self._inst_cycles, self._interrupt_delayed,
+                 self._halt_rewind_pending, self.run_state)
+        return marshal.dumps((_SNAPSHOT_FORMAT, state, self.bus.save_state()))
+
+    def restore(self, snapshot):
+        """Return the machine to the state of a snapshot().  The snapshot
+        must be of a machine with the same devices, or ValueError is raised
+        before anything is changed.  Memory is updated in place, and
+        decoded instructions are discarded only where the code has
+        changed."""
+        try:
+            snapshot_format, state, bus_state = marshal.loads(snapshot)
+        except (EOFError, TypeError, ValueError):
+            raise ValueError("Not a snapshot")
+        if snapshot_format != _SNAPSHOT_FORMAT:
+            raise ValueError("Unsupported snapshot format %r" % snapshot_format)
+        try:
+            (pc, sp, psw, total_cycles, inst_cycles, interrupt_delayed,
+             halt_rewind_pending, run_state) = state
+        except (TypeError, ValueError):
+            raise ValueError("Not a snapshot")
+        self.bus.load_state(bus_state)
+        self.pc = pc
+        self._total_cycles = total_cycles
+        self._inst_cycles = inst_cycles
+        self._interrupt_delayed = interrupt_delayed
+        self._halt_rewind_pending = halt_rewind_pending
+        self.run_state = run_state
+        self.write_sp(sp)
+        self.write_psw(psw)
+        self._update_bank()
+
+        # forget any idle loop found before the restore
+        if self._idle_trace is not None:
+            self._stop_idle_trace()
+        self._idle_candidate = None
+        self._idle_countdown = self.IDLE_LOOP_CHECK_INTERVAL
+
+    def run(self, max_cycles, until_pc=None):
+        """Execute instructions until at least max_cycles have elapsed, or
+        until PC reaches until_pc (an address or a collection of addresses)
+        after an instruction.  Has the same result as calling step()
+        repeatedly.  Returns a tuple of (StopReason, cycles executed)."""
+        if until_pc is None:
+            breakpoints = ()
+        elif isinstance(until_pc, int):
+            breakpoints = (until_pc,)
+        else:
+            breakpoints = frozenset(until_pc)
+
+        decoded_by_pc = self._decoded
+        decode = self._decode
+        bus = self.bus
+        tick = bus.tick
+        complete_instruction = self._complete_instruction
+        running = RunState.RUNNING
+        halted = RunState.HALTED
+        cycles = 0
+        while True:
+            self.run_state = running
+            pc = self.pc
+            decoded = decoded_by_pc[pc]
+            if decoded is None:
+                decoded = decode(pc)
+            handler, opcode, fetched, cycles_charged = decoded
+            self.pc = (pc + fetched) & 0xFFFF
+            self._inst_cycles = cycles_charged
+            handler(self, opcode)
+            inst_cycles = self._inst_cycles
+            self._total_cycles += inst_cycles
+            tick(inst_cycles)
+            complete_instruction()
+
+            cycles += inst_cycles
+            if self.pc in breakpoints:
+                return StopReason.UNTIL_PC, cycles
+            if cycles >= max_cycles:
+                return StopReason.MAX_CYCLES, cycles
+            if self.run_state == halted:
+                cycles += self._skip_halt(bus.cycles + max_cycles - cycles)
+            elif self.pc <= pc:  # backward branch
+                cycles += self._skip_loop(
+                    pc, bus.cycles + max_cycles - cycles, breakpoints)
+
     def step(self):
         # running while executing any instruction
         self.run_state = RunState.RUNNING
 
-        # fetch and execute the instruction
-        self._inst_cycles = 0
-        opcode = self._consume_byte()
-        handler = self._opcodes_unprefixed[opcode]
-        handler(opcode)
+        # fetch and execute the instruction.  the opcode bytes (and prefix,
+        # if any) are already accounted for by the decoded instruction;
+        # the handler consumes any operand bytes itself.
+        pc = self.pc
+        decoded = self._decoded[pc]
+        if decoded is None:
+            decoded = self._decode(pc)
+        handler, opcode, fetched, cycles_charged = decoded
+        self.pc = (pc + fetched) & 0xFFFF
+        self._inst_cycles = cycles_charged
+        handler(self, opcode)
         self._total_cycles += self._inst_cycles
 
         # clock peripherals by number of cycles instruction consumed
         self.bus.tick(self._inst_cycles)
 
+        self._complete_instruction()
+
+        # delay loops are only fast-forwarded by run(), since a step of
+        # one would retire many iterations of the loop's instructions
+        if self.run_state == RunState.HALTED:
+            self._skip_halt(Bus.NEVER)
+        elif self.pc <= pc:  # backward branch
+            self._skip_idle_loop(pc, Bus.NEVER)
+
+    def _complete_instruction(self):
+        """Finish an instruction after it has executed and the bus has been
+        ticked: handle HALT, then dispatch an interrupt if one is pending."""
         # HALT: by this point PC has advanced past the HALT instruction.  If
         # no interrupt is pending, rewind PC by 2 (the length of HALT) so HALT
         # re-executes on the next step.  If an interrupt is pending, PC is
@@ -71,7 +248,193 @@ class Processor(object):
             self._interrupt_delayed = False
             return
 
-        psw = self.read_psw()
+        self._service_interrupt()
+
+    def _skip_halt(self, limit):
+        """Fast-forward through the HALT re-executions that would end before
+        the next device event or before the bus reaches the limit cycle.
+        Nothing can wake the processor during them, so they only advance
+        the cycle counts, and the devices are ticked once for all of them.
+        Returns the number of cycles skipped."""
+        bus = self.bus
+        limit = min(limit, bus.next_deadline)
+        if limit == Bus.NEVER:
+            return 0
+        inst_cycles = self._inst_cycles  # cycles of the HALT just executed
+        count = (limit - bus.cycles - 1) // inst_cycles
+        if count <= 0:
+            return 0
+        cycles = count * inst_cycles
+        self._total_cycles += cycles
+        bus.tick(cycles)
+        return cycles
+
+    def _skip_loop(self, branch_pc, limit, breakpoints=()):
+        """Fast-forward the loop that was branched back to by the instruction
+        at branch_pc, if it is a delay loop or an idle loop.  Returns the
+        number of cycles skipped."""
+        decoded = self._decoded[branch_pc]
+        if decoded is not None:
+            handler, opcode, fetched, cycles_charged = decoded
+            if (opcode in (0x04, 0x8a, 0x8b) and
+                    handler is self._opcodes_unprefixed[opcode]):  # dbnz
+                return self._skip_delay_loop(branch_pc, limit, breakpoints)
+        return self._skip_idle_loop(branch_pc, limit, breakpoints)
+
+    def _skip_delay_loop(self, branch_pc, limit, breakpoints=()):
+        """Fast-forward a delay loop: a DBNZ at branch_pc that branches back
+        to itself or to a few NOPs before it.  Called after the DBNZ has
+        branched, so the interrupt check after it has already found nothing
+        to dispatch, and nothing can change that until the next device
+        event.  The counter is decremented by the whole iterations that end
+        before the next event or before the bus reaches the limit cycle,
+        leaving at least the last iteration to execute, and the devices are
+        ticked once for all of them.  Returns the number of cycles skipped."""
+        bus = self.bus
+        head = self.pc
+        if branch_pc - head > self.MAX_DELAY_LOOP_NOPS:
+            return 0
+        for address in range(head, branch_pc):
+            if bus.read(address) != 0x00:  # nop
+                return 0
+        for address in breakpoints:
+            if head <= address <= branch_pc:
+                return 0
+
+        opcode = bus.read(branch_pc)
+        if opcode == 0x04:  # dbnz saddr,$rel
+            length = 3
+            address = _saddr(bus.read((branch_pc + 1) & 0xFFFF))
+            if address >= 0xFF00 or bus.memory_at(address, 1) is None:
+                return 0  # an sfr, which may be a device
+            counter = bus.read(address)
+        else:  # dbnz c,$rel or dbnz b,$rel
+            length = 2
+            reg = Registers.C if opcode == 0x8a else Registers.B
+            counter = self.read_gp_reg(reg)
+        displacement = bus.read((branch_pc + length - 1) & 0xFFFF)
+        if _resolve_rel(branch_pc + length, displacement) != head:
+            return 0  # an interrupt was dispatched
+
+        # a nop is 2 cycles
+        iteration_cycles = self._inst_cycles + (branch_pc - head) * 2
+        limit = min(limit, bus.next_deadline)
+        count = counter - 1
+        if limit != Bus.NEVER:
+            count = min(count, (limit - bus.cycles - 1) // iteration_cycles)
+        if count <= 0:
+            return 0
+        if opcode == 0x04:
+            bus.write(address, counter - count)
+        else:
+            self.write_gp_reg(reg, counter - count)
+        cycles = count * iteration_cycles
+        self._total_cycles += cycles
+        bus.tick(cycles)
+        return cycles
+
+    def _skip_idle_loop(self, branch_pc, limit, breakpoints=()):
+        """Fast-forward a loop that polls for a device event.  Called after
+        a backward branch from branch_pc to PC.
+
+        Every IDLE_LOOP_CHECK_INTERVAL backward branches, the registers, SP,
+        and PSW are recorded.  If the loop arrives back at PC in the same
+        state, its next iteration is traced.  If that iteration writes no
+        memory, reads no volatile device, sees no device event, and ends in
+        the same state again, every iteration after it would do the same
+        until the next device event.  The whole iterations that end before
+        the next event or before the bus reaches the limit cycle are then
+        skipped, and the devices are ticked once for all of them.  Returns
+        the number of cycles skipped."""
+        candidate = self._idle_candidate
+        if candidate is None:
+            self._idle_countdown -= 1
+            if self._idle_countdown:
+                return 0
+            self._idle_countdown = self.IDLE_LOOP_CHECK_INTERVAL
+
+        if isinstance(self._regs, _BusRegisterFile):
+            return 0
+        base = self._regs_offset
+        loop = (self.pc, branch_pc)
+        state = (bytes(self._regs[base:base + 32]), self._sp, self._psw,
+                 self.bus.pending_interrupt)
+
+        trace = self._idle_trace
+        if trace is None:
+            if candidate is None:
+                self._idle_candidate = (loop, state)
+            elif candidate == (loop, state):
+                self._start_idle_trace(loop, state)
+            else:
+                self._idle_candidate = None
+            return 0
+
+        self._stop_idle_trace()
+        self._idle_candidate = None
+        traced_loop, traced_state, start_cycles, deadline = trace
+        bus = self.bus
+        if not (self._idle_trace_clean and loop == traced_loop and
+                state == traced_state and bus.cycles < deadline and
+                bus.next_deadline == deadline):
+            return 0
+        for address in breakpoints:
+            if loop[0] <= address <= branch_pc:
+                return 0
+
+        # the loop is idle until the next event, so the next iteration
+        # can be traced without first looking for it again
+        self._idle_candidate = (loop, state)
+        iteration_cycles = bus.cycles - start_cycles
+        limit = min(limit, bus.next_deadline)
+        if limit == Bus.NEVER:
+            return 0
+        count = (limit - bus.cycles - 1) // iteration_cycles
+        if count <= 0:
+            return 0
+        cycles = count * iteration_cycles
+        self._total_cycles += cycles
+        bus.tick(cycles)
+        return cycles
+
+    def _start_idle_trace(self, loop, state):
+        """Trace the memory accesses of one loop iteration by shadowing
+        the methods that access data memory"""
+        bus = self.bus
+        self._idle_trace = (loop, state, bus.cycles, bus.next_deadline)
+        self._idle_trace_clean = True
+        self._bus_read = self._traced_bus_read
+        self._bus_write = self._traced_bus_write
+        self._push = self._traced_push
+
+    def _stop_idle_trace(self):
+        self._idle_trace = None
+        del self._bus_read
+        del self._bus_write
+        del self._push
+        self._bind_data_access()
+
+    def _traced_bus_read(self, address):
+        if self.bus.is_volatile(address):
+            self._idle_trace_clean = False
+        if self.cycle_mode == CycleMode.LITE:
+            return self.bus.read(address)
+        return type(self)._bus_read(self, address)
+
+    def _traced_bus_write(self, address, value):
+        self._idle_trace_clean = False
+        if self.cycle_mode == CycleMode.LITE:
+            self.bus.write(address, value)
+        else:
+            type(self)._bus_write(self, address, value)
+
+    def _traced_push(self, value):
+        self._idle_trace_clean = False
+        type(self)._push(self, value)
+
+    def _service_interrupt(self):
+        """Dispatch the pending interrupt if the PSW allows it"""
+        psw = self._psw
 
         if not (psw & Flags.IE):
             return  # interrupts must be enabled
@@ -97,6 +460,59 @@ class Processor(object):
         self._push_word(self.pc)
         self.pc = self.read_memory_word(pending.vector_address)
 
+    def _decode(self, pc):
+        """Decode the instruction at pc into a (handler, opcode, fetched,
+        cycles) tuple, where handler is called as handler(processor, opcode),
+        fetched is the number of opcode bytes (1, or 2 for prefixed
+        instructions) that were read to find the handler, and cycles are
+        the cycles charged before the handler runs: one for each opcode
+        byte, and in lite mode, one for each data operand byte.
+
+        If all opcode bytes come from memory devices below the register
+        file, the result is cached by PC and the bytes are watched so that
+        the cache entry is discarded when the code is modified.  The
+        register file is written directly, bypassing watches, so code
+        running from it is never cached."""
+        bus = self.bus
+        opcode = bus.read(pc)
+        handler = self._opcodes_unprefixed[opcode]
+        addresses = [pc]
+        prefix = None
+        prefixes = self._opcodes_by_prefix
+        if opcode in prefixes:
+            address = (pc + 1) & 0xFFFF
+            table = prefixes[opcode]
+            prefix = opcode
+            opcode = bus.read(address)
+            handler = table[opcode]
+            addresses.append(address)
+        cycles = len(addresses)
+        if self.cycle_mode == CycleMode.LITE:
+            cycles += _DATA_ACCESSES.get((prefix, opcode), 0)
+        decoded = (handler, opcode, len(addresses), cycles)
+
+        if max(addresses) >= self.REGISTER_FILE_ADDRESS:
+            return decoded
+        locations = [bus.device_at(address) for address in addresses]
+        for device, register in locations:
+            if not isinstance(device, MemoryDevice):
+                return decoded  # e.g. code in an SFR; never cached
+        for device, register in locations:
+            device.add_watcher(self._code_modified)
+            device.watch(register)
+        self._decoded[pc] = decoded
+        return decoded
+
+    def _code_modified(self, device, start, end):
+        """Watcher callback: discard decoded instructions whose opcode
+        bytes were modified.  A modified byte may be the first byte of
+        an instruction or the second byte of a prefixed one."""
+        decoded = self._decoded
+        for register in range(start, end):
+            address = self.bus.address_of(device, register)
+            decoded[address] = None
+            decoded[(address - 1) & 0xFFFF] = None
+
     def _check_interrupt_hold(self, address):
         """Set interrupt hold if the address is PSW or an interrupt
         control register (IF, MK, PR).  The manual requires that no
@@ -123,395 +539,48 @@ class Processor(object):
             self._inst_cycles += 1
         self.bus.write(address, value)
 
-    def _init_opcodes(self):
-        self._init_opcodes_unprefixed()
-        self._init_opcodes_prefix_0x31()
-        self._init_opcodes_prefix_0x61()
-        self._init_opcodes_prefix_0x71()
-
-    def _init_opcodes_unprefixed(self):
-        D = {
-            0x00: self._opcode_0x00, # nop
-            0x01: self._opcode_0x01, # not1 cy
-            0x02: self._opcode_0x02, # movw ax,!0abceh             ;02 ce ab       addr16p
-            0x03: self._opcode_0x03, # movw !0abceh,ax             ;03 ce ab       addr16p
-            0x04: self._opcode_0x04, # dbnz 0fe20h,$label0         ;04 20 fd       saddr
-            0x05: self._opcode_0x05, # xch a,[de]                  ;05
-            0x07: self._opcode_0x07, # xch a,[hl]                  ;07
-            0x08: self._opcode_0x08, # add a,!0abcdh               ;08 cd ab
-            0x09: self._opcode_0x09, # add a,[hl+0abh]             ;09 ab
-            0x0d: self._opcode_0x0d, # add a,#0abh                 ;0d ab
-            0x0e: self._opcode_0x0e, # add a,0fe20h                ;0e 20          saddr
-            0x0f: self._opcode_0x0f, # add a,[hl]                  ;0f
-            0x11: self._opcode_0x11, # mov 0fe20h,#0abh            ;11 20 ab       saddr
-            0x13: self._opcode_0x13, # mov 0fffeh, #0abh           ;13 fe ab       sfr
-            0x18: self._opcode_0x18, # sub a,!0abcdh               ;18 cd ab
-            0x19: self._opcode_0x19, # sub a,[hl+0abh]             ;19 ab
-            0x1d: self._opcode_0x1d, # sub a,#0abh                 ;1d ab
-            0x1e: self._opcode_0x1e, # sub a,0fe20h                ;1e 20          saddr
-            0x1f: self._opcode_0x1f, # sub a,[hl]                  ;1f
-            0x20: self._opcode_0x20, # set1 cy
-            0x21: self._opcode_0x21, # clr1 cy
-            0x22: self._opcode_0x22, # push psw                    ;22
-            0x23: self._opcode_0x23, # pop psw                     ;23
-            0x24: self._opcode_0x24, # ror a,1                     ;24
-            0x25: self._opcode_0x25, # rorc a,1                    ;25
-            0x26: self._opcode_0x26, # rol a,1                     ;26
-            0x27: self._opcode_0x27, # rolc a,1                    ;27
-            0x28: self._opcode_0x28, # addc a,!0abcdh              ;28 cd ab
-            0x29: self._opcode_0x29, # addc a,[hl+0abh]            ;29 ab
-            0x2d: self._opcode_0x2d, # addc a,#0abh                ;2d ab
-            0x2e: self._opcode_0x2e, # addc a,0fe20h               ;2e 20          saddr
-            0x2f: self._opcode_0x2f, # addc a,[hl]                 ;2f
-            0x31: self._opcode_0x31,
-            0x38: self._opcode_0x38, # subc a,!0abcdh              ;38 cd ab
-            0x39: self._opcode_0x39, # subc a,[hl+0abh]            ;39 ab
-            0x3d: self._opcode_0x3d, # subc a,#0abh                ;3d ab
-            0x3e: self._opcode_0x3e, # subc a,0fe20h               ;3e 20          saddr
-            0x3f: self._opcode_0x3f, # subc a,[hl]                 ;3f
-            0x48: self._opcode_0x48, # cmp a,!0abcdh               ;48 cd ab
-            0x49: self._opcode_0x49, # cmp a,[hl+0abh]             ;49 ab
-            0x4d: self._opcode_0x4d, # cmp a,#0abh                 ;4d ab
-            0x4e: self._opcode_0x4e, # cmp a,0fe20h                ;4e 20          saddr
-            0x4f: self._opcode_0x4f, # cmp a,[hl]                  ;4f
-            0x58: self._opcode_0x58, # and a,!0abcdh               ;58 cd ab
-            0x59: self._opcode_0x59, # and a,[hl+0abh]             ;59 ab
-            0x5d: self._opcode_0x5d, # and a,#0abh                 ;5d ab
-            0x5e: self._opcode_0x5e, # and a,0fe20h                ;5e 20          saddr
-            0x5f: self._opcode_0x5f, # and a,[hl]                  ;5f
-            0x61: self._opcode_0x61,
-            0x68: self._opcode_0x68, # or a,!0abcdh                ;68 cd ab
-            0x69: self._opcode_0x69, # or a,[hl+0abh]              ;69 ab
-            0x6d: self._opcode_0x6d, # or a,#0abh                  ;6d ab
-            0x6e: self._opcode_0x6e, # or a,0fe20h                 ;6e 20          saddr
-            0x6f: self._opcode_0x6f, # or a,[hl]                   ;6f
-            0x71: self._opcode_0x71,
-            0x78: self._opcode_0x78, # xor a,!0abcdh               ;78 cd ab
-            0x79: self._opcode_0x79, # xor a,[hl+0abh]             ;79 ab
-            0x7d: self._opcode_0x7d, # xor a,#0abh                 ;7d ab
-            0x7e: self._opcode_0x7e, # xor a,0fe20h                ;7e 20          saddr
-            0x7f: self._opcode_0x7f, # xor a,[hl]                  ;7f
-            0x81: self._opcode_0x81, # inc 0fe20h                  ;81 20          saddr
-            0x83: self._opcode_0x83, # xch a,0fe20h                ;83 20          saddr
-            0x85: self._opcode_0x85, # mov a,[de]                  ;85
-            0x87: self._opcode_0x87, # mov a,[hl]                  ;87
-            0x88: self._opcode_0x88, # add 0fe20h,#0abh            ;88 20 ab       saddr
-            0x89: self._opcode_0x89, # movw ax,0fe20h              ;89 20          saddrp
-            0x8a: self._opcode_0x8a, # dbnz c,$label1              ;8a fe
-            0x8b: self._opcode_0x8b, # dbnz c,$label1              ;8a fe
-            0x8d: self._opcode_0x8d, # bc $label3                  ;8d fe
-            0x8e: self._opcode_0x8e, # mov a,!addr16               ;8e
-            0x8f: self._opcode_0x8f, # reti                        ;8f
-            0x91: self._opcode_0x91, # dec 0fe20h                  ;91 20          saddr
-            0x93: self._opcode_0x93, # xch a,0fffeh                ;93 fe          sfr
-            0x95: self._opcode_0x95, # mov [de],a                  ;95
-            0x97: self._opcode_0x97, # mov [hl],a                  ;97
-            0x98: self._opcode_0x98, # sub 0fe20h,#0abh            ;98 20 ab       saddr
-            0x99: self._opcode_0x99, # movw 0fe20h,ax              ;99 20          saddrp
-            0x9a: self._opcode_0x9a, # call !0abcdh                ;9a cd ab
-            0x9b: self._opcode_0x9b, # br !0abcdh                  ;9b cd ab
-            0x9d: self._opcode_0x9d, # bnc $label3                 ;8d fe
-            0x9e: self._opcode_0x9e, # mov !addr16,a               ;9e cd ab
-            0x9f: self._opcode_0x9f, # retb                        ;9f
-            0xa8: self._opcode_0xa8, # addc 0fe20h,#0abh           ;a8 20 ab       saddr
-            0xa9: self._opcode_0xa9, # movw ax,0fffeh              ;a9 fe          sfrp
-            0xaa: self._opcode_0xaa, # mov a,[hl+c]                ;aa
-            0xab: self._opcode_0xab, # mov a,[hl+b]                ;ab
-            0xad: self._opcode_0xad, # bz $label5                  ;ad fe
-            0xae: self._opcode_0xae, # mov a,[hl+0abh]             ;ae ab
-            0xaf: self._opcode_0xaf, # ret                         ;af
-            0xb8: self._opcode_0xb8, # subc 0fe20h,#0abh           ;b8 20 ab       saddr
-            0xb9: self._opcode_0xb9, # movw 0fffeh,ax              ;b9 fe          sfrp
-            0xba: self._opcode_0xba, # mov [hl+c],a                ;ba
-            0xbb: self._opcode_0xbb, # mov [hl+b],a                ;bb
-            0xbd: self._opcode_0xbd, # bnz $label5                 ;bd fe
-            0xbe: self._opcode_0xbe, # mov [hl+0abh],a             ;be ab
-            0xbf: self._opcode_0xbf, # brk                         ;bf
-            0xc8: self._opcode_0xc8, # cmp 0fe20h,#0abh            ;c8 20 ab       saddr
-            0xca: self._opcode_0xca, # addw ax,#0abcdh             ;ca cd ab
-            0xce: self._opcode_0xce, # xch a,!abcd                 ;ce cd ab
-            0xd8: self._opcode_0xd8, # and 0fe20h,#0abh            ;d8 20 ab       saddr
-            0xda: self._opcode_0xda, # subw ax,#0abcdh             ;da cd ab
-            0xde: self._opcode_0xde, # xch a,[hl+0abh]             ;de ab
-            0xe8: self._opcode_0xe8, # or 0fe20h,#0abh             ;e8 20 ab
-            0xea: self._opcode_0xea, # cmpw ax,#0abcdh             ;ea cd ab
-            0xee: self._opcode_0xee, # movw sp,#0abcdh             ;ee 1c cd ab
-            0xf0: self._opcode_0xf0, # mov a,0fe20h                ;F0 20          saddr
-            0xf2: self._opcode_0xf2, # mov 0fe20h,a                ;f2 20          saddr
-            0xf4: self._opcode_0xf4, # mov a,0fffeh                ;f4 fe          sfr
-            0xf6: self._opcode_0xf6, # mov 0fffeh,a                ;f6 fe          sfr
-            0xf8: self._opcode_0xf8, # xor 0fe20h,#0abh            ;f8 20 ab       saddr
-            0xfa: self._opcode_0xfa, # br $label7                  ;fa fe
-            0xfe: self._opcode_0xfe, # movw 0fffeh,#0abcdh         ;fe fe cd ab    sfrp
-        }
-
-        # xch a,REG                    ;32...37 except 31
-        for opcode in (0x30, 0x32, 0x33, 0x34, 0x35, 0x36, 0x37):
-            D[opcode] = self._opcode_0x30_to_0x37_except_0x31
-        # mov a,x ... mov a,h           ;60..67 except 61
-        for opcode in (0x60, 0x62, 0x63, 0x64, 0x65, 0x66, 0x67):
-            D[opcode] = self._opcode_0x60_to_0x67_except_0x61
-        # inc x ;40 .. inc h ;47
-        for opcode in (0x40, 0x41, 0x42, 0x43, 0x44, 0x45, 0x46, 0x47):
-            D[opcode] = self._opcode_0x40_to_0x47_inc
-        # dec x ;50 .. dec h ;57
-        for opcode in (0x50, 0x51, 0x52, 0x53, 0x54, 0x55, 0x56, 0x57):
-            D[opcode] = self._opcode_0x50_to_0x57_dec
-        # mov x,a ... mov h,a           ;70..77 except 71
-        for opcode in (0x70, 0x72, 0x73, 0x74, 0x75, 0x76, 0x77):
-            D[opcode] = self._opcode_0x70_to_0x77_except_0x71
-        for opcode in (0x0c, 0x1c, 0x2c, 0x3c, 0x4c, 0x5c, 0x6c, 0x7c):
-            D[opcode] = self._opcode_0x0c_to_0x7c_callf
-        # bt 0fe20h.bit,$label8         ;8c 20 fd       saddr
-        for opcode in (0x8c, 0x9c, 0xac, 0xbc, 0xcc, 0xdc, 0xec, 0xfc):
-            D[opcode] = self._opcode_0x8c_to_0xfc_bt
-        # movw ax,#0abcdh             ;10 cd ab
-        for opcode in (0x10, 0x12, 0x14, 0x16):
-            D[opcode] = self._opcode_0x10_to_0x16_movw
-        # xchw ax,bc                  ;e2
-        for opcode in (0xe2, 0xe4, 0xe6):
-            D[opcode] = self._opcode_0xe2_to_0xe6_xchw
-        # push ax                     ;b1
-        for opcode in (0xb1, 0xb3, 0xb5, 0xb7):
-            D[opcode] = self._opcode_0xb1_to_0xb7_push_rp
-        # pop ax                      ;b0
-        for opcode in (0xb0, 0xb2, 0xb4, 0xb6):
-            D[opcode] = self._opcode_0xb0_to_0xb6_pop_rp
-        # incw ax                     ;80
-        for opcode in (0x80, 0x82, 0x84, 0x86):
-            D[opcode] = self._opcode_0x80_to_0x86_incw
-        # decw ax                     ;90
-        for opcode in (0x90, 0x92, 0x94, 0x96):
-            D[opcode] = self._opcode_0x90_to_0x96_decw
-        # movw ax,bc..hl                  ;c2..c6
-        for opcode in (0xc2, 0xc4, 0xc6):
-            D[opcode] = self._opcode_0xc2_to_0xc6_movw
-        # movw bc..hl,ax                  ;d2..d6
-        for opcode in (0xd2, 0xd4, 0xd6):
-            D[opcode] = self._opcode_0xd2_to_0xd6_movw
-        # set1 0fe20h.0               ;0a 20          saddr
-        for opcode in (0x0a, 0x1a, 0x2a, 0x3a, 0x4a, 0x5a, 0x6a, 0x7a):
-            D[opcode] = self._opcode_0x0a_to_0x7a_set1
-        # clr1 0fe20h.0               ;0b 20          saddr
-        for opcode in (0x0b, 0x1b, 0x2b, 0x3b, 0x4b, 0x5b, 0x6b, 0x7b):
-            D[opcode] = self._opcode_0x0b_to_0x7b_clr
-        # mov r,#byte                 ;a0..a7 xx
-        for opcode in (0xa0, 0xa1, 0xa2, 0xa3, 0xa4, 0xa5, 0xa6, 0xa7):
-            D[opcode] = self._opcode_0xa0_to_0xa7
-        # callt [0040h] ... callt [007eh]
-        for opcode in range(0xc1, 0x100, 2):
-            D[opcode] = self._opcode_0xc1_to_0xff_callt
-        self._opcodes_unprefixed = self._opcode_handlers_dict_to_tuple(D)
-
-    def _init_opcodes_prefix_0x31(self):
-        D = {
-            0x0a: self._opcode_0x31_0x0a_add,   # add a,[hl+c]                ;31 0a
-            0x0b: self._opcode_0x31_0x0b_add,   # add a,[hl+b]                ;31 0b
-            0x1a: self._opcode_0x31_0x1a_sub,   # sub a,[hl+c]                ;31 1a
-            0x1b: self._opcode_0x31_0x1b_sub,   # sub a,[hl+b]                ;31 1b
-            0x2a: self._opcode_0x31_0x2a_addc,  # addc a,[hl+c]               ;31 2a
-            0x2b: self._opcode_0x31_0x2b_addc,  # addc a,[hl+b]               ;31 2b
-            0x3a: self._opcode_0x31_0x3a_subc,  # subc a,[hl+c]               ;31 3a
-            0x3b: self._opcode_0x31_0x3b_subc,  # subc a,[hl+b]               ;31 3b
-            0x4a: self._opcode_0x31_0x4a_cmp,   # cmp a,[hl+c]                ;31 4a
-            0x4b: self._opcode_0x31_0x4b_cmp,   # cmp a,[hl+b]                ;31 4b
-            0x5a: self._opcode_0x31_0x5a_and,   # and a,[hl+c]                ;31 5a
-            0x5b: self._opcode_0x31_0x5b_and,   # and a,[hl+b]                ;31 5b
-            0x6a: self._opcode_0x31_0x6a_or,    # or a,[hl+c]                 ;31 6a
-            0x6b: self._opcode_0x31_0x6b_or,    # or a,[hl+c]                 ;31 6b
-            0x7a: self._opcode_0x31_0x7a_xor,   # xor a,[hl+c]                ;31 7a
-            0x7b: self._opcode_0x31_0x7b_xor,   # xor a,[hl+b]                ;31 7b
-            0x80: self._opcode_0x31_0x80_rol4,  # rol4 [hl]                   ;31 80
-            0x82: self._opcode_0x31_0x82_divuw, # divuw c                     ;31 82
-            0x88: self._opcode_0x31_0x88_mulu,  # mulu x                      ;31 88
-            0x8a: self._opcode_0x31_0x8a_xch,   # xch a,[hl+c]                ;31 8a
-            0x8b: self._opcode_0x31_0x8b_xch,   # xch a,[hl+b]                ;31 8b
-            0x90: self._opcode_0x31_0x90_ror4,  # ror4 [hl]                   ;31 90
-            0x98: self._opcode_0x31_0x98_br,    # br ax                       ;31 98
-        }
-
-        # bt a.bit,$label32             ;31 0e fd
-        for opcode2 in (0x0e, 0x1e, 0x2e, 0x3e, 0x4e, 0x5e, 0x6e, 0x7e):
-            D[opcode2] = self._opcode_0x31_0x0e_to_0x7e_bt
-        # bf a.0,$label64             ;31 0f fd
-        for opcode2 in (0x0f, 0x1f, 0x2f, 0x3f, 0x4f, 0x5f, 0x6f, 0x7f):
-            D[opcode2] = self._opcode_0x31_0x0f_to_0x7f_bf
-        # bf [hl].0,$label80          ;31 87 fd
-        for opcode2 in (0x87, 0x97, 0xa7, 0xb7, 0xc7, 0xd7, 0xe7, 0xf7):
-            D[opcode2] = self._opcode_0x31_0x87_to_0xf7_bf
-        # bf 0fffeh.0,$label56        ;31 07 fe fc    sfr
-        for opcode2 in (0x07, 0x17, 0x27, 0x37, 0x47, 0x57, 0x67, 0x77):
-            D[opcode2] = self._opcode_0x31_0x07_to_0x77_bf
-        # bf 0fe20h.0,$label48        ;31 03 20 fc    saddr
-        for opcode2 in (0x03, 0x13, 0x23, 0x33, 0x43, 0x53, 0x63, 0x73):
-            D[opcode2] = self._opcode_0x31_0x03_to_0x73_bf
-        # btclr a.bit,$label104         ;31 0d fd
-        for opcode2 in (0x0d, 0x1d, 0x2d, 0x3d, 0x4d, 0x5d, 0x6d, 0x7d):
-            D[opcode2] = self._opcode_0x31_0x0d_to_0x7d_btclr
-        # bt 0fffeh.bit,$label24        ;31 06 fe fc    sfr
-        for opcode2 in (0x06, 0x16, 0x26, 0x36, 0x46, 0x56, 0x66, 0x76):
-            D[opcode2] = self._opcode_0x31_0x06_to_0x76_bt
-        # btclr 0fffeh.0,$label96     ;31 05 fe fc    sfr
-        for opcode2 in (0x05, 0x15, 0x25, 0x35, 0x45, 0x55, 0x65, 0x75):
-            D[opcode2] = self._opcode_0x31_0x05_to_0x75_btclr
-        # btclr [hl].0,$label120      ;31 85 fd
-        for opcode2 in (0x85, 0x95, 0xa5, 0xb5, 0xc5, 0xd5, 0xe5, 0xf5):
-            D[opcode2] = self._opcode_0x31_0x85_to_0xf5_btclr
-        # btclr 0fe20h.0,$label88     ;31 01 20 fc    saddr
-        for opcode2 in (0x01, 0x11, 0x21, 0x31, 0x41, 0x51, 0x61, 0x71):
-            D[opcode2] = self._opcode_0x31_0x01_to_0x71_btclr
-        # bt [hl].0,$label40          ;31 86 fd
-        for opcode2 in (0x86, 0x96, 0xa6, 0xb6, 0xc6, 0xd6, 0xe6, 0xf6):
-            D[opcode2] = self._opcode_0x31_0x86_to_0xf6_bt
-        self._opcodes_prefix_0x31 = self._opcode_handlers_dict_to_tuple(D)
-
-    def _init_opcodes_prefix_0x61(self):
-        D = {
-            0x80: self._opcode_0x61_0x80_adjba,     # adjba                       ;61 80
-            0x90: self._opcode_0x61_0x90_adjbs,     # adjbs                       ;61 90
-        }
-        # sel rbn
-        for opcode2 in (0xD0, 0xD8, 0xF0, 0xF8):
-            D[opcode2] = self._opcode_0x61_0xd0_to_0xf8_sel_rb
-        # or a,reg (except: or a,reg=a)
-        for opcode2 in (0x68, 0x6a, 0x6b, 0x6c, 0x6d, 0x6e, 0x6f):
-            D[opcode2] = self._opcode_0x61_0x68_to_0x6f_or
-        # or reg,a
-        for opcode2 in (0x60, 0x61, 0x62, 0x63, 0x64, 0x65, 0x66, 0x67):
-            D[opcode2] = self._opcode_0x61_0x61_to_0x67_or
-        # cmp reg,a                     ;61 40..47
-        for opcode2 in (0x40, 0x41, 0x42, 0x43, 0x44, 0x45, 0x46, 0x47):
-            D[opcode2] = self._opcode_0x61_0x40_to_0x47_cmp
-        # cmp a,reg (except cmp a, reg=a)
-        for opcode2 in (0x48, 0x4a, 0x4b, 0x4c, 0x4d, 0x4e, 0x4f):
-            D[opcode2] = self._opcode_0x61_48_to_4f_cmp
-        # and reg,a
-        for opcode2 in (0x50, 0x51, 0x52, 0x53, 0x54, 0x55, 0x56, 0x57):
-            D[opcode2] = self._opcode_0x61_0x50_to_0x57_and
-        # and a,reg (except: and a,reg=a)
-        for opcode2 in (0x58, 0x5a, 0x5b, 0x5c, 0x5d, 0x5e, 0x5f):
-            D[opcode2] = self._opcode_0x61_0x58_to_0x5f_and
-        # xor a,reg (except: xor a,reg=a)
-        for opcode2 in (0x78, 0x7a, 0x7b, 0x7c, 0x7d, 0x7e, 0x7f):
-            D[opcode2] = self._opcode_0x61_0x78_to_0x7f_xor
-        # xor reg,a
-        for opcode2 in (0x70, 0x71, 0x72, 0x73, 0x74, 0x75, 0x76, 0x77):
-            D[opcode2] = self._opcode_0x61_0x70_to_0x77_xor
-        # set1 a.bit
-        for opcode2 in (0x8a, 0x9a, 0xaa, 0xba, 0xca, 0xda, 0xea, 0xfa):
-            D[opcode2] = self._opcode_0x61_0x8a_to_0xfa_set1
-        # clr1 a.bit
-        for opcode2 in (0x8b, 0x9b, 0xab, 0xbb, 0xcb, 0xdb, 0xeb, 0xfb):
-            D[opcode2] = self._opcode_0x61_0x8b_to_0xfb_clr1
-        # mov1 cy,a.bit
-        for opcode2 in (0x8c, 0x9c, 0xac, 0xbc, 0xcc, 0xdc, 0xec, 0xfc):
-            D[opcode2] = self._opcode_0x61_0x8c_to_0xfc_mov1
-        # mov1 a.bit,cy                 ;61 89
-        for opcode2 in (0x89, 0x99, 0xa9, 0xb9, 0xc9, 0xd9, 0xe9, 0xf9):
-            D[opcode2] = self._opcode_0x61_0x89_to_0xf9_mov1
-        # and1 cy,a.0                 ;61 8d
-        for opcode2 in (0x8d, 0x9d, 0xad, 0xbd, 0xcd, 0xdd, 0xed, 0xfd):
-            D[opcode2] = self._opcode_0x61_0x8d_to_0xfd_and1
-        # or1 cy,a.0                  ;61 8e
-        for opcode2 in (0x8e, 0x9e, 0xae, 0xbe, 0xce, 0xde, 0xee, 0xfe):
-            D[opcode2] = self._opcode_0x61_0x8e_to_0xfe_or1
-        # xor1 cy,a.0                 ;61 8f
-        for opcode2 in (0x8f, 0x9f, 0xaf, 0xbf, 0xcf, 0xdf, 0xef, 0xff):
-            D[opcode2] = self._opcode_0x61_0x8f_to_0xff_xor1
-        # add a,x                     ;61 08
-        for opcode2 in (0x08, 0x0a, 0x0b, 0x0c, 0x0d, 0x0e, 0x0f):
-            D[opcode2] = self._opcode_0x61_0x08_to_0x0f_add
-        # addc a,x                    ;61 28
-        for opcode2 in (0x28, 0x2a, 0x2b, 0x2c, 0x2d, 0x2e, 0x2f):
-            D[opcode2] = self._opcode_0x61_0x28_to_0x2f_addc
-        # add x,a                     ;61 00
-        for opcode2 in (0x00, 0x01, 0x02, 0x03, 0x04, 0x05, 0x06, 0x07):
-            D[opcode2] = self._opcode_0x61_0x00_to_0x07_add
-        # addc x,a                    ;61 20
-        for opcode2 in (0x20, 0x21, 0x22, 0x23, 0x24, 0x25, 0x26, 0x27):
-            D[opcode2] = self._opcode_0x61_0x20_to_0x27_addc
-        # sub a,reg                   ;61 18..1f except 11
-        for opcode in (0x18, 0x1a, 0x1b, 0x1c, 0x1d, 0x1e, 0x1f):
-            D[opcode] = self._opcode_0x61_0x18_to_0x1f_except_0x11
-        # sub reg,a                   ;61 10..17
-        for opcode in (0x10, 0x11, 0x12, 0x13, 0x14, 0x15, 0x16, 0x17):
-            D[opcode] = self._opcode_0x61_0x10_to_0x17_sub
-        # subc a,reg (except: subc a,reg=a) ;61 38..3f
-        for opcode in (0x38, 0x3a, 0x3b, 0x3c, 0x3d, 0x3e, 0x3f):
-            D[opcode] = self._opcode_0x61_0x38_to_0x3f_subc
-        # subc reg,a                  ;61 30..37
-        for opcode in (0x30, 0x31, 0x32, 0x33, 0x34, 0x35, 0x36, 0x37):
-            D[opcode] = self._opcode_0x61_0x30_to_0x37_subc
-        self._opcodes_prefix_0x61 = self._opcode_handlers_dict_to_tuple(D)
-
-    def _init_opcodes_prefix_0x71(self):
-        D = {}
-
-        # set1 sfr.bit
-        for opcode2 in (0x0a, 0x1a, 0x2a, 0x3a, 0x4a, 0x5a, 0x6a, 0x7a):
-            D[opcode2] = self._opcode_0x71_0x0a_to_0x7a_set1
-        # set1 [hl].bit
-        for opcode2 in (0x82, 0x92, 0xa2, 0xb2, 0xc2, 0xd2, 0xe2, 0xf2):
-            D[opcode2] = self._opcode_0x71_0x82_to_0xf2_set1
-        # clr1 sfr.bit
-        for opcode2 in (0x0b, 0x1b, 0x2b, 0x3b, 0x4b, 0x5b, 0x6b, 0x7b):
-            D[opcode2] = self._opcode_0x71_0x0b_to_0x7b_clr1
-        # clr1 [hl].bit
-        for opcode2 in (0x83, 0x93, 0xa3, 0xb3, 0xc3, 0xd3, 0xe3, 0xf3):
-            D[opcode2] = self._opcode2_0x71_0x83_to_0xf3_clr1
-        # mov1 0fe20h.bit,cy            ;71 01 20       saddr
-        for opcode2 in (0x01, 0x11, 0x21, 0x31, 0x41, 0x51, 0x61, 0x71):
-            D[opcode2] = self._opcode_0x71_0x01_to_0x71_mov1
-        # mov1 cy,0fffeh.bit            ;71 0c fe       sfr
-        for opcode2 in (0x0c, 0x1c, 0x2c, 0x3c, 0x4c, 0x5c, 0x6c, 0x7c):
-            D[opcode2] = self._opcode_0x71_0x0c_to_0x7c_mov1
-        # mov1 0fffeh.bit,cy            ;71 09 fe       sfr
-        for opcode2 in (0x09, 0x19, 0x29, 0x39, 0x49, 0x59, 0x69, 0x79):
-            D[opcode2] = self._opcode_0x71_0x09_to_0x79_mov1
-        # mov1 cy,0fe20h.bit            ;71 04 20       saddr
-        for opcode2 in (0x04, 0x14, 0x24, 0x34, 0x44, 0x54, 0x64, 0x74):
-            D[opcode2] = self._opcode_0x71_0x04_to_0x74_mov1
-        # mov1 cy,[hl].bit              ;71 84
-        for opcode2 in (0x84, 0x94, 0xa4, 0xb4, 0xc4, 0xd4, 0xe4, 0xf4):
-            D[opcode2] = self._opcode_0x71_0x84_to_0xf4_mov1
-        # mov1 [hl].bit,cy              ;71 81
-        for opcode2 in (0x81, 0x91, 0xa1, 0xb1, 0xc1, 0xd1, 0xe1, 0xf1):
-            D[opcode2] = self._opcode_0x71_0x81_to_0xf1_mov1
-        # and1 cy,[hl].0              ;71 85
-        for opcode2 in (0x85, 0x95, 0xa5, 0xb5, 0xc5, 0xd5, 0xe5, 0xf5):
-            D[opcode2] = self._opcode_0x71_0x85_to_0xf5_and1
-        # and1 cy,0fffeh.0            ;71 0d fe       sfr
-        for opcode2 in (0x0d, 0x1d, 0x2d, 0x3d, 0x4d, 0x5d, 0x6d, 0x7d):
-            D[opcode2] = self._opcode_0x71_0x0d_to_0x7d_and1
-        # and1 cy,0fe20h.0            ;71 05 20       saddr
-        for opcode2 in (0x05, 0x15, 0x25, 0x35, 0x45, 0x55, 0x65, 0x75):
-            D[opcode2] = self._opcode_0x71_0x05_to_0x75_and1
-        # or1 cy,0fffeh.0             ;71 0e fe       sfr
-        for opcode2 in (0x0e, 0x1e, 0x2e, 0x3e, 0x4e, 0x5e, 0x6e, 0x7e):
-            D[opcode2] = self._opcode_0x71_0x0e_to_0x7e_or1
-        # or1 cy,[hl].0               ;71 86
-        for opcode2 in (0x86, 0x96, 0xa6, 0xb6, 0xc6, 0xd6, 0xe6, 0xf6):
-            D[opcode2] = self._opcode_0x71_0x86_to_0xf6_or1
-        # or1 cy,0fe20h.0             ;71 06 20       saddr
-        for opcode2 in (0x06, 0x16, 0x26, 0x36, 0x46, 0x56, 0x66, 0x76):
-            D[opcode2] = self._opcode_0x71_0x06_to_0x76_or1
-        # xor1 cy,[hl].0              ;71 87
-        for opcode2 in (0x87, 0x97, 0xa7, 0xb7, 0xc7, 0xd7, 0xe7, 0xf7):
-            D[opcode2] = self._opcode_0x71_0x87_to_0xf7_xor1
-        # xor1 cy,0fffeh.0            ;71 0f fe       sfr
-        for opcode2 in (0x0f, 0x1f, 0x2f, 0x3f, 0x4f, 0x5f, 0x6f, 0x7f):
-            D[opcode2] = self._opcode_0x71_0x0f_to_0x7f
-        # xor1 cy,0fe20h.0            ;71 07 20       saddr
-        for opcode2 in (0x07, 0x17, 0x27, 0x37, 0x47, 0x57, 0x67, 0x77):
-            D[opcode2] = self._opcode_0x71_0x07_to_0x77_xor1
-        # halt                        ;71 10
-        D[0x10] = self._opcode_0x71_0x10_halt
-        self._opcodes_prefix_0x71 = self._opcode_handlers_dict_to_tuple(D)
-
-    def _opcode_handlers_dict_to_tuple(self, handlers_by_opcode):
+    def _bind_data_access(self):
+        """In lite mode, read and write data operands directly on the bus.
+        Their cycles are charged when the instruction is decoded, without
+        the penalty for non-high-speed devices, so every instruction costs
+        its cycles in the instruction table (isa.Instruction.cycles)."""
+        if self.cycle_mode == CycleMode.LITE:
+            self._bus_read = self.bus.read
+            self._bus_write = self.bus.write
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._init_opcodes()  # a subclass may override handlers
+
+    # the opcode tables are built once per class from the instruction table
+    # and hold plain functions, so a handler is called with the processor:
+    # handler(self, opcode)
+    @classmethod
+    def _init_opcodes(cls):
+        handlers_by_prefix = {None: {0x31: cls._opcode_0x31,
+                                     0x61: cls._opcode_0x61,
+                                     0x71: cls._opcode_0x71},
+                              0x31: {}, 0x61: {}, 0x71: {}}
+        for instruction in isa.INSTRUCTIONS:
+            handlers = handlers_by_prefix[instruction.prefix]
+            function = getattr(cls, instruction.handler)
+            for opcode in instruction.opcodes:
+                fields = instruction.fields(opcode)
+                handlers[opcode] = _specialize(function, fields)
+        to_tuple = cls._opcode_handlers_dict_to_tuple
+        cls._opcodes_unprefixed = to_tuple(handlers_by_prefix[None])
+        cls._opcodes_prefix_0x31 = to_tuple(handlers_by_prefix[0x31])
+        cls._opcodes_prefix_0x61 = to_tuple(handlers_by_prefix[0x61])
+        cls._opcodes_prefix_0x71 = to_tuple(handlers_by_prefix[0x71])
+        cls._opcodes_by_prefix = {0x31: cls._opcodes_prefix_0x31,
+                                  0x61: cls._opcodes_prefix_0x61,
+                                  0x71: cls._opcodes_prefix_0x71}
+
+    @classmethod
+    def _opcode_handlers_dict_to_tuple(cls, handlers_by_opcode):
         handlers = []
         for opcode in range(256):
-            h = handlers_by_opcode.get(opcode, self._opcode_not_implemented)
+            h = handlers_by_opcode.get(opcode, cls._opcode_not_implemented)
             handlers.append(h)
         return tuple(handlers)
 
@@ -522,19 +591,19 @@ class Processor(object):
     def _opcode_0x31(self, opcode):
         opcode2 = self._consume_byte()
         handler = self._opcodes_prefix_0x31[opcode2]
-        handler(opcode2)
+        handler(self, opcode2)
 
     # prefix 0x61
     def _opcode_0x61(self, opcode):
         opcode2 = self._consume_byte()
         handler = self._opcodes_prefix_0x61[opcode2]
-        handler(opcode2)
+        handler(self, opcode2)
 
     # prefix 0x71
     def _opcode_0x71(self, opcode):
         opcode2 = self._consume_byte()
         handler = self._opcodes_prefix_0x71[opcode2]
-        handler(opcode2)
+        handler(self, opcode2)
 
     # nop
     def _opcode_0x00(self, opcode):
@@ -543,11 +612,11 @@ class Processor(object):
     # not1 cy
     def _opcode_0x01(self, opcode):
         bitweight = Flags.CY
-        carry = self.read_psw() & bitweight
+        carry = self._psw & bitweight
         if carry:
-            self.write_psw(self.read_psw() & ~bitweight)
+            self.write_psw(self._psw & ~bitweight)
         else:
-            self.write_psw(self.read_psw() | bitweight)
+            self.write_psw(self._psw | bitweight)
         self._inst_cycles += 1
 
     # xch a,[de]                  ;05
@@ -614,8 +683,7 @@ class Processor(object):
         self._inst_cycles += 2
 
     # movw regpair,#0abcdh             ;10..16 cd ab
-    def _opcode_0x10_to_0x16_movw(self, opcode):
-        regpair = _regpair(opcode)
+    def _opcode_0x10_to_0x16_movw(self, opcode, regpair):
         value = self._consume_word()
         self.write_gp_regpair(regpair, value)
         self._inst_cycles += 3
@@ -623,12 +691,11 @@ class Processor(object):
     # xchw ax,bc                  ;e2
     # xchw ax,de                  ;e4
     # xchw ax,hl                  ;e6
-    def _opcode_0xe2_to_0xe6_xchw(self, opcode):
+    def _opcode_0xe2_to_0xe6_xchw(self, opcode, regpair):
         ax_value = self.read_gp_regpair(RegisterPairs.AX)
-        other_regpair = _regpair(opcode)
-        other_value = self.read_gp_regpair(other_regpair)
+        other_value = self.read_gp_regpair(regpair)
         self.write_gp_regpair(RegisterPairs.AX, other_value)
-        self.write_gp_regpair(other_regpair, ax_value)
+        self.write_gp_regpair(regpair, ax_value)
         self._inst_cycles += 3
 
     # sub a,!0abcdh               ;18 cd ab
@@ -679,18 +746,18 @@ class Processor(object):
     # set1 cy
     def _opcode_0x20(self, opcode):
         bitweight = Flags.CY
-        self.write_psw(self.read_psw() | bitweight)
+        self.write_psw(self._psw | bitweight)
         self._inst_cycles += 1
 
     # clr1 cy
     def _opcode_0x21(self, opcode):
         bitweight = Flags.CY
-        self.write_psw(self.read_psw() & ~bitweight)
+        self.write_psw(self._psw & ~bitweight)
         self._inst_cycles += 1
 
     # push psw                    ;22
     def _opcode_0x22(self, opcode):
-        self._push(self.read_psw())
+        self._push(self._psw)
         self._interrupt_delayed = True
 
     # pop psw                     ;23
@@ -700,76 +767,34 @@ class Processor(object):
 
     # ror a,1                     ;24
     def _opcode_0x24(self, opcode):
-        value = self.read_gp_reg(Registers.A)
-        original_bit_0 = value & 1
-        rotated = value >> 1
-
-        psw = self.read_psw()
-
-        if original_bit_0:
-            rotated |= 0x80
-            psw |= Flags.CY
-        else:
-            psw &= ~Flags.CY
-        rotated &= 0xFF
-
-        self.write_psw(psw)
-        self.write_gp_reg(Registers.A, rotated)
+        entry = _ROR_TABLE[self.read_gp_reg(Registers.A)]
+        self.write_psw((self._psw & ~Flags.CY) | (entry >> 8))
+        self.write_gp_reg(Registers.A, entry & 0xFF)
         self._inst_cycles += 1
 
     # rorc a,1                    ;25
     def _opcode_0x25(self, opcode):
-        value = self.read_gp_reg(Registers.A)
-        original_bit_0 = value & 1
-        rotated = value >> 1
-
-        psw = self.read_psw()
-
-        if psw & Flags.CY:
-            rotated |= 0x80
-
-        if original_bit_0:
-            psw |= Flags.CY
-        else:
-            psw &= ~Flags.CY
-        rotated &= 0xFF
-
-        self.write_psw(psw)
-        self.write_gp_reg(Registers.A, rotated)
+        psw = self._psw
+        entry = _RORC_TABLE[((psw & Flags.CY) << 8) |
+                            self.read_gp_reg(Registers.A)]
+        self.write_psw((psw & ~Flags.CY) | (entry >> 8))
+        self.write_gp_reg(Registers.A, entry & 0xFF)
         self._inst_cycles += 1
 
     # rol a,1                     ;26
     def _opcode_0x26(self, opcode):
-        rotated = self.read_gp_reg(Registers.A) << 1
-        psw = self.read_psw()
-
-        if rotated & 0x100:
-            rotated |= 1
-            psw |= Flags.CY
-        else:
-            psw &= ~Flags.CY
-        rotated &= 0xFF
-
-        self.write_psw(psw)
-        self.write_gp_reg(Registers.A, rotated)
+        entry = _ROL_TABLE[self.read_gp_reg(Registers.A)]
+        self.write_psw((self._psw & ~Flags.CY) | (entry >> 8))
+        self.write_gp_reg(Registers.A, entry & 0xFF)
         self._inst_cycles += 1
 
     # rolc a,1                    ;27
     def _opcode_0x27(self, opcode):
-        rotated = self.read_gp_reg(Registers.A) << 1
-        psw = self.read_psw()
-
-        if psw & Flags.CY:
-             rotated |= 1
-
-        if rotated & 0x100:
-            psw |= Flags.CY
-        else:
-            psw &= ~Flags.CY
-        rotated &= 0xFF
-
-        self.write_psw(psw)
-        self.write_gp_reg(Registers.A, rotated)
+        psw = self._psw
+        entry = _ROLC_TABLE[((psw & Flags.CY) << 8) |
+                            self.read_gp_reg(Registers.A)]
+        self.write_psw((psw & ~Flags.CY) | (entry >> 8))
+        self.write_gp_reg(Registers.A, entry & 0xFF)
         self._inst_cycles += 1
 
     # addc a,!0abcdh              ;28 cd ab
@@ -863,12 +888,11 @@ class Processor(object):
         self._inst_cycles += 2
 
     # xch a,REG                    ;32...37 except 31
-    def _opcode_0x30_to_0x37_except_0x31(self, opcode):
-        other_reg = _reg(opcode)
+    def _opcode_0x30_to_0x37_except_0x31(self, opcode, reg):
         a_value = self.read_gp_reg(Registers.A)
-        other_value = self.read_gp_reg(other_reg)
+        other_value = self.read_gp_reg(reg)
         self.write_gp_reg(Registers.A, other_value)
-        self.write_gp_reg(other_reg, a_value)
+        self.write_gp_reg(reg, a_value)
         self._inst_cycles += 1
 
     # cmp 0fe20h,#0abh            ;c8 20 ab       saddr
@@ -931,8 +955,7 @@ class Processor(object):
     # incw ax                     ;80
     # ...
     # incw hl                     ;86
-    def _opcode_0x80_to_0x86_incw(self, opcode):
-        regpair = _regpair(opcode)
+    def _opcode_0x80_to_0x86_incw(self, opcode, regpair):
         value = self.read_gp_regpair(regpair)
         result = self._operation_incw(value)
         self.write_gp_regpair(regpair, result)
@@ -941,8 +964,7 @@ class Processor(object):
     # decw ax                     ;90
     # ...
     # decw hl                     ;96
-    def _opcode_0x90_to_0x96_decw(self, opcode):
-        regpair = _regpair(opcode)
+    def _opcode_0x90_to_0x96_decw(self, opcode, regpair):
         value = self.read_gp_regpair(regpair)
         result = self._operation_decw(value)
         self.write_gp_regpair(regpair, result)
@@ -1018,22 +1040,19 @@ class Processor(object):
         self._inst_cycles += 3
 
     # mov r,#byte                 ;a0..a7 xx
-    def _opcode_0xa0_to_0xa7(self, opcode):
-        reg = _reg(opcode)
+    def _opcode_0xa0_to_0xa7(self, opcode, reg):
         immbyte = self._consume_byte()
         self.write_gp_reg(reg, immbyte)
         self._inst_cycles += 2
 
     # mov a,x ... mov a,h           ;60..67 except 61
-    def _opcode_0x60_to_0x67_except_0x61(self, opcode):
-        reg = _reg(opcode)
+    def _opcode_0x60_to_0x67_except_0x61(self, opcode, reg):
         value = self.read_gp_reg(reg)
         self.write_gp_reg(Registers.A, value)
         self._inst_cycles += 1
 
     # mov x,a ... mov h,a           ;70..77 except 71
-    def _opcode_0x70_to_0x77_except_0x71(self, opcode):
-        reg = _reg(opcode)
+    def _opcode_0x70_to_0x77_except_0x71(self, opcode, reg):
         value = self.read_gp_reg(Registers.A)
         self.write_gp_reg(reg, value)
         self._inst_cycles += 1
@@ -1186,103 +1205,92 @@ class Processor(object):
         self._inst_cycles += 5
 
     # bt a.bit,$label32             ;31 0e fd
-    def _opcode_0x31_0x0e_to_0x7e_bt(self, opcode2):
-        bit = _bit(opcode2)
+    def _opcode_0x31_0x0e_to_0x7e_bt(self, opcode2, bitweight):
         displacement = self._consume_byte()
         value = self.read_gp_reg(Registers.A)
-        self._operation_bt(value, bit, displacement)
+        self._operation_bt(value, bitweight, displacement)
         self._inst_cycles += 5
 
     # bf a.0,$label64             ;31 0f fd
-    def _opcode_0x31_0x0f_to_0x7f_bf(self, opcode2):
-        bit = _bit(opcode2)
+    def _opcode_0x31_0x0f_to_0x7f_bf(self, opcode2, bitweight):
         displacement = self._consume_byte()
         value = self.read_gp_reg(Registers.A)
-        self._operation_bf(value, bit, displacement)
+        self._operation_bf(value, bitweight, displacement)
         self._inst_cycles += 5
 
     # bf [hl].0,$label80          ;31 87 fd
-    def _opcode_0x31_0x87_to_0xf7_bf(self, opcode2):
-        bit = _bit(opcode2)
+    def _opcode_0x31_0x87_to_0xf7_bf(self, opcode2, bitweight):
         displacement = self._consume_byte()
         address = self.read_gp_regpair(RegisterPairs.HL)
         value = self._bus_read(address)
-        self._operation_bf(value, bit, displacement)
+        self._operation_bf(value, bitweight, displacement)
         self._inst_cycles += 6
 
     # bf 0fffeh.0,$label56        ;31 07 fe fc    sfr
-    def _opcode_0x31_0x07_to_0x77_bf(self, opcode2):
-        bit = _bit(opcode2)
+    def _opcode_0x31_0x07_to_0x77_bf(self, opcode2, bitweight):
         address = self._consume_sfr()
         displacement = self._consume_byte()
         value = self._bus_read(address)
-        self._operation_bf(value, bit, displacement)
+        self._operation_bf(value, bitweight, displacement)
         self._inst_cycles += 5
 
     # bf psw.0,$label72           ;31 03 1e fc
-    def _opcode_0x31_0x03_to_0x73_bf(self, opcode2):
-        bit = _bit(opcode2)
+    def _opcode_0x31_0x03_to_0x73_bf(self, opcode2, bitweight):
         address = self._consume_saddr()
         displacement = self._consume_byte()
         value = self._bus_read(address)
-        self._operation_bf(value, bit, displacement)
+        self._operation_bf(value, bitweight, displacement)
         self._inst_cycles += 5
 
     # btclr a.0,$label104         ;31 0d fd
-    def _opcode_0x31_0x0d_to_0x7d_btclr(self, opcode2):
-        bit = _bit(opcode2)
+    def _opcode_0x31_0x0d_to_0x7d_btclr(self, opcode2, bitweight):
         displacement = self._consume_byte()
         value = self.read_gp_reg(Registers.A)
-        result = self._operation_btclr(value, bit, displacement)
+        result = self._operation_btclr(value, bitweight, displacement)
         self.write_gp_reg(Registers.A, result)
         self._inst_cycles += 5
 
     # bt 0fffeh.0,$label24        ;31 06 fe fc    sfr
-    def _opcode_0x31_0x06_to_0x76_bt(self, opcode2):
-        bit = _bit(opcode2)
+    def _opcode_0x31_0x06_to_0x76_bt(self, opcode2, bitweight):
         address = self._consume_sfr()
         displacement = self._consume_byte()
         value = self._bus_read(address)
-        self._operation_bt(value, bit, displacement)
+        self._operation_bt(value, bitweight, displacement)
         self._inst_cycles += 5
 
     # btclr [hl].0,$label120      ;31 85 fd
-    def _opcode_0x31_0x05_to_0x75_btclr(self, opcode2):
-        bit = _bit(opcode2)
+    def _opcode_0x31_0x05_to_0x75_btclr(self, opcode2, bitweight):
         address = self._consume_sfr()
         displacement = self._consume_byte()
         value = self._bus_read(address)
-        result = self._operation_btclr(value, bit, displacement)
+        result = self._operation_btclr(value, bitweight, displacement)
         self._bus_write(address, result)
         self._inst_cycles += 4
 
     # btclr [hl].0,$label120      ;31 85 fd
-    def _opcode_0x31_0x85_to_0xf5_btclr(self, opcode2):
-        bit = _bit(opcode2)
+    def _opcode_0x31_0x85_to_0xf5_btclr(self, opcode2, bitweight):
         address = self.read_gp_regpair(RegisterPairs.HL)
         displacement = self._consume_byte()
         value = self._bus_read(address)
-        result = self._operation_btclr(value, bit, displacement)
+        result = self._operation_btclr(value, bitweight, displacement)
         self._bus_write(address, result)
         self._inst_cycles += 5
 
     # btclr 0fe20h.0,$label88     ;31 01 20 fc    saddr
-    def _opcode_0x31_0x01_to_0x71_btclr(self, opcode2):
-        bit = _bit(opcode2)
+    def _opcode_0x31_0x01_to_0x71_btclr(self, opcode2, bitweight):
         address = self._consume_saddr()
         displacement = self._consume_byte()
         value = self._bus_read(address)
-        result = self._operation_btclr(value, bit, displacement)
+        result = self._operation_btclr(value, bitweight, displacement)
         self._bus_write(address, result)
         self._inst_cycles += 4
 
     # bt [hl].0,$label40          ;31 86 fd
-    def _opcode_0x31_0x86_to_0xf6_bt(self, opcode2):
-        bit = _bit(opcode2)
+    def _opcode_0x31_0x86_to_0xf6_bt(self, opcode2, bitweight):
         address = self.read_gp_regpair(RegisterPairs.HL)
         displacement = self._consume_byte()
         value = self._bus_read(address)
-        self._operation_bt(value, bit, displacement)
+        self._operation_bt(value, bitweight, displacement)
         self._inst_cycles += 6
 
     # and a,[hl+c]                ;31 5a
@@ -1468,232 +1476,145 @@ class Processor(object):
 
     # adjba                       ;61 80
     def _opcode_0x61_0x80_adjba(self, opcode2):
-        psw = self.read_psw()
-        cy = int(bool(psw & Flags.CY))
-        ac = int(bool(psw & Flags.AC))
-
-        a = self.read_gp_reg(Registers.A)
-        a_low_nib = a & 0x0f
-        a_high_nib = a >> 4
-
-        if ac == 0:
-            if a_low_nib <= 9:
-                if (a_high_nib <= 9) and (cy == 0):
-                    a = a
-                    cy = 0
-                    ac = 0
-                if (a_high_nib >= 10) or (cy == 1):
-                    a = (a + 0b01100000) & 0xff
-                    cy = 1
-                    ac = 0
-            else:
-                if (a_high_nib < 9) and (cy == 0):
-                    a = (a + 0b00000110) & 0xff
-                    cy = 0
-                    ac = 1
-                if (a_high_nib >= 9) or (cy == 1):
-                    a = (a + 0b01100110) & 0xff
-                    cy = 1
-                    ac = 1
-        else:
-            if (a_high_nib <= 9) and (cy == 0):
-                a = (a + 0b00000110) & 0xff
-                cy = 0
-                ac = 0
-            if (a_high_nib >= 10) or (cy == 1):
-                a = (a + 0b01100110) & 0xff
-                cy = 1
-                ac = 0
-
-        psw &= ~(Flags.AC | Flags.CY | Flags.Z)
-        if cy:
-            psw |= Flags.CY
-        if ac:
-            psw |= Flags.AC
-        if a == 0:
-            psw |= Flags.Z
-        self.write_psw(psw)
-        self.write_gp_reg(Registers.A, a)
+        psw = self._psw
+        entry = _ADJBA_TABLE[((psw & (Flags.AC | Flags.CY)) << 8) |
+                             self.read_gp_reg(Registers.A)]
+        self.write_psw((psw & ~_ARITHMETIC_FLAGS) | (entry >> 8))
+        self.write_gp_reg(Registers.A, entry & 0xFF)
         self._inst_cycles += 2
 
     # adjbs                       ;61 90
     def _opcode_0x61_0x90_adjbs(self, opcode2):
-        psw = self.read_psw()
-        cy = int(bool(psw & Flags.CY))
-        ac = int(bool(psw & Flags.AC))
-
-        a = self.read_gp_reg(Registers.A)
-
-        if ac == 0:
-            if cy == 0:
-                a = a
-                cy = 0
-                ac = 0
-            else:
-                a = (a - 0b01100000) & 0xff
-                cy = 1
-                ac = 0
-        else:
-            if cy == 0:
-                a = (a - 0b00000110) & 0xff
-                cy = 0
-                ac = 0
-            else:
-                a = (a - 0b01100110) & 0xff
-                cy = 1
-                ac = 0
-
-        psw &= ~(Flags.AC | Flags.CY | Flags.Z)
-        if cy:
-            psw |= Flags.CY
-        if ac:
-            psw |= Flags.AC
-        if a == 0:
-            psw |= Flags.Z
-        self.write_psw(psw)
-        self.write_gp_reg(Registers.A, a)
+        psw = self._psw
+        entry = _ADJBS_TABLE[((psw & (Flags.AC | Flags.CY)) << 8) |
+                             self.read_gp_reg(Registers.A)]
+        self.write_psw((psw & ~_ARITHMETIC_FLAGS) | (entry >> 8))
+        self.write_gp_reg(Registers.A, entry & 0xFF)
         self._inst_cycles += 2
 
     # sel rb0                     ;61 d0
-    def _opcode_0x61_0xd0_to_0xf8_sel_rb(self, opcode2):
-        banks_by_opcode2 = {0xD0: 0, 0xD8: 1, 0xF0: 2, 0xF8: 3}
-        self.write_rb(banks_by_opcode2[opcode2])
+    def _opcode_0x61_0xd0_to_0xf8_sel_rb(self, opcode2, bank):
+        self.write_rb(bank)
         self._inst_cycles += 2
 
     # or a,x                      ;61 68
-    def _opcode_0x61_0x68_to_0x6f_or(self, opcode2):
+    def _opcode_0x61_0x68_to_0x6f_or(self, opcode2, reg):
         a = self.read_gp_reg(Registers.A)
-        reg = _reg(opcode2)
         b = self.read_gp_reg(reg)
         result = self._operation_or(a, b)
         self.write_gp_reg(Registers.A, result)
         self._inst_cycles += 2
 
     # or a,a                      ;61 61
-    def _opcode_0x61_0x61_to_0x67_or(self, opcode2):
+    def _opcode_0x61_0x61_to_0x67_or(self, opcode2, reg):
         a = self.read_gp_reg(Registers.A)
-        reg = _reg(opcode2)
         b = self.read_gp_reg(reg)
         result = self._operation_or(a, b)
         self.write_gp_reg(reg, result)
         self._inst_cycles += 2
 
     # and a,x                     ;61 58
-    def _opcode_0x61_0x58_to_0x5f_and(self, opcode2):
+    def _opcode_0x61_0x58_to_0x5f_and(self, opcode2, reg):
         a = self.read_gp_reg(Registers.A)
-        reg = _reg(opcode2)
         b = self.read_gp_reg(reg)
         result = self._operation_and(a, b)
         self.write_gp_reg(Registers.A, result)
         self._inst_cycles += 2
 
     # cmp reg,a                   ;61 40..47
-    def _opcode_0x61_0x40_to_0x47_cmp(self, opcode2):
-        reg = _reg(opcode2)
+    def _opcode_0x61_0x40_to_0x47_cmp(self, opcode2, reg):
         a = self.read_gp_reg(reg)
         b = self.read_gp_reg(Registers.A)
         self._operation_sub(a, b)
         self._inst_cycles += 2
 
     # cmp a,reg                   ;61 48..4f
-    def _opcode_0x61_48_to_4f_cmp(self, opcode2):
+    def _opcode_0x61_0x48_to_0x4f_cmp(self, opcode2, reg):
         a = self.read_gp_reg(Registers.A)
-        reg = _reg(opcode2)
         b = self.read_gp_reg(reg)
         self._operation_sub(a, b)
         self._inst_cycles += 2
 
     # and x,a                     ;61 50
-    def _opcode_0x61_0x50_to_0x57_and(self, opcode2):
+    def _opcode_0x61_0x50_to_0x57_and(self, opcode2, reg):
         a = self.read_gp_reg(Registers.A)
-        reg = _reg(opcode2)
         b = self.read_gp_reg(reg)
         result = self._operation_and(a, b)
         self.write_gp_reg(reg, result)
         self._inst_cycles += 2
 
     # xor a,x                     ;61 78
-    def _opcode_0x61_0x78_to_0x7f_xor(self, opcode2):
+    def _opcode_0x61_0x78_to_0x7f_xor(self, opcode2, reg):
         a = self.read_gp_reg(Registers.A)
-        reg = _reg(opcode2)
         b = self.read_gp_reg(reg)
         result = self._operation_xor(a, b)
         self.write_gp_reg(Registers.A, result)
         self._inst_cycles += 2
 
     # xor x,a                     ;61 70
-    def _opcode_0x61_0x70_to_0x77_xor(self, opcode2):
+    def _opcode_0x61_0x70_to_0x77_xor(self, opcode2, reg):
         a = self.read_gp_reg(Registers.A)
-        reg = _reg(opcode2)
         b = self.read_gp_reg(reg)
         result = self._operation_xor(a, b)
         self.write_gp_reg(reg, result)
         self._inst_cycles += 2
 
     # set1 a.0                    ;61 8a
-    def _opcode_0x61_0x8a_to_0xfa_set1(self, opcode2):
+    def _opcode_0x61_0x8a_to_0xfa_set1(self, opcode2, bitweight):
         a = self.read_gp_reg(Registers.A)
-        bit = _bit(opcode2)
-        result = self._operation_set1(a, bit)
+        result = self._operation_set1(a, bitweight)
         self.write_gp_reg(Registers.A, result)
         self._inst_cycles += 2
 
     # clr1 a.0                    ;61 8b
-    def _opcode_0x61_0x8b_to_0xfb_clr1(self, opcode2):
+    def _opcode_0x61_0x8b_to_0xfb_clr1(self, opcode2, bitweight):
         a = self.read_gp_reg(Registers.A)
-        bit = _bit(opcode2)
-        result = self._operation_clr1(a, bit)
+        result = self._operation_clr1(a, bitweight)
         self.write_gp_reg(Registers.A, result)
         self._inst_cycles += 2
 
     # mov1 cy,a.0                 ;61 8c
-    def _opcode_0x61_0x8c_to_0xfc_mov1(self, opcode2):
-        bit = _bit(opcode2)
+    def _opcode_0x61_0x8c_to_0xfc_mov1(self, opcode2, bitweight):
         src = self.read_gp_reg(Registers.A)
-        dest = self.read_psw()
-        result = self._operation_mov1(src, bit, dest, 0)
+        dest = self._psw
+        result = self._operation_mov1(src, bitweight, dest, Flags.CY)
         self.write_psw(result)
         self._inst_cycles += 2
 
     # mov1 a.0,cy                 ;61 89
-    def _opcode_0x61_0x89_to_0xf9_mov1(self, opcode2):
-        bit = _bit(opcode2)
-        src = self.read_psw()
+    def _opcode_0x61_0x89_to_0xf9_mov1(self, opcode2, bitweight):
+        src = self._psw
         dest = self.read_gp_reg(Registers.A)
-        result = self._operation_mov1(src, 0, dest, bit)
+        result = self._operation_mov1(src, Flags.CY, dest, bitweight)
         self.write_gp_reg(Registers.A, result)
         self._inst_cycles += 2
 
     # and1 cy,a.0                 ;61 8d
-    def _opcode_0x61_0x8d_to_0xfd_and1(self, opcode2):
-        bit = _bit(opcode2)
+    def _opcode_0x61_0x8d_to_0xfd_and1(self, opcode2, bitweight):
         src = self.read_gp_reg(Registers.A)
-        dest = self.read_psw()
-        result = self._operation_and1(src, bit, dest, 0)
+        dest = self._psw
+        result = self._operation_and1(src, bitweight, dest, Flags.CY)
         self.write_psw(result)
         self._inst_cycles += 2
 
     # or1 cy,a.0                  ;61 8e
-    def _opcode_0x61_0x8e_to_0xfe_or1(self, opcode2):
-        bit = _bit(opcode2)
+    def _opcode_0x61_0x8e_to_0xfe_or1(self, opcode2, bitweight):
         src = self.read_gp_reg(Registers.A)
-        dest = self.read_psw()
-        result = self._operation_or1(src, bit, dest, 0)
+        dest = self._psw
+        result = self._operation_or1(src, bitweight, dest, Flags.CY)
         self.write_psw(result)
         self._inst_cycles += 2
 
     # xor1 cy,a.0                 ;61 8f
-    def _opcode_0x61_0x8f_to_0xff_xor1(self, opcode2):
-        bit = _bit(opcode2)
+    def _opcode_0x61_0x8f_to_0xff_xor1(self, opcode2, bitweight):
         src = self.read_gp_reg(Registers.A)
-        dest = self.read_psw()
-        result = self._operation_xor1(src, bit, dest, 0)
+        dest = self._psw
+        result = self._operation_xor1(src, bitweight, dest, Flags.CY)
         self.write_psw(result)
         self._inst_cycles += 2
 
     # add a,x                     ;61 08
-    def _opcode_0x61_0x08_to_0x0f_add(self, opcode2):
-        reg = _reg(opcode2)
+    def _opcode_0x61_0x08_to_0x0f_add(self, opcode2, reg):
         a = self.read_gp_reg(Registers.A)
         b = self.read_gp_reg(reg)
         result = self._operation_add(a, b)
@@ -1701,8 +1622,7 @@ class Processor(object):
         self._inst_cycles += 2
 
     # addc a,x                    ;61 28
-    def _opcode_0x61_0x28_to_0x2f_addc(self, opcode2):
-        reg = _reg(opcode2)
+    def _opcode_0x61_0x28_to_0x2f_addc(self, opcode2, reg):
         a = self.read_gp_reg(Registers.A)
         b = self.read_gp_reg(reg)
         result = self._operation_addc(a, b)
@@ -1710,8 +1630,7 @@ class Processor(object):
         self._inst_cycles += 2
 
     # sub reg,a                   ;61 10..17
-    def _opcode_0x61_0x10_to_0x17_sub(self, opcode2):
-        reg = _reg(opcode2)
+    def _opcode_0x61_0x10_to_0x17_sub(self, opcode2, reg):
         a = self.read_gp_reg(reg)
         b = self.read_gp_reg(Registers.A)
         result = self._operation_sub(a, b)
@@ -1719,8 +1638,7 @@ class Processor(object):
         self._inst_cycles += 2
 
     # subc reg,a                  ;61 30..37
-    def _opcode_0x61_0x30_to_0x37_subc(self, opcode2):
-        reg = _reg(opcode2)
+    def _opcode_0x61_0x30_to_0x37_subc(self, opcode2, reg):
         a = self.read_gp_reg(reg)
         b = self.read_gp_reg(Registers.A)
         result = self._operation_subc(a, b)
@@ -1728,8 +1646,7 @@ class Processor(object):
         self._inst_cycles += 2
 
     # subc a,reg                  ;61 38..3f
-    def _opcode_0x61_0x38_to_0x3f_subc(self, opcode2):
-        reg = _reg(opcode2)
+    def _opcode_0x61_0x38_to_0x3f_subc(self, opcode2, reg):
         a = self.read_gp_reg(Registers.A)
         b = self.read_gp_reg(reg)
         result = self._operation_subc(a, b)
@@ -1737,8 +1654,7 @@ class Processor(object):
         self._inst_cycles += 2
 
     # sub a,reg                   ;61 18..1f
-    def _opcode_0x61_0x18_to_0x1f_except_0x11(self, opcode2):
-        reg = _reg(opcode2)
+    def _opcode_0x61_0x18_to_0x1f_except_0x11(self, opcode2, reg):
         a = self.read_gp_reg(Registers.A)
         b = self.read_gp_reg(reg)
         result = self._operation_sub(a, b)
@@ -1746,8 +1662,7 @@ class Processor(object):
         self._inst_cycles += 2
 
     # add x,a                     ;61 00
-    def _opcode_0x61_0x00_to_0x07_add(self, opcode2):
-        reg = _reg(opcode2)
+    def _opcode_0x61_0x00_to_0x07_add(self, opcode2, reg):
         a = self.read_gp_reg(Registers.A)
         b = self.read_gp_reg(reg)
         result = self._operation_add(a, b)
@@ -1755,8 +1670,7 @@ class Processor(object):
         self._inst_cycles += 2
 
     # addc x,a                    ;61 20
-    def _opcode_0x61_0x20_to_0x27_addc(self, opcode2):
-        reg = _reg(opcode2)
+    def _opcode_0x61_0x20_to_0x27_addc(self, opcode2, reg):
         a = self.read_gp_reg(Registers.A)
         b = self.read_gp_reg(reg)
         result = self._operation_addc(a, b)
@@ -1764,20 +1678,18 @@ class Processor(object):
         self._inst_cycles += 2
 
     # clr1 0fffeh.0               ;71 0b fe       sfr
-    def _opcode_0x71_0x0b_to_0x7b_clr1(self, opcode2):
-        bit = _bit(opcode2)
+    def _opcode_0x71_0x0b_to_0x7b_clr1(self, opcode2, bitweight):
         address = self._consume_sfr()
         value = self._bus_read(address)
-        result = self._operation_clr1(value, bit)
+        result = self._operation_clr1(value, bitweight)
         self._bus_write(address, result)
         self._inst_cycles += 1
 
     # set1 0fffeh.0               ;71 0a fe       sfr
-    def _opcode_0x71_0x0a_to_0x7a_set1(self, opcode2):
-        bit = _bit(opcode2)
+    def _opcode_0x71_0x0a_to_0x7a_set1(self, opcode2, bitweight):
         address = self._consume_sfr()
         value = self._bus_read(address)
-        result = self._operation_set1(value, bit)
+        result = self._operation_set1(value, bitweight)
         self._bus_write(address, result)
         self._inst_cycles += 1
 
@@ -1787,170 +1699,153 @@ class Processor(object):
         self._halt_rewind_pending = True
 
     # set1 [hl].0                 ;71 82
-    def _opcode_0x71_0x82_to_0xf2_set1(self, opcode2):
-        bit = _bit(opcode2)
+    def _opcode_0x71_0x82_to_0xf2_set1(self, opcode2, bitweight):
         address = self.read_gp_regpair(RegisterPairs.HL)
         value = self._bus_read(address)
-        result = self._operation_set1(value, bit)
+        result = self._operation_set1(value, bitweight)
         self._bus_write(address, result)
         self._inst_cycles += 2
 
     # clr1 [hl].0                 ;71 83
-    def _opcode2_0x71_0x83_to_0xf3_clr1(self, opcode2):
-        bit = _bit(opcode2)
+    def _opcode_0x71_0x83_to_0xf3_clr1(self, opcode2, bitweight):
         address = self.read_gp_regpair(RegisterPairs.HL)
         value = self._bus_read(address)
-        result = self._operation_clr1(value, bit)
+        result = self._operation_clr1(value, bitweight)
         self._bus_write(address, result)
         self._inst_cycles += 2
 
     # mov1 cy,0fffeh.0            ;71 0c fe       sfr
-    def _opcode_0x71_0x0c_to_0x7c_mov1(self, opcode2):
-        bit = _bit(opcode2)
+    def _opcode_0x71_0x0c_to_0x7c_mov1(self, opcode2, bitweight):
         address = self._consume_sfr()
         src = self._bus_read(address)
-        dest = self.read_psw()
-        result = self._operation_mov1(src, bit, dest, 0)
+        dest = self._psw
+        result = self._operation_mov1(src, bitweight, dest, Flags.CY)
         self.write_psw(result)
         self._inst_cycles += 2
 
     # mov1 0fffeh.0,cy            ;71 09 fe       sfr
-    def _opcode_0x71_0x09_to_0x79_mov1(self, opcode2):
-        bit = _bit(opcode2)
+    def _opcode_0x71_0x09_to_0x79_mov1(self, opcode2, bitweight):
         address = self._consume_sfr()
-        src = self.read_psw()
+        src = self._psw
         dest = self._bus_read(address)
-        result = self._operation_mov1(src, 0, dest, bit)
+        result = self._operation_mov1(src, Flags.CY, dest, bitweight)
         self._bus_write(address, result)
         self._inst_cycles += 1
 
     # mov1 0fe20h.0,cy            ;71 01 20       saddr
-    def _opcode_0x71_0x01_to_0x71_mov1(self, opcode2):
-        bit = _bit(opcode2)
+    def _opcode_0x71_0x01_to_0x71_mov1(self, opcode2, bitweight):
         address = self._consume_saddr()
-        src = self.read_psw()
+        src = self._psw
         dest = self._bus_read(address)
-        result = self._operation_mov1(src, 0, dest, bit)
+        result = self._operation_mov1(src, Flags.CY, dest, bitweight)
         self._bus_write(address, result)
         self._inst_cycles += 1
 
     # mov1 cy,0fe20h.0            ;71 04 20       saddr
-    def _opcode_0x71_0x04_to_0x74_mov1(self, opcode2):
-        bit = _bit(opcode2)
+    def _opcode_0x71_0x04_to_0x74_mov1(self, opcode2, bitweight):
         address = self._consume_saddr()
         src = self._bus_read(address)
-        dest = self.read_psw()
-        result = self._operation_mov1(src, bit, dest, 0)
+        dest = self._psw
+        result = self._operation_mov1(src, bitweight, dest, Flags.CY)
         self.write_psw(result)
         self._inst_cycles += 2
 
     # mov1 cy,[hl].0              ;71 84
-    def _opcode_0x71_0x84_to_0xf4_mov1(self, opcode2):
-        bit = _bit(opcode2)
+    def _opcode_0x71_0x84_to_0xf4_mov1(self, opcode2, bitweight):
         address = self.read_gp_regpair(RegisterPairs.HL)
         src = self._bus_read(address)
-        dest = self.read_psw()
-        result = self._operation_mov1(src, bit, dest, 0)
+        dest = self._psw
+        result = self._operation_mov1(src, bitweight, dest, Flags.CY)
         self.write_psw(result)
         self._inst_cycles += 3
 
     # mov1 [hl].0,cy              ;71 81
-    def _opcode_0x71_0x81_to_0xf1_mov1(self, opcode2):
-        bit = _bit(opcode2)
+    def _opcode_0x71_0x81_to_0xf1_mov1(self, opcode2, bitweight):
         address = self.read_gp_regpair(RegisterPairs.HL)
-        src = self.read_psw()
+        src = self._psw
         dest = self._bus_read(address)
-        result = self._operation_mov1(src, 0, dest, bit)
+        result = self._operation_mov1(src, Flags.CY, dest, bitweight)
         self._bus_write(address, result)
         self._inst_cycles += 2
 
     # and1 cy,[hl].0              ;71 85
-    def _opcode_0x71_0x85_to_0xf5_and1(self, opcode2):
-        bit = _bit(opcode2)
+    def _opcode_0x71_0x85_to_0xf5_and1(self, opcode2, bitweight):
         address = self.read_gp_regpair(RegisterPairs.HL)
         src = self._bus_read(address)
-        dest = self.read_psw()
-        result = self._operation_and1(src, bit, dest, 0)
+        dest = self._psw
+        result = self._operation_and1(src, bitweight, dest, Flags.CY)
         self.write_psw(result)
         self._inst_cycles += 3
 
     # and1 cy,0fffeh.0            ;71 0d fe       sfr
-    def _opcode_0x71_0x0d_to_0x7d_and1(self, opcode2):
-        bit = _bit(opcode2)
+    def _opcode_0x71_0x0d_to_0x7d_and1(self, opcode2, bitweight):
         address = self._consume_sfr()
         src = self._bus_read(address)
-        dest = self.read_psw()
-        result = self._operation_and1(src, bit, dest, 0)
+        dest = self._psw
+        result = self._operation_and1(src, bitweight, dest, Flags.CY)
         self.write_psw(result)
         self._inst_cycles += 2
 
     # and1 cy,0fe20h.0            ;71 05 20       saddr
-    def _opcode_0x71_0x05_to_0x75_and1(self, opcode2):
-        bit = _bit(opcode2)
+    def _opcode_0x71_0x05_to_0x75_and1(self, opcode2, bitweight):
         address = self._consume_saddr()
         src = self._bus_read(address)
-        dest = self.read_psw()
-        result = self._operation_and1(src, bit, dest, 0)
+        dest = self._psw
+        result = self._operation_and1(src, bitweight, dest, Flags.CY)
         self.write_psw(result)
         self._inst_cycles += 2
 
     # or1 cy,0fffeh.0             ;71 0e fe       sfr
-    def _opcode_0x71_0x0e_to_0x7e_or1(self, opcode2):
-        bit = _bit(opcode2)
+    def _opcode_0x71_0x0e_to_0x7e_or1(self, opcode2, bitweight):
         address = self._consume_sfr()
         src = self._bus_read(address)
-        dest = self.read_psw()
-        result = self._operation_or1(src, bit, dest, 0)
+        dest = self._psw
+        result = self._operation_or1(src, bitweight, dest, Flags.CY)
         self.write_psw(result)
         self._inst_cycles += 2
 
     # or1 cy,[hl].0               ;71 86
-    def _opcode_0x71_0x86_to_0xf6_or1(self, opcode2):
-        bit = _bit(opcode2)
+    def _opcode_0x71_0x86_to_0xf6_or1(self, opcode2, bitweight):
         address = self.read_gp_regpair(RegisterPairs.HL)
         src = self._bus_read(address)
-        dest = self.read_psw()
-        result = self._operation_or1(src, bit, dest, 0)
+        dest = self._psw
+        result = self._operation_or1(src, bitweight, dest, Flags.CY)
         self.write_psw(result)
         self._inst_cycles += 3
 
     # or1 cy,0fe20h.0             ;71 06 20       saddr
-    def _opcode_0x71_0x06_to_0x76_or1(self, opcode2):
-        bit = _bit(opcode2)
+    def _opcode_0x71_0x06_to_0x76_or1(self, opcode2, bitweight):
         address = self._consume_saddr()
         src = self._bus_read(address)
-        dest = self.read_psw()
-        result = self._operation_or1(src, bit, dest, 0)
+        dest = self._psw
+        result = self._operation_or1(src, bitweight, dest, Flags.CY)
         self.write_psw(result)
         self._inst_cycles += 2
 
     # xor1 cy,[hl].0              ;71 87
-    def _opcode_0x71_0x87_to_0xf7_xor1(self, opcode2):
-        bit = _bit(opcode2)
+    def _opcode_0x71_0x87_to_0xf7_xor1(self, opcode2, bitweight):
         address = self.read_gp_regpair(RegisterPairs.HL)
         src = self._bus_read(address)
-        dest = self.read_psw()
-        result = self._operation_xor1(src, bit, dest, 0)
+        dest = self._psw
+        result = self._operation_xor1(src, bitweight, dest, Flags.CY)
         self.write_psw(result)
         self._inst_cycles += 3
 
     # xor1 cy,0fffeh.0            ;71 0f fe       sfr
-    def _opcode_0x71_0x0f_to_0x7f(self, opcode2):
-        bit = _bit(opcode2)
+    def _opcode_0x71_0x0f_to_0x7f(self, opcode2, bitweight):
         address = self._consume_sfr()
         src = self._bus_read(address)
-        dest = self.read_psw()
-        result = self._operation_xor1(src, bit, dest, 0)
+        dest = self._psw
+        result = self._operation_xor1(src, bitweight, dest, Flags.CY)
         self.write_psw(result)
         self._inst_cycles += 2
 
     # xor1 cy,0fe20h.0            ;71 07 20       saddr
-    def _opcode_0x71_0x07_to_0x77_xor1(self, opcode2):
-        bit = _bit(opcode2)
+    def _opcode_0x71_0x07_to_0x77_xor1(self, opcode2, bitweight):
         address = self._consume_saddr()
         src = self._bus_read(address)
-        dest = self.read_psw()
-        result = self._operation_xor1(src, bit, dest, 0)
+        dest = self._psw
+        result = self._operation_xor1(src, bitweight, dest, Flags.CY)
         self.write_psw(result)
         self._inst_cycles += 2
 
@@ -1991,12 +1886,11 @@ class Processor(object):
         self._inst_cycles += 2
 
     # bt 0fe20h.bit,$label8         ;8c 20 fd       saddr
-    def _opcode_0x8c_to_0xfc_bt(self, opcode):
-        bit = _bit(opcode)
+    def _opcode_0x8c_to_0xfc_bt(self, opcode, bitweight):
         address = self._consume_saddr()
         displacement = self._consume_byte()
         value = self._bus_read(address)
-        self._operation_bt(value, bit, displacement)
+        self._operation_bt(value, bitweight, displacement)
         self._inst_cycles += 4
 
     # or 0fe20h,#0abh             ;e8 20 ab      saddr
@@ -2177,25 +2071,25 @@ class Processor(object):
         self._push_word(self.pc)
         self.pc = address
         self._inst_cycles += 2
+        if address in self._call_hooks:
+            self._call_hook()
 
     # SET1 0fe20h.7               ;7A 20          saddr
     # SET1 PSW.7                  ;7A 1E          (psw=saddr ff1e)
     # EI                          ;7A 1E          alias for SET1 PSW.7
-    def _opcode_0x0a_to_0x7a_set1(self, opcode):
-        bit = _bit(opcode)
+    def _opcode_0x0a_to_0x7a_set1(self, opcode, bitweight):
         address = self._consume_saddr()
         value = self._bus_read(address)
-        result = self._operation_set1(value, bit)
+        result = self._operation_set1(value, bitweight)
         self._bus_write(address, result)
 
     # clr1 0fe20h.0               ;0b 20          saddr
     # clr1 psw.0                  ;0b 1e
     # di                          ;7b 1e          alias for clr1 psw.7
-    def _opcode_0x0b_to_0x7b_clr(self, opcode):
-        bit = _bit(opcode)
+    def _opcode_0x0b_to_0x7b_clr(self, opcode, bitweight):
         address = self._consume_saddr()
         value = self._bus_read(address)
-        result = self._operation_clr1(value, bit)
+        result = self._operation_clr1(value, bitweight)
         self._bus_write(address, result)
 
     # ret                         ;af
@@ -2219,7 +2113,7 @@ class Processor(object):
 
     # brk                         ;bf
     def _opcode_0xbf(self, opcode):
-        psw = self.read_psw()
+        psw = self._psw
         self._push(psw)
         self._push_word(self.pc)
         self.write_psw(psw & ~Flags.IE)
@@ -2239,7 +2133,7 @@ class Processor(object):
     # bc $label3                  ;8d fe
     def _opcode_0x8d(self, opcode):
         displacement = self._consume_byte()
-        if self.read_psw() & Flags.CY:
+        if self._psw & Flags.CY:
             address = _resolve_rel(self.pc, displacement)
             self.pc = address
         self._inst_cycles += 4
@@ -2247,7 +2141,7 @@ class Processor(object):
     # bnc $label3                 ;9d fe
     def _opcode_0x9d(self, opcode):
         displacement = self._consume_byte()
-        if self.read_psw() & Flags.CY == 0:
+        if self._psw & Flags.CY == 0:
             address = _resolve_rel(self.pc, displacement)
             self.pc = address
         self._inst_cycles += 4
@@ -2255,7 +2149,7 @@ class Processor(object):
     # bz $label5                  ;ad fe
     def _opcode_0xad(self, opcode):
         displacement = self._consume_byte()
-        if self.read_psw() & Flags.Z:
+        if self._psw & Flags.Z:
             address = _resolve_rel(self.pc, displacement)
             self.pc = address
         self._inst_cycles += 4
@@ -2263,7 +2157,7 @@ class Processor(object):
     # bnz $label5                 ;bd fe
     def _opcode_0xbd(self, opcode):
         displacement = self._consume_byte()
-        if self.read_psw() & Flags.Z == 0:
+        if self._psw & Flags.Z == 0:
             address = _resolve_rel(self.pc, displacement)
             self.pc = address
         self._inst_cycles += 4
@@ -2281,8 +2175,7 @@ class Processor(object):
     # inc x                       ;40
     # ...
     # inc h                       ;47
-    def _opcode_0x40_to_0x47_inc(self, opcode):
-        reg = _reg(opcode)
+    def _opcode_0x40_to_0x47_inc(self, opcode, reg):
         value = self.read_gp_reg(reg)
         result = self._operation_inc(value)
         self.write_gp_reg(reg, result)
@@ -2291,8 +2184,7 @@ class Processor(object):
     # dec x                       ;50
     # ...
     # dec h                       ;57
-    def _opcode_0x50_to_0x57_dec(self, opcode):
-        reg = _reg(opcode)
+    def _opcode_0x50_to_0x57_dec(self, opcode, reg):
         value = self.read_gp_reg(reg)
         result = self._operation_dec(value)
         self.write_gp_reg(reg, result)
@@ -2315,26 +2207,39 @@ class Processor(object):
     # 0c 00          0c = callf 0800h-08ffh
     # ...
     # 7c 00          7c = callf 0f00h-0fffh
-    def _opcode_0x0c_to_0x7c_callf(self, opcode):
-        base = 0x0800 + ((opcode >> 4) << 8)
+    def _opcode_0x0c_to_0x7c_callf(self, opcode, addr11):
         offset = self._consume_byte()
         self._push_word(self.pc)
-        self.pc = base + offset
+        self.pc = addr11 + offset
         self._inst_cycles += 1
+        if self.pc in self._call_hooks:
+            self._call_hook()
 
     # callt [0040h]               ;c1
     # ...
     # callt [007eh]               ;ff
-    def _opcode_0xc1_to_0xff_callt(self, opcode):
-        offset = (opcode & 0b00111110) >> 1
-        vector_address = 0x40 + (offset * 2)
+    def _opcode_0xc1_to_0xff_callt(self, opcode, addr5):
         self._inst_cycles += 1  # bus: read vector low
-        low = self.bus.read(vector_address)
+        low = self.bus.read(addr5)
         self._inst_cycles += 1  # bus: read vector high
-        high = self.bus.read(vector_address + 1)
+        high = self.bus.read(addr5 + 1)
         self._push_word(self.pc)
         self.pc = (high << 8) + low
         self._inst_cycles += 1
+        if self.pc in self._call_hooks:
+            self._call_hook()
+
+    def _call_hook(self):
+        """Run the hook for the subroutine just called and return from it.
+        Only the hook's cycles are charged for the subroutine; bus clocks
+        used by the hook and by popping the return address are not."""
+        function, cycles = self._call_hooks[self.pc]
+        inst_cycles = self._inst_cycles
+        result = function(self)
+        if result is not None:
+            cycles = result
+        self.pc = self._pop_word()
+        self._inst_cycles = inst_cycles + cycles
 
     # dbnz c,$label1              ;8a fe
     def _opcode_0x8a(self, opcode):
@@ -2429,8 +2334,7 @@ class Processor(object):
     # movw ax,bc                  ;c2
     # movw ax,de                  ;c4
     # movw ax,hl                  ;c6
-    def _opcode_0xc2_to_0xc6_movw(self, opcode):
-        regpair = _regpair(opcode)
+    def _opcode_0xc2_to_0xc6_movw(self, opcode, regpair):
         value = self.read_gp_regpair(regpair)
         self.write_gp_regpair(RegisterPairs.AX, value)
         self._inst_cycles += 3
@@ -2438,8 +2342,7 @@ class Processor(object):
     # movw bc,ax                  ;d2
     # movw de,ax                  ;d4
     # movw hl,ax                  ;d6
-    def _opcode_0xd2_to_0xd6_movw(self, opcode):
-        regpair = _regpair(opcode)
+    def _opcode_0xd2_to_0xd6_movw(self, opcode, regpair):
         value = self.read_gp_regpair(RegisterPairs.AX)
         self.write_gp_regpair(regpair, value)
         self._inst_cycles += 3
@@ -2466,8 +2369,7 @@ class Processor(object):
     # push ax                     ;b1
     # ...
     # push hl                     ;b7
-    def _opcode_0xb1_to_0xb7_push_rp(self, opcode):
-        regpair = _regpair(opcode)
+    def _opcode_0xb1_to_0xb7_push_rp(self, opcode, regpair):
         value = self.read_gp_regpair(regpair)
         self._push_word(value)
         self._inst_cycles += 1
@@ -2475,37 +2377,31 @@ class Processor(object):
     # pop ax                      ;b0
     # ...
     # pop hl                      ;b6
-    def _opcode_0xb0_to_0xb6_pop_rp(self, opcode):
-        regpair = _regpair(opcode)
+    def _opcode_0xb0_to_0xb6_pop_rp(self, opcode, regpair):
         value = self._pop_word()
         self.write_gp_regpair(regpair, value)
         self._inst_cycles += 1
 
     # Operations
 
-    def _operation_bt(self, value, bit, displacement):
-        bitweight = 2 ** bit
+    def _operation_bt(self, value, bitweight, displacement):
         if value & bitweight:
             address = _resolve_rel(self.pc, displacement)
             self.pc = address
 
-    def _operation_bf(self, value, bit, displacement):
-        bitweight = 2 ** bit
+    def _operation_bf(self, value, bitweight, displacement):
         if value & bitweight == 0:
             address = _resolve_rel(self.pc, displacement)
             self.pc = address
 
-    def _operation_btclr(self, value, bit, displacement):
-        bitweight = 2 ** bit
+    def _operation_btclr(self, value, bitweight, displacement):
         if value & bitweight:
             address = _resolve_rel(self.pc, displacement)
             self.pc = address
         result = value & ~bitweight
         return result
 
-    def _operation_xor1(self, src, src_bit, dest, dest_bit):
-        src_bitweight = 2 ** src_bit
-        dest_bitweight = 2 ** dest_bit
+    def _operation_xor1(self, src, src_bitweight, dest, dest_bitweight):
         if (src & src_bitweight) and (dest & dest_bitweight):
             result = dest & ~dest_bitweight # 1 xor 1 = 0
         elif (src & src_bitweight == 0) and (dest & dest_bitweight == 0):
@@ -2514,27 +2410,21 @@ class Processor(object):
             result = dest | dest_bitweight # 0 xor 1 = 1, 1 xor 0 = 1
         return result
 
-    def _operation_or1(self, src, src_bit, dest, dest_bit):
-        src_bitweight = 2 ** src_bit
-        dest_bitweight = 2 ** dest_bit
+    def _operation_or1(self, src, src_bitweight, dest, dest_bitweight):
         if (src & src_bitweight) or (dest & dest_bitweight):
             result = dest | dest_bitweight
         else:
             result = dest # dest bit must already be off
         return result
 
-    def _operation_and1(self, src, src_bit, dest, dest_bit):
-        src_bitweight = 2 ** src_bit
-        dest_bitweight = 2 ** dest_bit
+    def _operation_and1(self, src, src_bitweight, dest, dest_bitweight):
         if (src & src_bitweight) and (dest & dest_bitweight):
             result = dest | dest_bitweight
         else:
             result = dest & ~dest_bitweight
         return result
 
-    def _operation_mov1(self, src, src_bit, dest, dest_bit):
-        src_bitweight = 2 ** src_bit
-        dest_bitweight = 2 ** dest_bit
+    def _operation_mov1(self, src, src_bitweight, dest, dest_bitweight):
         if src & src_bitweight:
             result = dest | dest_bitweight
         else:
@@ -2544,7 +2434,7 @@ class Processor(object):
     def _operation_addw(self, a, b):
         # TODO docs say AC is undefined, so we just clear it.  Find
         # out what the hardware really does to AC.
-        psw = self.read_psw() & ~(Flags.Z + Flags.AC + Flags.CY)
+        psw = self._psw & ~(Flags.Z + Flags.AC + Flags.CY)
         sum = a + b
         if sum > 0xFFFF:
             psw |= Flags.CY
@@ -2557,7 +2447,7 @@ class Processor(object):
     def _operation_subw(self, a, b):
         # TODO docs say AC is undefined, so we just clear it.  Find
         # out what the hardware really does to AC.
-        psw = self.read_psw() & ~(Flags.Z + Flags.AC + Flags.CY)
+        psw = self._psw & ~(Flags.Z + Flags.AC + Flags.CY)
         difference = a - b
         if difference < 0:
             psw |= Flags.CY
@@ -2568,80 +2458,36 @@ class Processor(object):
         return result
 
     def _operation_sub(self, a, b):
-        psw = self.read_psw() & ~(Flags.Z + Flags.AC + Flags.CY)
-        if ((a & 0x0f) - (b & 0x0f)) & 0x10:
-            psw |= Flags.AC
-        difference = a - b
-        if difference < 0:
-            psw |= Flags.CY
-        result = difference & 0xff
-        if result == 0:
-            psw |= Flags.Z
-        self.write_psw(psw)
-        return result
+        entry = _SUB_TABLE[(a << 8) | b]
+        self.write_psw((self._psw & ~_ARITHMETIC_FLAGS) | (entry >> 8))
+        return entry & 0xFF
 
     def _operation_subc(self, a, b):
-        psw = self.read_psw()
-        carry = psw & Flags.CY
-        psw &= ~(Flags.Z + Flags.AC + Flags.CY)
-        if ((a & 0x0f) - (b & 0x0f) - carry) & 0x10:
-            psw |= Flags.AC
-        difference = a - b - carry
-        if difference < 0:
-            psw |= Flags.CY
-        result = difference & 0xff
-        if result == 0:
-            psw |= Flags.Z
-        self.write_psw(psw)
-        return result
+        psw = self._psw
+        entry = _SUB_TABLE[((psw & Flags.CY) << 16) | (a << 8) | b]
+        self.write_psw((psw & ~_ARITHMETIC_FLAGS) | (entry >> 8))
+        return entry & 0xFF
 
     def _operation_add(self, a, b):
-        psw = self.read_psw() & ~(Flags.Z + Flags.AC + Flags.CY)
-        if ((a & 0x0F) + (b & 0x0F)) > 0x0F:
-            psw |= Flags.AC
-        sum = a + b
-        if sum > 0xFF:
-            psw |= Flags.CY
-        result = sum & 0xFF
-        if result == 0:
-            psw |= Flags.Z
-        self.write_psw(psw)
-        return result
+        entry = _ADD_TABLE[(a << 8) | b]
+        self.write_psw((self._psw & ~_ARITHMETIC_FLAGS) | (entry >> 8))
+        return entry & 0xFF
 
     def _operation_addc(self, a, b):
-        psw = self.read_psw()
-        carry = psw & Flags.CY
-        psw &= ~(Flags.Z + Flags.AC + Flags.CY)
-        if ((a & 0x0F) + (b & 0x0F) + carry) > 0x0F:
-            psw |= Flags.AC
-        sum = a + b + carry
-        if sum > 0xFF:
-            psw |= Flags.CY
-        result = sum & 0xFF
-        if result == 0:
-            psw |= Flags.Z
-        self.write_psw(psw)
-        return result
+        psw = self._psw
+        entry = _ADD_TABLE[((psw & Flags.CY) << 16) | (a << 8) | b]
+        self.write_psw((psw & ~_ARITHMETIC_FLAGS) | (entry >> 8))
+        return entry & 0xFF
 
     def _operation_inc(self, value):
-        psw = self.read_psw() & ~(Flags.Z + Flags.AC)
-        if value & 0x0f == 0x0f:
-            psw |= Flags.AC
-        result = (value + 1) & 0xFF
-        if result == 0:
-            psw |= Flags.Z
-        self.write_psw(psw)
-        return result
+        entry = _INC_TABLE[value]
+        self.write_psw((self._psw & ~(Flags.Z | Flags.AC)) | (entry >> 8))
+        return entry & 0xFF
 
     def _operation_dec(self, value):
-        psw = self.read_psw() & ~(Flags.Z + Flags.AC)
-        if value & 0x0f == 0:
-            psw |= Flags.AC
-        result = (value - 1) & 0xFF
-        if result == 0:
-            psw |= Flags.Z
-        self.write_psw(psw)
-        return result
+        entry = _DEC_TABLE[value]
+        self.write_psw((self._psw & ~(Flags.Z | Flags.AC)) | (entry >> 8))
+        return entry & 0xFF
 
     def _operation_incw(self, value):
         return (value + 1) & 0xFFFF
@@ -2649,11 +2495,11 @@ class Processor(object):
     def _operation_decw(self, value):
         return (value - 1) & 0xFFFF
 
-    def _operation_set1(self, value, bit):
-        return value | (2 ** bit)
+    def _operation_set1(self, value, bitweight):
+        return value | bitweight
 
-    def _operation_clr1(self, value, bit):
-        return value & ~(2 ** bit)
+    def _operation_clr1(self, value, bitweight):
+        return value & ~bitweight
 
     def _operation_or(self, a, b):
         result = a | b
@@ -2742,14 +2588,14 @@ class Processor(object):
     def _push(self, value):
         """Push a byte onto the stack.  Costs 1 bus clock."""
         # TODO add test for wrap-around behavior
-        sp = (self.read_sp() - 1) & 0xFFFF
+        sp = (self._sp - 1) & 0xFFFF
         self.write_sp(sp)
         self._inst_cycles += 1
         self.bus.write(sp, value)
 
     def _pop(self):
         """Pop a byte off the stack.  Costs 1 bus clock."""
-        sp = self.read_sp()
+        sp = self._sp
         self._inst_cycles += 1
         value = self.bus.read(sp)
         # TODO add test for wrap-around behavior
@@ -2767,15 +2613,88 @@ class Processor(object):
         high = self._pop()
         return (high << 8) + low
 
+    # Register file, SP, and PSW binding
+
+    def _map_changed(self):
+        """Bind to the memory backing the register file, SP, and PSW.
+        Called each time a device is added to the bus.
+
+        If the register file is a memory device, registers are accessed
+        directly in its bytearray instead of through the bus.  The offset
+        of the current register bank in it is cached and updated whenever
+        the RBS bits in PSW change.
+
+        SP and PSW are held in fields.  A ProcessorStatusDevice mapped at
+        FF1C-FF1E becomes a view of the fields.  Any other memory there is
+        kept as a mirror: the fields are written through to it, and it is
+        watched so that writes from the bus update the fields."""
+        bus = self.bus
+        memory = bus.memory_at(self.REGISTER_FILE_ADDRESS, 32)
+        if memory is None:
+            self._regs = _BusRegisterFile(bus, self.REGISTER_FILE_ADDRESS)
+            self._regs_offset = 0
+        else:
+            device, register = memory
+            self._regs = device.data
+            self._regs_offset = register
+
+        self._sp_mirror = self._psw_mirror = None
+        memory = bus.memory_at(self.SP_ADDRESS, 3)
+        if memory is not None and isinstance(memory[0], ProcessorStatusDevice):
+            device, register = memory
+            if device.processor is not self:
+                self._sp = _word(device.read(device.SPL), device.read(device.SPH))
+                self._psw = device.read(device.PSW) & 0b11111011
+                device.attach(self)
+        else:
+            self._sp_mirror = bus.memory_at(self.SP_ADDRESS, 2)
+            self._psw_mirror = bus.memory_at(self.PSW_ADDRESS, 1)
+            for mirror, size in ((self._sp_mirror, 2), (self._psw_mirror, 1)):
+                if mirror is not None:
+                    device, register = mirror
+                    device.add_watcher(self._status_modified)
+                    for offset in range(size):
+                        device.watch(register + offset)
+            self._load_sp_psw()
+        self._update_bank()
+
+    def _load_sp_psw(self):
+        """Load the SP and PSW fields from their mirrors"""
+        if self._sp_mirror is not None:
+            device, register = self._sp_mirror
+            self._sp = _word(device.data[register], device.data[register + 1])
+        if self._psw_mirror is not None:
+            device, register = self._psw_mirror
+            self._psw = device.data[register] & 0b11111011
+
+    def _status_modified(self, device, start, end):
+        """Watcher callback: reload SP and PSW if their mirrors were
+        written through the bus"""
+        touched = False
+        for mirror, size in ((self._sp_mirror, 2), (self._psw_mirror, 1)):
+            if mirror is None or mirror[0] is not device:
+                continue
+            register = mirror[1]
+            for offset in range(size):
+                if start <= register + offset < end:
+                    device.watch(register + offset)
+                    touched = True
+        if touched:
+            self._load_sp_psw()
+            self._update_bank()
+
+    def _update_bank(self):
+        """Recompute the offset of the current register bank in _regs"""
+        bank0 = self.REGISTERS_BASE_ADDRESS - self.REGISTER_FILE_ADDRESS
+        self._bank_base = self._regs_offset + bank0 - (self.read_rb() * 8)
+
     # Registers
 
     def read_gp_reg(self, regnum):
-        address = self.address_of_gp_reg(regnum)
-        return self.read_memory(address)
+        return self._regs[self._bank_base + regnum]
 
     def write_gp_reg(self, regnum, data):
-        address = self.address_of_gp_reg(regnum)
-        self.write_memory(address, data)
+        self._regs[self._bank_base + regnum] = data
 
     def address_of_gp_reg(self, regnum):
         """Return the address in RAM of a general purpose register:
@@ -2786,17 +2705,15 @@ class Processor(object):
     # Register Pairs
 
     def read_gp_regpair(self, regpairnum):
-        address = self.address_of_gp_regpair(regpairnum)
-        low = self.read_memory(address)
-        high = self.read_memory(address+1)
-        return _word(low, high)
+        index = self._bank_base + (regpairnum << 1)
+        regs = self._regs
+        return _word(regs[index], regs[index + 1])
 
     def write_gp_regpair(self, regpairnum, value):
-        address = self.address_of_gp_regpair(regpairnum)
-        low = value & 0xFF
-        high = value >> 8
-        self.write_memory(address, low)
-        self.write_memory(address+1, high)
+        index = self._bank_base + (regpairnum << 1)
+        regs = self._regs
+        regs[index] = value & 0xFF
+        regs[index + 1] = value >> 8
 
     def address_of_gp_regpair(self, regpairnum):
         """Return the address in RAM of a general purpose register
@@ -2808,46 +2725,53 @@ class Processor(object):
 
     def read_rb(self):
         """Reads PSW and returns a register bank number 0..3"""
-        rbs0 = (self.read_psw() & Flags.RBS0) >> 3
-        rbs1 = (self.read_psw() & Flags.RBS1) >> 4
+        rbs0 = (self._psw & Flags.RBS0) >> 3
+        rbs1 = (self._psw & Flags.RBS1) >> 4
         return rbs0 + rbs1
 
     def write_rb(self, value):
         """Writes a register bank number 0..3 to the PSW"""
         rbs0 = (value & 1) << 3
         rbs1 = (value & 2) << 4
-        self.write_psw(self.read_psw() & ~(Flags.RBS0 + Flags.RBS1))
-        self.write_psw(self.read_psw() | (rbs0 + rbs1))
+        self.write_psw(self._psw & ~(Flags.RBS0 + Flags.RBS1))
+        self.write_psw(self._psw | (rbs0 + rbs1))
 
     # SP
 
     def read_sp(self):
         """Read the Stack Pointer"""
-        low = self.read_memory(self.SP_ADDRESS)
-        high = self.read_memory(self.SP_ADDRESS+1)
-        return _word(low, high)
+        return self._sp
 
     def write_sp(self, value):
-        low = value & 0xFF
-        self.write_memory(self.SP_ADDRESS, low)
-        high = value >> 8
-        self.write_memory(self.SP_ADDRESS+1, high)
+        self._sp = value
+        if self._sp_mirror is not None:
+            device, register = self._sp_mirror
+            device.data[register] = value & 0xFF
+            device.data[register + 1] = value >> 8
 
     # PSW
 
     def read_psw(self):
         """Read the Processor Status Word"""
-        return self.read_memory(self.PSW_ADDRESS) & 0b11111011 # psw bit 2 always stuck off
+        return self._psw
 
     def write_psw(self, value):
         """Write the Processor Status Word"""
-        self.write_memory(self.PSW_ADDRESS, value & 0b11111011) # psw bit 2 always stuck off
+        value &= 0b11111011 # psw bit 2 always stuck off
+        changed = self._psw ^ value
+        self._psw = value
+        if self._psw_mirror is not None:
+            device, register = self._psw_mirror
+            device.data[register] = value
+        if changed & (Flags.RBS0 | Flags.RBS1):
+            self._update_bank()
 
     def _update_psw_z(self, value):
         """Set the Z flag in PSW if value is zero, clear otherwise"""
-        self.write_psw(self.read_psw() & ~Flags.Z)
+        psw = self._psw & ~Flags.Z
         if value == 0:
-            self.write_psw(self.read_psw() | Flags.Z)
+            psw |= Flags.Z
+        self.write_psw(psw)
 
     # Memory Helpers
 
@@ -2899,20 +2823,71 @@ def _addr16p(low, high):
         raise Exception("addr16p must be an even address")
     return addr16p
 
-def _reg(opcode):
-    return opcode & 0b111
-
-def _regpair(opcode):
-    return (opcode >> 1) & 0b11
-
-def _bit(opcode):
-    return (opcode & 0b01110000) >> 4
+def _specialize(function, fields):
+    """Copy an opcode handler with the operands encoded in its opcode bound
+    as the defaults of its arguments after the opcode, so that it does not
+    decode them on each call.  A bit number is bound as its bit weight."""
+    if not fields:
+        return function
+    if "bit" in fields:
+        fields["bitweight"] = 1 << fields.pop("bit")
+    code = function.__code__
+    names = code.co_varnames[2:code.co_argcount]  # after self, opcode
+    specialized = types.FunctionType(code, function.__globals__,
+                                     function.__name__,
+                                     tuple(fields[name] for name in names),
+                                     function.__closure__)
+    specialized.__qualname__ = function.__qualname__
+    return specialized
+
+def _data_accesses(instruction, opcode):
+    """Count the data operand bytes read and written by an instruction
+    through _bus_read() and _bus_write(): its memory operands other than
+    the stack and the CALLT and BRK vectors"""
+    prefix = [] if instruction.prefix is None else [instruction.prefix]
+    code = (prefix + [opcode, 0x20, 0x20, 0x20])[:instruction.length]
+    description = isa.describe(code)
+    count = 0
+    for operands in (description.memory_reads, description.memory_writes):
+        for address, size in operands:
+            if address != "[sp]":
+                count += size
+    if description.mnemonic.split(" ")[0] in ("callt", "brk"):
+        count -= 2  # the vector
+    return count
+
+# data operand bytes accessed by each instruction, by (prefix, opcode)
+_DATA_ACCESSES = dict(((instruction.prefix, opcode),
+                       _data_accesses(instruction, opcode))
+                      for instruction in isa.INSTRUCTIONS
+                      for opcode in instruction.opcodes)
+
+# version of the state returned by Processor.snapshot()
+_SNAPSHOT_FORMAT = 2
 
 def _resolve_rel(pc, displacement):
     if displacement & 0x80:
         displacement = -((displacement ^ 0xFF) + 1)
     return (pc + displacement) & 0xffff
 
+
+Processor._init_opcodes()
+
+
+class _BusRegisterFile(object):
+    """Register file accessed through the bus.  Used when the register
+    file is not backed by a single memory device."""
+
+    def __init__(self, bus, address):
+        self._bus = bus
+        self._address = address
+
+    def __getitem__(self, index):
+        return self._bus.read(self._address + index)
+
+    def __setitem__(self, index, value):
+        self._bus.write(self._address + index, value)
+
 class Registers(object):
     X = 0
     A = 1
@@ -2943,3 +2918,185 @@ class Flags(object):
 class RunState(object):
     RUNNING = 0
     HALTED = 1
+
+
+class CycleMode(object):
+    EXACT = 0
+    LITE = 1
+
+
+class StopReason(object):
+    MAX_CYCLES = 0
+    UNTIL_PC = 1
+
+
+# ALU lookup tables shared by all processors.  Each entry holds the 8-bit
+# result in its low byte and the resulting Z, AC, and CY flags (in their
+# PSW bit positions) in its high byte.
+
+_ARITHMETIC_FLAGS = Flags.Z | Flags.AC | Flags.CY
+
+
+def _entry(result, flags):
+    if result == 0:
+        flags |= Flags.Z
+    return result | (flags << 8)
+
+
+def _build_carry_table(entries, start):
+    # indexed by (carry << 16) | (a << 8) | b.  Every b with the same low
+    # nibble carries (or borrows) out of bit 3 alike, so each row is filled
+    # 16 entries at a time from a slice of entries[half_carry], which holds
+    # the entry for every total and is indexed by start(a, low_b, carry) +
+    # (b & 0xF0)
+    table = array('H', [0]) * 0x20000
+    for carry in (0, 1):
+        for a in range(0x100):
+            row = (carry << 16) | (a << 8)
+            for low_b in range(0x10):
+                half_carry, first = start(a, low_b, carry)
+                table[row + low_b:row + 0x100:0x10] = \
+                    entries[half_carry][first:first + 0x100:0x10]
+    return table
+
+
+def _build_add_table():
+    # the entries are indexed by a + b + carry
+    def entries(flags):
+        return array('H', [_entry(sum & 0xFF,
+                                  flags | (Flags.CY if sum > 0xFF else 0))
+                           for sum in range(0x200)])
+
+    def start(a, low_b, carry):
+        half_carry = (a & 0x0F) + low_b + carry > 0x0F
+        return half_carry, a + low_b + carry
+
+    return _build_carry_table((entries(0), entries(Flags.AC)), start)
+
+
+def _build_sub_table():
+    # the entries are indexed by 0xFF - (a - b - carry)
+    def entries(flags):
+        return array('H', [_entry(difference & 0xFF,
+                                  flags | (Flags.CY if difference < 0 else 0))
+                           for difference in range(0xFF, -0x101, -1)])
+
+    def start(a, low_b, carry):
+        half_carry = (a & 0x0F) < low_b + carry
+        return half_carry, 0xFF - a + low_b + carry
+
+    return _build_carry_table((entries(0), entries(Flags.AC)), start)
+
+
+def _build_inc_dec_table(delta):
+    # indexed by value
+    table = array('H')
+    for value in range(0x100):
+        flags = 0
+        if value & 0x0F == (0x0F if delta > 0 else 0):
+            flags |= Flags.AC
+        table.append(_entry((value + delta) & 0xFF, flags))
+    return table
+
+
+def _build_rotate_table(left, through_carry):
+    # indexed by (carry << 8) | a
+    table = array('H')
+    for carry in (0, 1):
+        for a in range(0x100):
+            if left:
+                carry_out = a >> 7
+                low = carry if through_carry else carry_out
+                rotated = ((a << 1) & 0xFF) | low
+            else:
+                carry_out = a & 1
+                high = carry if through_carry else carry_out
+                rotated = (a >> 1) | (high << 7)
+            table.append(rotated | (carry_out << 8))
+    return table
+
+
+def _adjba(a, ac, cy):
+    a_low_nib = a & 0x0f
+    a_high_nib = a >> 4
+
+    if ac == 0:
+        if a_low_nib <= 9:
+            if (a_high_nib <= 9) and (cy == 0):
+                a = a
+                cy = 0
+                ac = 0
+            if (a_high_nib >= 10) or (cy == 1):
+                a = (a + 0b01100000) & 0xff
+                cy = 1
+                ac = 0
+        else:
+            if (a_high_nib < 9) and (cy == 0):
+                a = (a + 0b00000110) & 0xff
+                cy = 0
+                ac = 1
+            if (a_high_nib >= 9) or (cy == 1):
+                a = (a + 0b01100110) & 0xff
+                cy = 1
+                ac = 1
+    else:
+        if (a_high_nib <= 9) and (cy == 0):
+            a = (a + 0b00000110) & 0xff
+            cy = 0
+            ac = 0
+        if (a_high_nib >= 10) or (cy == 1):
+            a = (a + 0b01100110) & 0xff
+            cy = 1
+            ac = 0
+    return a, ac, cy
+
+
+def _adjbs(a, ac, cy):
+    if ac == 0:
+        if cy == 0:
+            a = a
+            cy = 0
+            ac = 0
+        else:
+            a = (a - 0b01100000) & 0xff
+            cy = 1
+            ac = 0
+    else:
+        if cy == 0:
+            a = (a - 0b00000110) & 0xff
+            cy = 0
+            ac = 0
+        else:
+            a = (a - 0b01100110) & 0xff
+            cy = 1
+            ac = 0
+    return a, ac, cy
+
+
+def _build_decimal_adjust_table(adjust):
+    # indexed by ((psw & (AC | CY)) << 8) | a
+    table = array('H', [0] * ((Flags.AC | Flags.CY) + 1) * 0x100)
+    for ac in (0, 1):
+        for cy in (0, 1):
+            for a in range(0x100):
+                result, ac_out, cy_out = adjust(a, ac, cy)
+                flags = 0
+                if ac_out:
+                    flags |= Flags.AC
+                if cy_out:
+                    flags |= Flags.CY
+                index = (((Flags.AC if ac else 0) | cy) << 8) | a
+                table[index] = _entry(result, flags)
+    return table
+
+
+_ADD_TABLE = _build_add_table()
+_SUB_TABLE = _build_sub_table()
+_INC_TABLE = _build_inc_dec_table(1)
+_DEC_TABLE = _build_inc_dec_table(-1)
+_ROR_TABLE = _build_rotate_table(left=False, through_carry=False)
+_RORC_TABLE = _build_rotate_table(left=False, through_carry=True)
+_ROL_TABLE = _build_rotate_table(left=True, through_carry=False)
+_ROLC_TABLE = _build_rotate_table(left=True, through_carry=True)
+_ADJBA_TABLE = _build_decimal_adjust_table(_adjba)
+_ADJBS_TABLE = _build_decimal_adjust_table(_adjbs)
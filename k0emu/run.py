@@ -1,20 +1,37 @@
 '''
 Usage: k0emu <rom.bin>
-       k0emu --watch <rom.bin>
+       k0emu --watch [--cache-dir <dir>] <rom.bin>
+       k0emu --farm [-j <workers>] <scenarios.jsonl>
        k0emu --map
 
 '''
 import sys
 
 from k0dasm.disassemble import disassemble
+from k0emu.checkpoint import CheckpointCache
 from k0emu.processor import RegisterPairs, Flags
 from k0emu.system import make_processor
+from k0emu.translate import BlockTranslator, TranslationCache
 
 
 class Runner(object):
-    def __init__(self, proc=None, output=None):
+    WATCH_INTERVAL_CYCLES = 4190  # ~1ms at 4.19MHz
+
+    def __init__(self, proc=None, output=None, cache_dir=None):
+        """cache_dir: if given, watch() runs translated blocks and keeps
+        them in a TranslationCache in this directory, so later runs of the
+        same ROM image do not have to translate them again.  advance()
+        keeps its checkpoints in a CheckpointCache in the same directory.
+        Translated blocks are run from the cache, so the directory must
+        only be writable by the user running the emulator."""
         self.proc = proc or make_processor()
         self.output = output or sys.stdout
+        self.translator = None
+        self.checkpoints = None
+        if cache_dir is not None:
+            self.translator = BlockTranslator(self.proc,
+                                              TranslationCache(cache_dir))
+            self.checkpoints = CheckpointCache(cache_dir)
 
     def load(self, rom_data):
         self.proc.bus.device("rom").load(0, rom_data)
@@ -37,8 +54,7 @@ class Runner(object):
             int(bool(psw & Flags.CY)),
         ))
         parts.append("T=%d" % proc.total_cycles)
-        disp = bytes(proc.bus.read(0xF19A + i) for i in range(11))
-        text = ''.join(chr(b) if 0x20 <= b <= 0x7E else '.' for b in disp)
+        text = display_text(proc)
         led = not bool(proc.bus.read(0xFF03) & 0x08)  # P3.3 active low
         parts.append("[%s] %s" % (text, "(ALM)" if led else "(   )"))
         return ' '.join(parts)
@@ -82,24 +98,52 @@ class Runner(object):
         proc.bus.write(0xFF00, p0 & ~0x10)
         intc.write(intc.IF0L, intc.read(intc.IF0L) | 0x20)
         # Hold for ~500ms (2095000 cycles at 4.19MHz)
-        hold_until = proc.total_cycles + 2095000
-        while proc.total_cycles < hold_until:
-            proc.step()
+        proc.run(2095000)
         # Release: P0.4 high + INTP4 rising edge
         p0 = proc.bus.read(0xFF00)
         proc.bus.write(0xFF00, p0 | 0x10)
         intc.write(intc.IF0L, intc.read(intc.IF0L) | 0x20)
 
+    def run_cycles(self, max_cycles):
+        """Execute instructions until at least max_cycles have elapsed,
+        with the translator if there is one"""
+        if self.translator is None:
+            self.proc.run(max_cycles)
+            return
+        cycles = 0
+        while cycles < max_cycles:
+            pc, executed = self.translator.execute(max_cycles - cycles)
+            cycles += executed
+
+    def advance(self, milestone, max_cycles):
+        """Run for at least max_cycles to reach the named milestone, such as
+        the end of the firmware's initialization.  If there is a cache, the
+        checkpoint saved for the milestone by an earlier run from the same
+        state is restored instead.  Returns True if it was restored."""
+        if self.checkpoints is None:
+            self.run_cycles(max_cycles)
+            return False
+        return self.checkpoints.reach(
+            self.proc, milestone, lambda proc: self.run_cycles(max_cycles))
+
     def watch(self):
         """Run the processor, printing only when display or LED changes.
         Stops on unimplemented opcode or KeyboardInterrupt."""
+        try:
+            self._watch()
+        finally:
+            if self.translator is not None:
+                self.translator.save_cache()
+
+    def _watch(self):
         proc = self.proc
         last_disp = None
         last_led = None
         scontact_on = False
         while True:
             try:
-                proc.step()
+                # Display and LED are checked about once per millisecond
+                self.run_cycles(self.WATCH_INTERVAL_CYCLES)
                 # Turn S-Contact on after 8 seconds (simulate key turn)
                 if not scontact_on and proc.total_cycles > 8 * 4190000:
                     self.output.write("--- S-CONTACT ON ---\n")
@@ -110,7 +154,7 @@ class Runner(object):
                 disp = bytes(proc.bus.read(0xF19A + i) for i in range(11))
                 led = not bool(proc.bus.read(0xFF03) & 0x08)
                 if disp != last_disp or led != last_led:
-                        text = ''.join(chr(b) if 0x20 <= b <= 0x7E else '.' for b in disp)
+                        text = display_text(proc)
                         sim = proc.total_cycles / 4190000
                         t30 = proc.bus.read(0xF18D) * 0.1
                         self.output.write("%.3fs [%s] %s %.1fV\n" % (
@@ -125,6 +169,13 @@ class Runner(object):
                 break
 
 
+def display_text(proc):
+    """Return the text in the display buffer, with unprintable characters
+    shown as dots"""
+    disp = bytes(proc.bus.read(0xF19A + i) for i in range(11))
+    return ''.join(chr(b) if 0x20 <= b <= 0x7E else '.' for b in disp)
+
+
 def print_memory_map(output=None):
     if output is None:
         output = sys.stdout
@@ -143,12 +194,22 @@ def main():
         print_memory_map()
         sys.exit(0)
 
+    if sys.argv[1] == '--farm':
+        from k0emu import farm  # farm imports this module
+        farm.main(sys.argv[2:])
+        sys.exit(0)
+
     if sys.argv[1] == '--watch':
-        if len(sys.argv) < 3:
+        args = sys.argv[2:]
+        cache_dir = None
+        if args[:1] == ['--cache-dir']:
+            cache_dir = args[1] if len(args) > 1 else None
+            args = args[2:]
+        if len(args) < 1:
             sys.stderr.write(__doc__)
             sys.exit(1)
-        runner = Runner()
-        with open(sys.argv[2], 'rb') as f:
+        runner = Runner(cache_dir=cache_dir)
+        with open(args[0], 'rb') as f:
             runner.load(f.read())
         runner.watch()
         sys.exit(0)
@@ -7,12 +7,16 @@ from k0emu.i2c import StubI2CTarget
 from k0emu.processor import Processor
 
 
-def make_processor():
+def make_processor(cycle_mode=None, tick_quantum=None, rom_buffer=None):
     """Build a Processor with the default bus and memory layout
-    for the uPD78F0831Y."""
-    proc = Processor()
-
-    rom = MemoryDevice("rom", size=0xF000, fill=0xFF, writable=False)
+    for the uPD78F0831Y.  cycle_mode and tick_quantum are passed to
+    the Processor.  rom_buffer, if given, is a buffer of at least 60K
+    (such as an mmap of a ROM image) to back the ROM instead of loading
+    an image into it."""
+    proc = Processor(cycle_mode=cycle_mode, tick_quantum=tick_quantum)
+
+    rom = MemoryDevice("rom", size=0xF000, fill=0xFF, writable=False,
+                       buffer=rom_buffer)
     proc.bus.add_device(rom, (0x0000, 0xEFFF))
 
     expansion_ram = MemoryDevice("expansion_ram", size=0x0800)
@@ -1,6 +1,8 @@
+import copy
 import unittest
 from k0emu.bus import Bus
-from k0emu.devices import MemoryDevice
+from k0emu.devices import (BaseDevice, MemoryDevice, PendingInterrupt,
+                           InterruptControllerDevice)
 
 
 class _FakeProcessor(object):
@@ -11,6 +13,24 @@ class _FakeProcessor(object):
         self.reset_count += 1
 
 
+class _ScheduledDevice(BaseDevice):
+    """Records each tick as (name, bus cycle, cycles)."""
+    clocked = False
+    volatile = False
+
+    def __init__(self, name, log):
+        super().__init__(name)
+        self.size = 1
+        self.log = log
+
+    def tick(self, cycles):
+        self.log.append((self.name, self.bus.cycles, cycles))
+
+
+class _ClockedDevice(_ScheduledDevice):
+    clocked = True
+
+
 class BusTests(unittest.TestCase):
 
     # read/write routing
@@ -170,6 +190,288 @@ class BusTests(unittest.TestCase):
         bus.tick(7)
         self.assertEqual(mem.ticks, 10)
 
+    def test_tick_advances_cycles(self):
+        bus = Bus(_FakeProcessor())
+        bus.tick(3)
+        bus.tick(7)
+        self.assertEqual(bus.cycles, 10)
+
+    def test_tick_ticks_clocked_devices_every_time(self):
+        bus = Bus(_FakeProcessor())
+        log = []
+        bus.add_device(_ClockedDevice("clocked", log), (0x1000, 0x1000))
+        bus.tick(3)
+        bus.tick(7)
+        self.assertEqual(log, [("clocked", 3, 3), ("clocked", 10, 7)])
+
+    # scheduling
+
+    def test_scheduled_device_not_ticked_before_deadline(self):
+        bus = Bus(_FakeProcessor())
+        log = []
+        dev = _ScheduledDevice("dev", log)
+        bus.add_device(dev, (0x1000, 0x1000))
+        dev.schedule(10)
+        bus.tick(9)
+        self.assertEqual(log, [])
+
+    def test_scheduled_device_synced_once_deadline_is_reached(self):
+        bus = Bus(_FakeProcessor())
+        log = []
+        dev = _ScheduledDevice("dev", log)
+        bus.add_device(dev, (0x1000, 0x1000))
+        dev.schedule(10)
+        bus.tick(4)
+        bus.tick(8)
+        bus.tick(8)
+        self.assertEqual(log, [("dev", 12, 12)])
+
+    def test_reschedule_replaces_deadline(self):
+        bus = Bus(_FakeProcessor())
+        log = []
+        dev = _ScheduledDevice("dev", log)
+        bus.add_device(dev, (0x1000, 0x1000))
+        dev.schedule(5)
+        dev.schedule(20)
+        bus.tick(10)
+        self.assertEqual(log, [])
+        bus.tick(10)
+        self.assertEqual(log, [("dev", 20, 20)])
+
+    def test_schedule_none_cancels_deadline(self):
+        bus = Bus(_FakeProcessor())
+        log = []
+        dev = _ScheduledDevice("dev", log)
+        bus.add_device(dev, (0x1000, 0x1000))
+        dev.schedule(5)
+        dev.schedule(None)
+        bus.tick(10)
+        self.assertEqual(log, [])
+        self.assertEqual(bus.next_deadline, Bus.NEVER)
+
+    def test_events_dispatched_in_deadline_order(self):
+        bus = Bus(_FakeProcessor())
+        log = []
+        first = _ScheduledDevice("first", log)
+        second = _ScheduledDevice("second", log)
+        bus.add_device(first, (0x1000, 0x1000))
+        bus.add_device(second, (0x1001, 0x1001))
+        first.schedule(8)
+        second.schedule(4)
+        bus.tick(10)
+        self.assertEqual([name for name, _, _ in log], ["second", "first"])
+
+    def test_events_with_same_deadline_dispatched_in_device_order(self):
+        bus = Bus(_FakeProcessor())
+        log = []
+        first = _ScheduledDevice("first", log)
+        second = _ScheduledDevice("second", log)
+        bus.add_device(first, (0x1000, 0x1000))
+        bus.add_device(second, (0x1001, 0x1001))
+        second.schedule(4)
+        first.schedule(4)
+        bus.tick(4)
+        self.assertEqual([name for name, _, _ in log], ["first", "second"])
+
+    def test_next_deadline_is_earliest_event(self):
+        bus = Bus(_FakeProcessor())
+        log = []
+        first = _ScheduledDevice("first", log)
+        second = _ScheduledDevice("second", log)
+        bus.add_device(first, (0x1000, 0x1000))
+        bus.add_device(second, (0x1001, 0x1001))
+        bus.tick(100)
+        first.schedule(30)
+        second.schedule(20)
+        self.assertEqual(bus.next_deadline, 120)
+        bus.tick(25)
+        self.assertEqual(bus.next_deadline, 130)
+
+    # tick quantum
+
+    def test_tick_quantum_ticks_clocked_devices_once_per_quantum(self):
+        bus = Bus(_FakeProcessor())
+        log = []
+        bus.add_device(_ClockedDevice("clocked", log), (0x1000, 0x1000))
+        bus.set_tick_quantum(16)
+        for _ in range(10):
+            bus.tick(3)
+        self.assertEqual(log, [("clocked", 18, 18)])
+        self.assertEqual(bus.cycles, 30)
+
+    def test_tick_quantum_rounds_deadline_up_to_quantum(self):
+        bus = Bus(_FakeProcessor())
+        log = []
+        dev = _ScheduledDevice("dev", log)
+        bus.add_device(dev, (0x1000, 0x1000))
+        bus.set_tick_quantum(16)
+        dev.schedule(10)
+        self.assertEqual(bus.next_deadline, 16)
+        bus.tick(12)
+        self.assertEqual(log, [])
+        bus.tick(5)
+        self.assertEqual(log, [("dev", 17, 17)])
+
+    def test_tick_quantum_moves_pending_events(self):
+        bus = Bus(_FakeProcessor())
+        log = []
+        dev = _ScheduledDevice("dev", log)
+        bus.add_device(dev, (0x1000, 0x1000))
+        dev.schedule(10)
+        bus.set_tick_quantum(16)
+        self.assertEqual(bus.next_deadline, 16)
+
+    def test_tick_quantum_overdue_deadline_is_next_boundary(self):
+        bus = Bus(_FakeProcessor())
+        log = []
+        dev = _ScheduledDevice("dev", log)
+        bus.add_device(dev, (0x1000, 0x1000))
+        bus.set_tick_quantum(16)
+        bus.tick(20)
+        dev.schedule(0)
+        self.assertEqual(bus.next_deadline, 32)
+
+    def test_tick_quantum_none_restores_ticking_every_time(self):
+        bus = Bus(_FakeProcessor())
+        log = []
+        bus.add_device(_ClockedDevice("clocked", log), (0x1000, 0x1000))
+        bus.set_tick_quantum(16)
+        bus.tick(3)
+        bus.set_tick_quantum(None)
+        bus.tick(2)
+        self.assertEqual(log, [("clocked", 3, 3), ("clocked", 5, 2)])
+        self.assertIsNone(bus.tick_quantum)
+
+    def test_tick_quantum_must_be_positive(self):
+        bus = Bus(_FakeProcessor())
+        self.assertRaises(ValueError, bus.set_tick_quantum, 0)
+
+    # save states
+
+    def test_load_state_restores_cycles_and_events(self):
+        bus = Bus(_FakeProcessor())
+        log = []
+        dev = _ScheduledDevice("dev", log)
+        bus.add_device(dev, (0x1000, 0x1000))
+        bus.tick(100)
+        dev.schedule(10)
+        state = bus.save_state()
+        bus.tick(5)
+        dev.schedule(None)
+        bus.load_state(state)
+        self.assertEqual(bus.cycles, 100)
+        self.assertEqual(bus.next_deadline, 110)
+        bus.tick(10)
+        self.assertEqual(log, [("dev", 110, 110)])
+
+    def test_load_state_restores_pending_interrupt(self):
+        bus = Bus(_FakeProcessor())
+        bus.pending_interrupt = PendingInterrupt(3, True, 0x000A)
+        state = bus.save_state()
+        bus.pending_interrupt = None
+        bus.load_state(state)
+        pending = bus.pending_interrupt
+        self.assertEqual((pending.source_index, pending.high_priority,
+                          pending.vector_address), (3, True, 0x000A))
+
+    def test_load_state_uses_controller_pending_interrupt(self):
+        bus = Bus(_FakeProcessor())
+        intc = InterruptControllerDevice("intc")
+        bus.add_device(intc, (0xFFE0, 0xFFEB))
+        bus.set_interrupt_controller(intc)
+        bus.pending_interrupt = intc.preallocated_interrupt(3, True)
+        state = bus.save_state()
+        bus.pending_interrupt = None
+        bus.load_state(state)
+        self.assertIs(bus.pending_interrupt,
+                      intc.preallocated_interrupt(3, True))
+
+    def test_load_state_of_unknown_interrupt_source_raises(self):
+        bus = Bus(_FakeProcessor())
+        intc = InterruptControllerDevice("intc")
+        bus.add_device(intc, (0xFFE0, 0xFFEB))
+        bus.set_interrupt_controller(intc)
+        state = bus.save_state()
+        state = state[:4] + ((99, False, 0x0004),) + state[5:]
+        self.assertRaises(ValueError, bus.load_state, state)
+        self.assertIsNone(bus.pending_interrupt)
+
+    def test_load_state_after_device_added(self):
+        bus = Bus(_FakeProcessor())
+        bus.add_device(MemoryDevice("ram", size=16), (0x1000, 0x100F))
+        bus.load_state(bus.save_state())
+        rom = MemoryDevice("rom", size=32)
+        bus.add_device(rom, (0x2000, 0x201F))
+        rom.write(0, 0x42)
+        state = bus.save_state()
+        rom.write(0, 0x00)
+        bus.load_state(state)
+        self.assertEqual(rom.read(0), 0x42)
+
+    def test_load_state_of_different_devices_raises(self):
+        bus = Bus(_FakeProcessor())
+        bus.add_device(MemoryDevice("ram", size=16), (0x1000, 0x100F))
+        state = bus.save_state()
+        other = Bus(_FakeProcessor())
+        other.add_device(MemoryDevice("rom", size=16), (0x1000, 0x100F))
+        self.assertRaises(ValueError, other.load_state, state)
+
+    def test_load_state_of_different_device_types_raises(self):
+        bus = Bus(_FakeProcessor())
+        bus.add_device(MemoryDevice("mem", size=1), (0x1000, 0x1000))
+        state = bus.save_state()
+        other = Bus(_FakeProcessor())
+        other.add_device(_ScheduledDevice("mem", []), (0x1000, 0x1000))
+        self.assertRaises(ValueError, other.load_state, state)
+
+    def test_load_state_that_does_not_match_changes_nothing(self):
+        bus = Bus(_FakeProcessor())
+        ram = MemoryDevice("ram", size=16)
+        bus.add_device(ram, (0x1000, 0x100F))
+        bus.add_device(MemoryDevice("rom", size=16), (0x2000, 0x200F))
+        bus.tick(100)
+        state = bus.save_state()
+        other = Bus(_FakeProcessor())
+        other_ram = MemoryDevice("ram", size=16, fill=0xAA)
+        other.add_device(other_ram, (0x1000, 0x100F))
+        other.add_device(MemoryDevice("rom", size=32), (0x2000, 0x201F))
+        self.assertRaises(ValueError, other.load_state, state)
+        self.assertEqual(bytes(other_ram.data), bytes([0xAA] * 16))
+        self.assertEqual(other.cycles, 0)
+
+    # volatile reads
+
+    def test_custom_device_is_clocked_and_volatile(self):
+        class CountingDevice(BaseDevice):
+            def __init__(self, name):
+                super().__init__(name)
+                self.size = 1
+
+        bus = Bus(_FakeProcessor())
+        dev = CountingDevice("counter")
+        bus.add_device(dev, (0x1000, 0x1000))
+        bus.tick(5)
+        bus.tick(15)
+        self.assertEqual(dev._ticks, 20)
+        self.assertTrue(bus.is_volatile(0x1000))
+
+    def test_memory_and_scheduled_devices_are_not_volatile(self):
+        bus = Bus(_FakeProcessor())
+        bus.add_device(MemoryDevice("mem", size=1), (0x1000, 0x1000))
+        bus.add_device(_ScheduledDevice("dev", []), (0x1001, 0x1001))
+        self.assertFalse(bus.is_volatile(0x1000))
+        self.assertFalse(bus.is_volatile(0x1001))
+        self.assertFalse(bus.is_volatile(0x2000))  # unmapped
+
+    def test_clocked_and_volatile_devices_are_volatile(self):
+        bus = Bus(_FakeProcessor())
+        volatile = _ScheduledDevice("volatile", [])
+        volatile.volatile = True
+        bus.add_device(_ClockedDevice("clocked", []), (0x1000, 0x1000))
+        bus.add_device(volatile, (0x1001, 0x1001))
+        self.assertTrue(bus.is_volatile(0x1000))
+        self.assertTrue(bus.is_volatile(0x1001))
+
     # device lookup by name
 
     def test_device_finds_by_name(self):
@@ -203,6 +505,139 @@ class BusTests(unittest.TestCase):
         bus[0x1001] = 0x42
         self.assertEqual(mem.read(1), 0x42)
 
+    # copying
+
+    def test_deepcopy_maps_copied_devices(self):
+        bus = Bus(_FakeProcessor())
+        mem = MemoryDevice("ram", size=0x200)
+        bus.add_device(mem, (0x1080, 0x127F))
+        dev = _ScheduledDevice("dev", [])
+        dev.size = 2
+        bus.add_device(dev, (0x2000, 0x2000), (0x2002, 0x2002))
+        clone = copy.deepcopy(bus)
+        clone_mem = clone.device("ram")
+        clone_dev = clone.device("dev")
+        self.assertIsNot(clone_mem, mem)
+        self.assertEqual(clone.device_at(0x1100), (clone_mem, 0x80))
+        self.assertEqual(clone.device_at(0x2002), (clone_dev, 1))
+        self.assertEqual(clone.device_at(0x2001), (clone._unmapped, 0))
+        self.assertEqual(clone.address_of(clone_mem, 0x80), 0x1100)
+        clone.write(0x1100, 0x11)  # page backed by the copied memory
+        self.assertEqual(clone_mem.read(0x80), 0x11)
+        self.assertEqual(mem.read(0x80), 0x00)
+        clone_dev.schedule(5)
+        self.assertEqual(clone.next_deadline, 5)
+        self.assertEqual(bus.next_deadline, Bus.NEVER)
+
+    def test_deepcopy_shares_read_only_memory(self):
+        bus = Bus(_FakeProcessor())
+        bus.add_device(MemoryDevice("rom", size=0x100, writable=False),
+                       (0x1000, 0x10FF))
+        clone = copy.deepcopy(bus)
+        self.assertIs(clone.device("rom").data, bus.device("rom").data)
+        self.assertIsNot(clone.device("rom").watched,
+                         bus.device("rom").watched)
+
+    # memory pages
+
+    def test_read_page_backed_by_memory(self):
+        bus = Bus(_FakeProcessor())
+        mem = MemoryDevice("ram", size=0x200)
+        bus.add_device(mem, (0x1080, 0x127F))  # page 0x11 is register 0x80
+        mem.write(0x80, 0x11)
+        mem.write(0x17F, 0x22)
+        self.assertEqual(bus.read(0x1100), 0x11)
+        self.assertEqual(bus.read(0x11FF), 0x22)
+
+    def test_write_page_backed_by_memory(self):
+        bus = Bus(_FakeProcessor())
+        mem = MemoryDevice("ram", size=0x200)
+        bus.add_device(mem, (0x1080, 0x127F))
+        bus.write(0x1100, 0x11)
+        bus.write(0x1080, 0x22)  # partial page
+        self.assertEqual(mem.read(0x80), 0x11)
+        self.assertEqual(mem.read(0x00), 0x22)
+
+    def test_write_page_backed_by_read_only_memory_is_ignored(self):
+        bus = Bus(_FakeProcessor())
+        rom = MemoryDevice("rom", size=0x100, fill=0xFF, writable=False)
+        bus.add_device(rom, (0x1000, 0x10FF))
+        bus.write(0x1042, 0x00)
+        self.assertEqual(bus.read(0x1042), 0xFF)
+
+    def test_write_page_backed_by_memory_informs_watchers(self):
+        bus = Bus(_FakeProcessor())
+        mem = MemoryDevice("ram", size=0x100)
+        bus.add_device(mem, (0x1000, 0x10FF))
+        calls = []
+        mem.add_watcher(lambda device, start, end: calls.append((start, end)))
+        mem.watch(0x42)
+        bus.write(0x1042, 0x99)
+        bus.write(0x1042, 0x98)  # watch has been cleared
+        self.assertEqual(calls, [(0x42, 0x43)])
+        self.assertEqual(mem.read(0x42), 0x98)
+
+    def test_page_shared_by_devices_uses_devices(self):
+        bus = Bus(_FakeProcessor())
+        mem = MemoryDevice("ram", size=0x80)
+        bus.add_device(mem, (0x1000, 0x107F))
+        log = []
+        dev = _ScheduledDevice("dev", log)
+        bus.add_device(dev, (0x1080, 0x1080))
+        bus.write(0x1010, 0x42)
+        self.assertEqual(bus.read(0x1010), 0x42)
+        self.assertEqual(bus.read(0x1080), 0x00)
+
+    def test_page_backed_by_memory_subclass_uses_device(self):
+        class LoggingMemory(MemoryDevice):
+            def read(self, register):
+                log.append(("read", register))
+                return super().read(register)
+
+            def write(self, register, value):
+                log.append(("write", register, value))
+                super().write(register, value)
+
+        log = []
+        bus = Bus(_FakeProcessor())
+        bus.add_device(LoggingMemory("mem", size=0x100), (0x1000, 0x10FF))
+        bus.write(0x1042, 0x99)
+        self.assertEqual(bus.read(0x1042), 0x99)
+        self.assertEqual(log, [("write", 0x42, 0x99), ("read", 0x42)])
+
+    # memory lookup
+
+    def test_memory_at_returns_device_and_register(self):
+        proc = _FakeProcessor()
+        bus = Bus(proc)
+        mem = MemoryDevice("ram", size=4)
+        bus.add_device(mem, (0x1000, 0x1003))
+        self.assertEqual(bus.memory_at(0x1001, 3), (mem, 1))
+
+    def test_memory_at_returns_none_across_devices(self):
+        proc = _FakeProcessor()
+        bus = Bus(proc)
+        mem_a = MemoryDevice("a", size=2)
+        mem_b = MemoryDevice("b", size=2)
+        bus.add_device(mem_a, (0x1000, 0x1001))
+        bus.add_device(mem_b, (0x1002, 0x1003))
+        self.assertIsNone(bus.memory_at(0x1000, 4))
+
+    def test_memory_at_returns_none_when_unmapped(self):
+        proc = _FakeProcessor()
+        bus = Bus(proc)
+        self.assertIsNone(bus.memory_at(0x1000, 1))
+
+    # map listeners
+
+    def test_map_listener_called_when_device_added(self):
+        proc = _FakeProcessor()
+        bus = Bus(proc)
+        calls = []
+        bus.add_map_listener(lambda: calls.append(len(bus.memory_map())))
+        bus.add_device(MemoryDevice("ram", size=4), (0x1000, 0x1003))
+        self.assertEqual(calls, [3])
+
     # memory map
 
     def test_memory_map_empty_bus(self):
@@ -0,0 +1,135 @@
+import marshal
+import os
+import tempfile
+import unittest
+from unittest import mock
+from k0emu import checkpoint, translate
+from k0emu.checkpoint import CheckpointCache
+from k0emu.devices import MemoryDevice
+from k0emu.system import make_processor
+
+
+def _rom_data(increment=0x41):
+    rom_data = bytearray([0x80, 0x00])  # reset vector
+    rom_data.extend(bytes(0x80 - len(rom_data)))
+    rom_data.extend([
+        0xee, 0x1c, 0x00, 0xfe,  # movw sp,#0fe00h
+        0x16, 0x00, 0xf0,        # movw hl,#0f000h
+        0x87,                    # mov a,[hl]
+        increment,               # inc a
+        0x97,                    # mov [hl],a
+        0xfa, 0xfb])             # br 0087h
+    return rom_data
+
+
+def _make_booting_processor(rom_data):
+    proc = make_processor()
+    proc.bus.device("rom").load(0, rom_data)
+    proc.bus.reset()
+    return proc
+
+
+class CheckpointCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self._tempdir = tempfile.TemporaryDirectory()
+        self.directory = self._tempdir.name
+        self.runs = []
+
+    def tearDown(self):
+        self._tempdir.cleanup()
+
+    def _boot(self, proc):
+        self.runs.append(proc)
+        proc.run(10000)
+
+    def _reach(self, proc, milestone="booted"):
+        cache = CheckpointCache(self.directory)
+        return cache.reach(proc, milestone, self._boot)
+
+    # reaching milestones
+
+    def test_first_reach_runs_and_saves_snapshot(self):
+        proc = _make_booting_processor(_rom_data())
+        self.assertFalse(self._reach(proc))
+        self.assertEqual(self.runs, [proc])
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+
+    def test_later_reach_restores_snapshot(self):
+        expected = _make_booting_processor(_rom_data())
+        self._reach(expected)
+        proc = _make_booting_processor(_rom_data())
+        self.assertTrue(self._reach(proc))
+        self.assertEqual(self.runs, [expected])
+        self.assertEqual(proc.snapshot(), expected.snapshot())
+
+    def test_milestones_reached_in_turn(self):
+        for _ in range(2):
+            proc = _make_booting_processor(_rom_data())
+            self._reach(proc, "booted")
+            self._reach(proc, "running")
+        self.assertEqual(len(self.runs), 2)
+        self.assertEqual(proc.snapshot(), self.runs[0].snapshot())
+
+    # invalidation
+
+    def test_different_milestone_runs_again(self):
+        self._reach(_make_booting_processor(_rom_data()), "booted")
+        self.assertFalse(self._reach(_make_booting_processor(_rom_data()),
+                                     "other"))
+
+    def test_different_rom_runs_again(self):
+        self._reach(_make_booting_processor(_rom_data()))
+        proc = _make_booting_processor(_rom_data(increment=0x51))  # dec a
+        self.assertFalse(self._reach(proc))
+
+    def test_different_memory_map_runs_again(self):
+        self._reach(_make_booting_processor(_rom_data()))
+        proc = _make_booting_processor(_rom_data())
+        proc.bus.add_device(MemoryDevice("extra", size=1), (0xFF90, 0xFF90))
+        self.assertFalse(self._reach(proc))
+
+    def test_different_interrupt_connections_run_again(self):
+        self._reach(_make_booting_processor(_rom_data()))
+        proc = _make_booting_processor(_rom_data())
+        intc = proc.bus.device("intc")
+        adc = proc.bus.device("adc")
+        intc.connect(adc, adc.INT_COMPLETE, intc.INTP0)
+        self.assertFalse(self._reach(proc))
+
+    def test_snapshot_that_does_not_match_runs_from_start(self):
+        # a snapshot taken later, with the state of the last device
+        # changed so that it no longer matches the device
+        other = _make_booting_processor(_rom_data())
+        other.run(10000)
+        snapshot_format, state, bus_state = marshal.loads(other.snapshot())
+        kinds, device_states = bus_state[:2]
+        device_states = device_states[:-1] + ((device_states[-1], 0),)
+        snapshot = marshal.dumps((snapshot_format, state,
+                                  (kinds, device_states) + bus_state[2:]))
+        proc = _make_booting_processor(_rom_data())
+        cache = CheckpointCache(self.directory)
+        cache.store(cache._key(proc, "booted"), snapshot)
+        expected = _make_booting_processor(_rom_data())
+        self._boot(expected)
+        self.assertFalse(self._reach(proc))
+        self.assertEqual(proc.snapshot(), expected.snapshot())
+
+    def test_different_emulator_code_runs_again(self):
+        self._reach(_make_booting_processor(_rom_data()))
+        with mock.patch("k0emu.checkpoint._FINGERPRINT", b"changed"):
+            self.assertFalse(self._reach(_make_booting_processor(_rom_data())))
+        self.assertEqual(len(self.runs), 2)
+
+    def test_translator_is_part_of_fingerprint(self):
+        with mock.patch("k0emu.checkpoint._FINGERPRINT", None):
+            with mock.patch("k0emu.checkpoint.fingerprint",
+                            side_effect=lambda modules: list(modules)):
+                self.assertIn(translate, checkpoint._fingerprint())
+
+    def test_unreadable_snapshot_runs_again(self):
+        self._reach(_make_booting_processor(_rom_data()))
+        for name in os.listdir(self.directory):
+            with open(os.path.join(self.directory, name), "wb") as f:
+                f.write(b"garbage")
+        self.assertFalse(self._reach(_make_booting_processor(_rom_data())))
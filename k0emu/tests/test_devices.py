@@ -1,10 +1,15 @@
+import mmap
+import tempfile
 import unittest
+from multiprocessing import shared_memory
 from k0emu.bus import Bus
 from k0emu.devices import (MemoryDevice, RegisterFileDevice,
                            ProcessorStatusDevice, InterruptControllerDevice,
                            I2CControllerDevice, PortWithEdgeDetectionDevice,
-                           WatchdogDevice, WatchTimerDevice)
+                           WatchdogDevice, WatchTimerDevice,
+                           FreeRunningTimerDevice)
 from k0emu.i2c import BaseI2CTarget, StubI2CTarget
+from k0emu.processor import Processor
 
 
 class MemoryDeviceTests(unittest.TestCase):
@@ -69,6 +74,43 @@ class MemoryDeviceTests(unittest.TestCase):
         mem = MemoryDevice("test", size=256)
         self.assertEqual(mem.size, 256)
 
+    # write watching
+
+    def test_write_to_watched_register_notifies_watchers(self):
+        mem = MemoryDevice("test", size=4)
+        calls = []
+        mem.add_watcher(lambda device, start, end: calls.append((device, start, end)))
+        mem.watch(2)
+        mem.write(1, 0x42)
+        self.assertEqual(calls, [])
+        mem.write(2, 0x42)
+        self.assertEqual(calls, [(mem, 2, 3)])
+
+    def test_watch_is_cleared_after_notifying(self):
+        mem = MemoryDevice("test", size=4)
+        calls = []
+        mem.add_watcher(lambda device, start, end: calls.append((start, end)))
+        mem.watch(0)
+        mem.write(0, 0x01)
+        mem.write(0, 0x02)
+        self.assertEqual(calls, [(0, 1)])
+
+    def test_load_over_watched_register_notifies_watchers(self):
+        mem = MemoryDevice("test", size=4)
+        calls = []
+        mem.add_watcher(lambda device, start, end: calls.append((start, end)))
+        mem.watch(3)
+        mem.load(1, [0x00, 0x01, 0x02])
+        self.assertEqual(calls, [(1, 4)])
+
+    def test_write_ignored_when_not_writable_does_not_notify(self):
+        mem = MemoryDevice("test", size=4, writable=False)
+        calls = []
+        mem.add_watcher(lambda device, start, end: calls.append((start, end)))
+        mem.watch(0)
+        mem.write(0, 0x42)
+        self.assertEqual(calls, [])
+
     # tick
 
     def test_tick_accumulates(self):
@@ -77,6 +119,85 @@ class MemoryDeviceTests(unittest.TestCase):
         mem.tick(5)
         self.assertEqual(mem.ticks, 8)
 
+    # buffers
+
+    def test_buffer_backs_data(self):
+        buffer = bytearray(4)
+        mem = MemoryDevice("test", buffer=buffer)
+        self.assertEqual(mem.size, 4)
+        mem.write(1, 0x42)
+        self.assertEqual(buffer, bytearray([0x00, 0x42, 0x00, 0x00]))
+        buffer[2] = 0x55
+        self.assertEqual(mem.read(2), 0x55)
+
+    def test_buffer_larger_than_size_is_truncated(self):
+        mem = MemoryDevice("test", size=2, buffer=bytearray(4096))
+        self.assertEqual(len(mem.data), 2)
+
+    def test_buffer_smaller_than_size_raises(self):
+        with self.assertRaises(ValueError):
+            MemoryDevice("test", size=8, buffer=bytearray(4))
+
+    def test_read_only_buffer_backs_read_only_memory(self):
+        mem = MemoryDevice("rom", buffer=b"\x01\x02", writable=False)
+        self.assertEqual(mem.read(1), 0x02)
+        mem.write(1, 0xFF)  # ignored
+        self.assertEqual(mem.read(1), 0x02)
+
+    def test_read_only_buffer_cannot_back_writable_memory(self):
+        with self.assertRaises(ValueError):
+            MemoryDevice("ram", buffer=b"\x01\x02")
+
+    def test_size_required_without_buffer(self):
+        with self.assertRaises(TypeError):
+            MemoryDevice("test")
+
+    def test_mmap_backs_read_only_memory(self):
+        with tempfile.TemporaryFile() as f:
+            f.write(bytes(range(16)))
+            f.flush()
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            mem = MemoryDevice("rom", buffer=buffer, writable=False)
+            self.assertEqual([mem.read(r) for r in (0, 15)], [0, 15])
+
+    def test_shared_memory_backs_memory(self):
+        shm = shared_memory.SharedMemory(create=True, size=16)
+        try:
+            mem = MemoryDevice("ram", size=16, buffer=shm.buf)
+            mem.write(3, 0x42)
+            other = shared_memory.SharedMemory(shm.name)
+            self.assertEqual(other.buf[3], 0x42)
+            other.close()
+            del mem
+        finally:
+            shm.close()
+            shm.unlink()
+
+    # save states
+
+    def test_load_state_restores_data_in_place(self):
+        mem = MemoryDevice("test", size=4)
+        mem.load(0, [0x01, 0x02, 0x03, 0x04])
+        state = mem.save_state()
+        data = mem.data
+        mem.load(0, [0xFF, 0xFF, 0xFF, 0xFF])
+        mem.load_state(state)
+        self.assertIs(mem.data, data)
+        self.assertEqual(list(mem.data), [0x01, 0x02, 0x03, 0x04])
+
+    def test_load_state_notifies_watchers_of_changed_registers(self):
+        mem = MemoryDevice("test", size=4, writable=False)
+        state = mem.save_state()
+        mem.load(0, [0x00, 0x42, 0x42, 0x00])
+        calls = []
+        mem.add_watcher(lambda device, start, end: calls.append((start, end)))
+        mem.watch(0)
+        mem.watch(1)
+        mem.watch(3)
+        mem.load_state(state)
+        self.assertEqual(calls, [(1, 2)])
+        self.assertEqual(list(mem.data), [0x00, 0x00, 0x00, 0x00])
+
 
 class RegisterFileDeviceTests(unittest.TestCase):
 
@@ -177,6 +298,36 @@ class ProcessorStatusDeviceTests(unittest.TestCase):
         ps.write(2, 0x42)
         self.assertEqual(bus.read(0xFF1E), 0x42)
 
+    # view of the processor
+
+    def test_attached_reads_processor_fields(self):
+        proc = Processor()
+        ps = ProcessorStatusDevice("processor_status")
+        proc.bus.add_device(ps, (0xFF1C, 0xFF1E))
+        proc.write_sp(0xFE1C)
+        proc.write_psw(0x42)
+        self.assertEqual(ps.read(ps.SPL), 0x1C)
+        self.assertEqual(ps.read(ps.SPH), 0xFE)
+        self.assertEqual(ps.read(ps.PSW), 0x42)
+
+    def test_attached_writes_processor_fields(self):
+        proc = Processor()
+        ps = ProcessorStatusDevice("processor_status")
+        proc.bus.add_device(ps, (0xFF1C, 0xFF1E))
+        proc.bus.write(0xFF1C, 0x1C)
+        proc.bus.write(0xFF1D, 0xFE)
+        proc.bus.write(0xFF1E, 0xFF)
+        self.assertEqual(proc.read_sp(), 0xFE1C)
+        self.assertEqual(proc.read_psw(), 0xFB)  # bit 2 always reads 0
+
+    def test_attach_keeps_stored_values(self):
+        proc = Processor()
+        ps = ProcessorStatusDevice("processor_status")
+        ps.load(0, [0x1C, 0xFE, 0x42])
+        proc.bus.add_device(ps, (0xFF1C, 0xFF1E))
+        self.assertEqual(proc.read_sp(), 0xFE1C)
+        self.assertEqual(proc.read_psw(), 0x42)
+
     # bounds
 
     def test_out_of_bounds_raises(self):
@@ -269,6 +420,26 @@ class InterruptControllerDeviceTests(unittest.TestCase):
         intc.reset()
         self.assertEqual(intc.read(InterruptControllerDevice.PR0L), 0xFF)
 
+    # save states
+
+    def test_load_state_restores_flags(self):
+        intc, _ = _make_intc_on_bus()
+        state = intc.save_state()
+        intc.write(intc.IF0L, 0x12)
+        intc.write(intc.MK0L, 0x34)
+        intc.load_state(state)
+        self.assertEqual(intc.read(intc.IF0L), 0x00)
+        self.assertEqual(intc.read(intc.MK0L), 0xFF)
+
+    # connections
+
+    def test_connections_lists_connected_interrupts(self):
+        intc, dev = _make_intc_on_bus()
+        self.assertEqual(sorted(intc.connections()),
+                         [(dev, _DummyDevice.INT_0, intc.INTP0),
+                          (dev, _DummyDevice.INT_1, intc.INTP1)])
+        self.assertIs(intc.bus.interrupt_controller, intc)
+
     # interrupt
 
     def test_interrupt_sets_if_bit(self):
@@ -436,6 +607,54 @@ class InterruptControllerDeviceTests(unittest.TestCase):
         intc.acknowledge_interrupt(InterruptControllerDevice.INTP0)  # clear INTP0
         self.assertEqual(intc.read(InterruptControllerDevice.IF0L), 0x04)
 
+    def test_reserved_flags_are_never_pending(self):
+        intc, dev = _make_intc_on_bus()
+        intc.write(InterruptControllerDevice.IF1L, 0x80)
+        intc.write(InterruptControllerDevice.IF1H, 0xE0)
+        intc.write(InterruptControllerDevice.MK1L, 0x00)
+        intc.write(InterruptControllerDevice.MK1H, 0x00)
+        self.assertIsNone(self._tick_intc(intc))
+
+    def test_pending_interrupt_is_reused(self):
+        intc, dev = _make_intc_on_bus()
+        intc.write(InterruptControllerDevice.MK0L, 0xFD)
+        intc.interrupt(dev, _DummyDevice.INT_0)
+        first = self._tick_intc(intc)
+        intc.bus.acknowledge_interrupt(first)
+        intc.interrupt(dev, _DummyDevice.INT_0)
+        self.assertIs(self._tick_intc(intc), first)
+
+    def test_registers_are_independent(self):
+        intc = InterruptControllerDevice("intc")
+        for register in range(InterruptControllerDevice.SIZE):
+            intc.write(register, register + 1)
+        self.assertEqual([intc.read(r) for r in range(InterruptControllerDevice.SIZE)],
+                         list(range(1, InterruptControllerDevice.SIZE + 1)))
+
+    # scheduling
+
+    def test_change_is_evaluated_on_next_bus_tick(self):
+        intc, dev = _make_intc_on_bus()
+        intc.write(InterruptControllerDevice.MK0L, 0xFD)
+        intc.bus.tick(1)
+        self.assertIsNone(intc.bus.pending_interrupt)
+        intc.interrupt(dev, _DummyDevice.INT_0)
+        self.assertIsNone(intc.bus.pending_interrupt)
+        intc.bus.tick(1)
+        pending = intc.bus.pending_interrupt
+        self.assertEqual(pending.source_index, InterruptControllerDevice.INTP0)
+
+    def test_acknowledge_is_evaluated_on_next_bus_tick(self):
+        intc, dev = _make_intc_on_bus()
+        intc.write(InterruptControllerDevice.MK0L, 0xF9)
+        intc.interrupt(dev, _DummyDevice.INT_0)
+        intc.interrupt(dev, _DummyDevice.INT_1)
+        intc.bus.tick(1)
+        intc.bus.acknowledge_interrupt(intc.bus.pending_interrupt)
+        intc.bus.tick(1)
+        pending = intc.bus.pending_interrupt
+        self.assertEqual(pending.source_index, InterruptControllerDevice.INTP1)
+
     # bus access
 
     def test_bus_write_mk(self):
@@ -628,6 +847,20 @@ class WatchdogDeviceTests(unittest.TestCase):
         wd.reset()
         self.assertEqual(wd.interval, 1 << 12)
 
+    # save states
+
+    def test_load_state_restores_registers_and_counter(self):
+        wd, proc, intc = _make_watchdog_on_bus()
+        wd.write(WatchdogDevice.WDCS, 0x00)  # interval = 4096
+        wd.write(WatchdogDevice.WDTM, 0x98)  # mode 2 (reset), start
+        wd.tick(4000)
+        state = wd.save_state()
+        wd.reset()
+        wd.load_state(state)
+        self.assertEqual(wd.read(WatchdogDevice.WDTM), 0x98)
+        wd.tick(96)
+        self.assertEqual(proc.reset_count, 1)
+
     # tick / counting
 
     def test_tick_does_nothing_when_stopped(self):
@@ -696,6 +929,33 @@ class WatchdogDeviceTests(unittest.TestCase):
         wd.tick(4096)
         self.assertEqual(proc.reset_count, 0)
 
+    # scheduling
+
+    def test_bus_tick_overflows_running_watchdog(self):
+        wd, proc, intc = _make_watchdog_on_bus()
+        wd.write(WatchdogDevice.WDCS, 0x00)  # interval = 4096
+        wd.write(WatchdogDevice.WDTM, 0x80)
+        wd.bus.tick(4095)
+        self.assertEqual(intc.requested, [])
+        wd.bus.tick(1)
+        self.assertEqual(intc.requested, [(wd, WatchdogDevice.INT_OVERFLOW)])
+        wd.bus.tick(4096)
+        self.assertEqual(len(intc.requested), 2)
+
+    def test_kick_reschedules_overflow(self):
+        wd, proc, intc = _make_watchdog_on_bus()
+        wd.write(WatchdogDevice.WDCS, 0x00)  # interval = 4096
+        wd.write(WatchdogDevice.WDTM, 0x80)
+        wd.bus.tick(4000)
+        wd.write(WatchdogDevice.WDTM, 0x80)  # kick
+        wd.bus.tick(4000)
+        self.assertEqual(intc.requested, [])
+
+    def test_stopped_watchdog_schedules_nothing(self):
+        wd, proc, intc = _make_watchdog_on_bus()
+        wd.write(WatchdogDevice.WDCS, 0x00)
+        self.assertEqual(wd.bus.next_deadline, wd.bus.NEVER)
+
     # bus access
 
     def test_bus_write_wdcs(self):
@@ -976,6 +1236,37 @@ class WatchTimerDeviceTests(unittest.TestCase):
         wt.tick(2000)  # would have overflowed without clear
         self.assertNotIn((wt, WatchTimerDevice.INT_WATCH), intc.requested)
 
+    # scheduling
+
+    def test_bus_tick_fires_prescaler_at_interval(self):
+        wt, proc, intc = _make_watch_timer_on_bus()
+        wt.write(WatchTimerDevice.WTNM0, 0x01)  # interval=2048
+        wt.bus.tick(2047)
+        self.assertEqual(intc.requested, [])
+        wt.bus.tick(1)
+        self.assertEqual(intc.requested, [(wt, WatchTimerDevice.INT_PRESCALER)])
+
+    def test_bus_tick_fires_watch_before_prescaler(self):
+        wt, proc, intc = _make_watch_timer_on_bus()
+        wt.write(WatchTimerDevice.WTNM0, 0x7F)  # prescaler 262144, watch 2048
+        wt.bus.tick(2048)
+        self.assertEqual(intc.requested, [(wt, WatchTimerDevice.INT_WATCH)])
+
+    def test_write_syncs_counters_before_changing_mode(self):
+        wt, proc, intc = _make_watch_timer_on_bus()
+        wt.write(WatchTimerDevice.WTNM0, 0x01)  # interval=2048
+        wt.bus.tick(2000)
+        wt.write(WatchTimerDevice.WTNM0, 0x03)  # start watch, keep prescaler
+        wt.bus.tick(48)
+        self.assertEqual(intc.requested, [(wt, WatchTimerDevice.INT_PRESCALER)])
+
+    def test_disabled_timer_schedules_nothing(self):
+        wt, proc, intc = _make_watch_timer_on_bus()
+        wt.write(WatchTimerDevice.WTNM0, 0x01)
+        wt.write(WatchTimerDevice.WTNM0, 0x00)
+        wt.bus.tick(1000000)
+        self.assertEqual(intc.requested, [])
+
     # reset
 
     def test_reset_clears_wtnm0(self):
@@ -1009,6 +1300,49 @@ class WatchTimerDeviceTests(unittest.TestCase):
             wt.write(1, 0x00)
 
 
+class FreeRunningTimerDeviceTests(unittest.TestCase):
+
+    def _make_timer_on_bus(self):
+        bus = Bus(_FakeProcessor())
+        timer = FreeRunningTimerDevice("timer")
+        bus.add_device(timer, (0xFF10, 0xFF11))
+        return timer, bus
+
+    # counting
+
+    def test_read_counts_bus_cycles(self):
+        timer, bus = self._make_timer_on_bus()
+        bus.tick(0x1200)
+        bus.tick(0x34)
+        self.assertEqual(bus.read(0xFF10), 0x34)
+        self.assertEqual(bus.read(0xFF11), 0x12)
+
+    def test_counter_wraps(self):
+        timer, bus = self._make_timer_on_bus()
+        bus.tick(0x10005)
+        self.assertEqual(bus.read(0xFF10), 0x05)
+        self.assertEqual(bus.read(0xFF11), 0x00)
+
+    def test_read_is_exact_with_tick_quantum(self):
+        timer, bus = self._make_timer_on_bus()
+        bus.set_tick_quantum(512)
+        bus.tick(100)
+        self.assertEqual(bus.read(0xFF10), 100)
+
+    # scheduling
+
+    def test_not_clocked_but_volatile(self):
+        timer, bus = self._make_timer_on_bus()
+        self.assertFalse(timer.clocked)
+        self.assertTrue(bus.is_volatile(0xFF10))
+
+    def test_write_is_ignored(self):
+        timer, bus = self._make_timer_on_bus()
+        bus.tick(7)
+        bus.write(0xFF10, 0xAA)
+        self.assertEqual(bus.read(0xFF10), 7)
+
+
 class _FakeProcessor(object):
     def __init__(self):
         self.reset_count = 0
@@ -1234,6 +1568,20 @@ class I2CControllerTests(unittest.TestCase):
         i2c.write(i2c.IIC0, 0x42)
         self.assertFalse(self._iicif0_set(intc))
 
+    # save states
+
+    def test_load_state_restores_active_target(self):
+        i2c, intc, bus = _make_i2c_on_bus()
+        stub = StubI2CTarget(read_value=0x42)
+        i2c.add_target(0x50, stub)
+        self._start_transaction(i2c, 0xA1)
+        state = i2c.save_state()
+        i2c.write(i2c.IICC0, 0x00)  # disable
+        i2c.load_state(state)
+        self.assertIs(i2c._active_target, stub)
+        i2c.write(i2c.IIC0, 0xFF)
+        self.assertEqual(i2c.read(i2c.IIC0), 0x42)
+
     # reading
 
     def test_read_byte_from_target(self):
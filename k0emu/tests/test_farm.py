@@ -0,0 +1,157 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from k0emu import farm
+from k0emu.farm import Scenario, main, read_scenarios, run_scenarios
+
+
+def _rom_data(code):
+    rom_data = bytearray([0x80, 0x00])  # reset vector
+    rom_data.extend(bytes(0x80 - len(rom_data)))
+    rom_data.extend(code)
+    return bytes(rom_data)
+
+
+# shows "HI" on the display and loops
+_DISPLAY_HI = _rom_data([
+    0xa1, 0x48,         # mov a,#'H'
+    0x9e, 0x9a, 0xf1,   # mov !0f19ah,a
+    0xa1, 0x49,         # mov a,#'I'
+    0x9e, 0x9b, 0xf1,   # mov !0f19bh,a
+    0xfa, 0xfe])        # br 008ah
+
+# increments a byte of RAM forever
+_COUNTER = _rom_data([
+    0xa1, 0x00,         # mov a,#00h
+    0x41,               # inc a
+    0x9e, 0x00, 0xf0,   # mov !0f000h,a
+    0xfa, 0xfa])        # br 0082h
+
+
+class FarmTests(unittest.TestCase):
+
+    def setUp(self):
+        self._tempdir = tempfile.TemporaryDirectory()
+        self.directory = self._tempdir.name
+
+    def tearDown(self):
+        self._tempdir.cleanup()
+
+    def _rom(self, rom_data, name="rom.bin"):
+        path = os.path.join(self.directory, name)
+        with open(path, "wb") as f:
+            f.write(rom_data)
+        return path
+
+    # scenarios
+
+    def test_scenario_runs_for_max_cycles(self):
+        result = Scenario("counter", self._rom(_COUNTER), 10000).run()
+        self.assertEqual(result["stop"], "cycles")
+        self.assertGreaterEqual(result["cycles"], 10000)
+        self.assertEqual(len(result["ram_sha256"]), 64)
+
+    def test_scenario_stops_at_display_text(self):
+        scenario = Scenario("hi", self._rom(_DISPLAY_HI), 1000000,
+                            until_display="HI.........")
+        result = scenario.run()
+        self.assertEqual(result["stop"], "display")
+        self.assertEqual(result["display"], "HI.........")
+        self.assertLess(result["cycles"], 1000000)
+
+    def test_scenario_stops_at_pc(self):
+        scenario = Scenario("hi", self._rom(_DISPLAY_HI), 1000000,
+                            until_pc=0x008a)
+        result = scenario.run()
+        self.assertEqual((result["stop"], result["pc"]), ("pc", 0x008a))
+
+    def test_scenario_applies_events_in_order(self):
+        rom = self._rom(_DISPLAY_HI)
+        events = [(2000, "clear", 0xF19B, 0x01),  # 'I' -> 'H'
+                  (1000, "write", 0xF19C, 0x21),  # '!'
+                  (3000, "set", 0xF19C, 0x02)]    # '!' -> '#'
+        result = Scenario("events", rom, 5000, events).run()
+        self.assertEqual(result["display"], "HH#........")
+
+    def test_scenario_event_after_max_cycles_is_not_applied(self):
+        events = [(10000, "write", 0xF19C, 0x21)]
+        result = Scenario("late", self._rom(_DISPLAY_HI), 5000, events).run()
+        self.assertEqual(result["stop"], "cycles")
+        self.assertEqual(result["display"], "HI.........")
+
+    def test_scenario_reports_unimplemented_opcode(self):
+        rom = self._rom(bytes([0x00, 0x00, 0x06]))  # nop, nop, undefined
+        result = Scenario("bad", rom, 1000).run()
+        self.assertEqual(result["stop"], "error")
+        self.assertTrue(result["error"].startswith("NotImplementedError"))
+        self.assertEqual(result["pc"], 3)
+
+    def test_scenario_reports_missing_rom(self):
+        rom = os.path.join(self.directory, "missing.bin")
+        result = Scenario("missing", rom, 1000).run()
+        self.assertEqual(result["stop"], "error")
+        self.assertNotIn("cycles", result)
+
+    def test_scenarios_with_same_rom_start_from_reset(self):
+        rom = self._rom(_COUNTER)
+        first = Scenario("first", rom, 10000).run()
+        second = Scenario("second", rom, 10000).run()
+        self.assertEqual(first["ram_sha256"], second["ram_sha256"])
+        self.assertEqual(first["cycles"], second["cycles"])
+
+    def test_rom_that_fills_rom_is_mapped(self):
+        rom_data = bytearray(_COUNTER) + bytes(0xF000 - len(_COUNTER))
+        result = Scenario("mapped", self._rom(bytes(rom_data)), 10000).run()
+        self.assertEqual(result["stop"], "cycles")
+        expected = Scenario("loaded", self._rom(_COUNTER, "short.bin"),
+                            10000).run()
+        self.assertEqual(result["ram_sha256"], expected["ram_sha256"])
+        rom = farm._machine(os.path.join(self.directory, "rom.bin"))
+        self.assertTrue(rom.bus.device("rom").data.readonly)
+
+    # scenario files
+
+    def test_read_scenarios_relative_to_file(self):
+        self._rom(_DISPLAY_HI, "hi.bin")
+        path = os.path.join(self.directory, "scenarios.jsonl")
+        with open(path, "w") as f:
+            f.write(json.dumps({
+                "name": "hi", "rom": "hi.bin", "max_cycles": 5000,
+                "events": [{"at": 100, "write": [0xF19C, 0x21]}],
+                "until_pc": [0x008a, 0x0000]}) + "\n\n")
+        scenario, = read_scenarios(path)
+        self.assertEqual(scenario.rom, os.path.join(self.directory, "hi.bin"))
+        self.assertEqual(scenario.events, [(100, "write", 0xF19C, 0x21)])
+        self.assertEqual(scenario.until_pc, (0x008a, 0x0000))
+
+    def test_event_needs_one_action(self):
+        data = {"name": "bad", "rom": "rom.bin", "max_cycles": 1,
+                "events": [{"at": 1}]}
+        self.assertRaises(ValueError, Scenario.from_json, data)
+
+    # worker pool
+
+    def test_run_scenarios_yields_results_in_order(self):
+        rom = self._rom(_COUNTER)
+        scenarios = [Scenario("s%d" % i, rom, 1000 * (i + 1))
+                     for i in range(4)]
+        results = list(run_scenarios(scenarios, workers=2))
+        self.assertEqual([result["name"] for result in results],
+                         ["s0", "s1", "s2", "s3"])
+        self.assertEqual([result["stop"] for result in results],
+                         ["cycles"] * 4)
+
+    def test_main_writes_json_lines(self):
+        self._rom(_DISPLAY_HI, "hi.bin")
+        path = os.path.join(self.directory, "scenarios.jsonl")
+        with open(path, "w") as f:
+            for name in ("a", "b"):
+                f.write(json.dumps({"name": name, "rom": "hi.bin",
+                                    "max_cycles": 2000}) + "\n")
+        output = io.StringIO()
+        main([path, "-j", "1"], output)
+        results = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual([result["name"] for result in results], ["a", "b"])
+        self.assertEqual(results[0]["display"], "HI.........")
@@ -0,0 +1,289 @@
+import random
+import unittest
+from k0dasm.disassemble import disassemble
+from k0emu import isa
+from k0emu.devices import MemoryDevice
+from k0emu.processor import Processor, RegisterPairs
+
+
+_TABLES = {None: "_opcodes_unprefixed",
+           0x31: "_opcodes_prefix_0x31",
+           0x61: "_opcodes_prefix_0x61",
+           0x71: "_opcodes_prefix_0x71"}
+
+
+def _code(instruction, opcode):
+    prefix = [] if instruction.prefix is None else [instruction.prefix]
+    code = prefix + [opcode, 0x20, 0x00, 0x00]
+    return code[:instruction.length]
+
+
+def _make_processor(high_speed):
+    proc = Processor()
+    mem = MemoryDevice("test_memory", size=0x10000, high_speed=high_speed)
+    proc.bus.add_device(mem, (0x0000, 0xFFFF))
+    return proc, mem
+
+
+def _execute(proc, mem, code):
+    mem.load(0x0000, bytes(0x1200))  # vectors, operands, code, [de], [bc]
+    mem.load(0xF000, bytes(0x1000))  # [hl], saddr, sfr, stack
+    proc.write_memory_bytes(0x1000, code)
+    for regpair in range(4):
+        proc.write_gp_regpair(regpair, 0x1111)
+    proc.write_gp_regpair(RegisterPairs.HL, 0xF000)
+    proc.write_psw(0)
+    proc.write_sp(0xFE00)
+    proc.pc = 0x1000
+    proc.step()
+    return proc.inst_cycles
+
+
+class InstructionTableTests(unittest.TestCase):
+
+    # coverage
+
+    def test_table_covers_every_implemented_opcode(self):
+        for prefix, table in _TABLES.items():
+            described = set()
+            for instruction in isa.INSTRUCTIONS:
+                if instruction.prefix == prefix:
+                    self.assertFalse(described & set(instruction.opcodes))
+                    described.update(instruction.opcodes)
+            implemented = set(
+                opcode for opcode, handler in
+                enumerate(getattr(Processor, table))
+                if handler is not Processor._opcode_not_implemented)
+            if prefix is None:
+                implemented -= set(_TABLES)
+            self.assertEqual(described, implemented, prefix)
+
+    def test_dispatch_tables_use_table_handlers(self):
+        for instruction in isa.INSTRUCTIONS:
+            function = getattr(Processor, instruction.handler)
+            table = getattr(Processor, _TABLES[instruction.prefix])
+            for opcode in instruction.opcodes:
+                self.assertIs(table[opcode].__code__, function.__code__)
+
+    # agreement with the disassembler and the processor
+
+    def test_mnemonics_and_lengths_match_disassembler(self):
+        memory = bytearray(0x10000)
+        for instruction in isa.INSTRUCTIONS:
+            for opcode in instruction.opcodes:
+                code = _code(instruction, opcode) + [0x00] * 3
+                memory[0x1000:0x1000 + len(code)] = bytes(code)
+                disassembled = disassemble(memory, 0x1000)
+                mnemonic = instruction.mnemonic
+                fields = instruction.fields(opcode)
+                if "bank" in fields:  # k0dasm shows the bank number
+                    mnemonic = mnemonic.format(bank=fields["bank"])
+                self.assertEqual(disassembled.template, mnemonic)
+                self.assertEqual(len(disassembled), instruction.length)
+
+    def test_cycles_match_processor(self):
+        fast = _make_processor(high_speed=True)
+        slow = _make_processor(high_speed=False)
+        for instruction in isa.INSTRUCTIONS:
+            for opcode in instruction.opcodes:
+                code = _code(instruction, opcode)
+                self.assertEqual(_execute(*fast, code=code),
+                                 instruction.cycles, code)
+                self.assertEqual(_execute(*slow, code=code),
+                                 instruction.slow_cycles, code)
+
+    # opcode fields
+
+    def test_fields_of_family_opcodes(self):
+        cases = ((None, 0x45, {"reg": 5}),            # inc l
+                 (None, 0x16, {"regpair": 3}),        # movw hl,#imm16
+                 (None, 0x5a, {"bit": 5}),            # set1 saddr.5
+                 (None, 0x3c, {"addr11": 0x0b00}),    # callf !0bxxh
+                 (None, 0xc5, {"addr5": 0x44}),       # callt [0044h]
+                 (0x61, 0xf8, {"bank": 3}),           # sel rb3
+                 (None, 0x00, {}))                    # nop
+        for prefix, opcode, fields in cases:
+            instruction, = [instruction for instruction in isa.INSTRUCTIONS
+                            if instruction.prefix == prefix and
+                            opcode in instruction.opcodes]
+            self.assertEqual(instruction.fields(opcode), fields)
+
+    def test_parse_opcodes_of_family_with_exclusion(self):
+        self.assertEqual(isa._parse_opcodes("60-67 !61", "mov a,{reg}"),
+                         (0x60, 0x62, 0x63, 0x64, 0x65, 0x66, 0x67))
+        self.assertEqual(isa._parse_opcodes("0a-7a", "set1 {saddr}.{bit}"),
+                         (0x0a, 0x1a, 0x2a, 0x3a, 0x4a, 0x5a, 0x6a, 0x7a))
+        self.assertEqual(isa._parse_opcodes("d0,d8,f0,f8", "sel {bank}"),
+                         (0xd0, 0xd8, 0xf0, 0xf8))
+
+
+
+def _random_code(rand, instruction, opcode):
+    # even operands in plain memory: not the register banks, SP, or PSW
+    prefix = [] if instruction.prefix is None else [instruction.prefix]
+    operands = [rand.randrange(0x20, 0xE0) & 0xFE for _ in range(3)]
+    return (prefix + [opcode] + operands)[:instruction.length]
+
+
+def _random_state(rand):
+    # registers, SP, and flags by their names in descriptions, with the
+    # register pointers in plain memory and register bank 0 selected
+    state = dict((name, rand.randrange(256)) for name in isa.REGISTER_NAMES)
+    state["d"] = rand.choice((0x20, 0xF0))
+    state["h"] = rand.choice((0x20, 0xF0))
+    state["sp"] = 0xFD00 + rand.randrange(0x80) * 2
+    for name in ("cy", "isp", "ac", "z", "ie"):
+        state[name] = rand.choice((False, True))
+    state["rbs0"] = state["rbs1"] = False
+    return state
+
+
+def _execute_state(proc, mem, memory, code, state):
+    """Execute code in a processor whose memory holds the given bytes, from
+    the given state.  Returns a tuple of (state, memory, pc) after it, and
+    restores the memory."""
+    proc.write_memory_bytes(0x1000, code)
+    proc.write_psw(sum(1 << bit for bit, name in enumerate(isa.FLAG_NAMES)
+                       if name is not None and state[name]))
+    for index, name in enumerate(isa.REGISTER_NAMES):
+        proc.write_gp_reg(index, state[name])
+    proc.write_sp(state["sp"])
+    proc.pc = 0x1000
+    proc.step()
+    after = dict((name, proc.read_gp_reg(index))
+                 for index, name in enumerate(isa.REGISTER_NAMES))
+    after["sp"] = proc.read_sp()
+    after.update((name, bool(proc.read_psw() & (1 << bit)))
+                 for bit, name in enumerate(isa.FLAG_NAMES) if name)
+    data = bytes(mem._data)
+    for page in range(0, 0x10000, 0x100):
+        if data[page:page + 0x100] != memory[page:page + 0x100]:
+            mem.load(page, memory[page:page + 0x100])
+    return after, data, proc.pc
+
+
+def _memory_addresses(operand, state):
+    address, size = operand
+    if address == "[sp]":
+        return range(state["sp"] - 3, state["sp"] + 3)
+    if not isinstance(address, int):  # "[hl+b]", "[hl+0x12]", ...
+        expression = (address[1:-1].replace("hl", "(h << 8 | l)")
+                      .replace("de", "(d << 8 | e)"))
+        address = eval(expression, dict(state))
+    return range(address, address + size)
+
+
+class DescribeTests(unittest.TestCase):
+
+    # decoding
+
+    def test_text_matches_disassembler(self):
+        rand = random.Random(16)
+        memory = bytearray(0x10000)
+        for instruction in isa.INSTRUCTIONS:
+            for opcode in instruction.opcodes:
+                code = _random_code(rand, instruction, opcode)
+                memory[0x1234:0x1234 + len(code)] = bytes(code)
+                description = isa.describe(code, 0x1234)
+                self.assertEqual(str(description),
+                                 str(disassemble(memory, 0x1234)))
+                self.assertIs(description.instruction, instruction)
+
+    def test_describe_rejects_illegal_and_incomplete_code(self):
+        for code in ([0x31, 0xff], [0x71], [0x9a, 0x00], []):
+            self.assertRaises(ValueError, isa.describe, code)
+
+    def test_describe_ignores_bytes_after_instruction(self):
+        description = isa.describe([0xa1, 0x42, 0xff, 0xff, 0xff])
+        self.assertEqual(str(description), "mov a,#0x42")
+        self.assertEqual(description.length, 2)
+
+    # flow
+
+    def test_flow_and_target(self):
+        cases = (([0x00], isa.Flow.CONTINUE, None),               # nop
+                 ([0x8d, 0xfe], isa.Flow.CONDITIONAL_BRANCH, 0x1000),
+                 ([0xfa, 0x10], isa.Flow.BRANCH, 0x1012),         # br $
+                 ([0x9b, 0x34, 0x12], isa.Flow.BRANCH, 0x1234),   # br !
+                 ([0x31, 0x98], isa.Flow.BRANCH, None),           # br ax
+                 ([0x1c, 0x34], isa.Flow.CALL, 0x0934),           # callf
+                 ([0xc1], isa.Flow.CALL, None),                   # callt
+                 ([0xaf], isa.Flow.RETURN, None),                 # ret
+                 ([0x71, 0x10], isa.Flow.HALT, None))             # halt
+        for code, flow, target in cases:
+            description = isa.describe(code, 0x1000)
+            self.assertEqual(description.flow, flow, code)
+            self.assertEqual(description.target, target, code)
+
+    # reads and writes
+
+    def test_operands_in_memory(self):
+        description = isa.describe([0xbe, 0x12])  # mov [hl+0x12],a
+        self.assertEqual(description.reads, frozenset(["a", "h", "l"]))
+        self.assertEqual(description.writes, frozenset())
+        self.assertEqual(description.memory_writes,
+                         frozenset([("[hl+0x12]", 1)]))
+        description = isa.describe([0x89, 0x20])  # movw ax,0xfe20
+        self.assertEqual(description.writes, frozenset(["x", "a"]))
+        self.assertEqual(description.memory_reads,
+                         frozenset([(0xFE20, 2)]))
+
+    def test_sp_and_psw_operands_are_registers(self):
+        description = isa.describe([0x71, 0x7a, 0x1e])  # ei
+        self.assertEqual(description.writes, frozenset(["ie"]))
+        self.assertEqual(description.memory_writes, frozenset())
+        description = isa.describe([0xee, 0x1c, 0x00, 0xfe])  # movw sp,#
+        self.assertEqual(description.writes, frozenset(["sp"]))
+
+    def test_stack(self):
+        description = isa.describe([0x22])  # push psw
+        self.assertEqual(description.reads,
+                         frozenset(["sp", "cy", "isp", "rbs0", "ac",
+                                    "rbs1", "z", "ie"]))
+        self.assertEqual(description.memory_writes, frozenset([("[sp]", 1)]))
+        description = isa.describe([0x9f])  # retb
+        self.assertEqual(description.memory_reads, frozenset([("[sp]", 3)]))
+
+    def test_reads_and_writes_match_processor(self):
+        # every opcode changes only what it writes, and what it writes does
+        # not change when everything it does not read is changed
+        rand = random.Random(16)
+        proc, mem = _make_processor(high_speed=True)
+        memory = bytes(rand.randrange(256) for _ in range(0x10000))
+        mem.load(0x0000, memory)
+        for instruction in isa.INSTRUCTIONS:
+            if instruction.mnemonic in ("halt", "stop"):
+                continue
+            for opcode in instruction.opcodes:
+                code = _random_code(rand, instruction, opcode)
+                description = isa.describe(code, 0x1000)
+                state = _random_state(rand)
+                after, data, pc = _execute_state(proc, mem, memory, code,
+                                                 state)
+
+                changed = set(name for name in state
+                              if state[name] != after[name])
+                if "rbs0" in description.writes:  # register bank switched
+                    changed -= set(isa.REGISTER_NAMES)
+                self.assertLessEqual(changed, description.writes, code)
+
+                written = set()
+                for operand in description.memory_writes:
+                    written.update(_memory_addresses(operand, state))
+                for page in range(0, 0x10000, 0x100):
+                    if data[page:page + 0x100] == memory[page:page + 0x100]:
+                        continue
+                    for address in range(page, page + 0x100):
+                        if (data[address] != memory[address] and
+                                not 0x1000 <= address < 0x1004 and  # code
+                                not 0xFEE0 <= address < 0xFF20):  # registers
+                            self.assertIn(address, written, code)
+
+                other = _random_state(rand)
+                for name in description.reads:
+                    other[name] = state[name]
+                other_after, _, other_pc = _execute_state(proc, mem, memory,
+                                                          code, other)
+                for name in description.writes:
+                    self.assertEqual(after[name], other_after[name], code)
+                self.assertEqual(pc, other_pc, code)
@@ -1,7 +1,9 @@
+import marshal
 import unittest
 import sys
 from k0emu.devices import MemoryDevice
-from k0emu.processor import Processor, Registers, RegisterPairs, Flags, RunState
+from k0emu.processor import Processor, Registers, RegisterPairs, Flags, RunState, StopReason, CycleMode
+from k0emu.system import make_processor
 
 
 def _make_processor():
@@ -31,6 +33,355 @@ class ProcessorTests(unittest.TestCase):
         self.assertEqual(proc.run_state, RunState.RUNNING)
         self.assertEqual(mem.ticks, 4)
 
+    # run
+
+    def test_run_stops_after_max_cycles(self):
+        proc, mem = _make_processor()
+        proc.write_memory_bytes(0, [0x00] * 8)  # nop ...
+        reason, cycles = proc.run(5)
+        self.assertEqual(reason, StopReason.MAX_CYCLES)
+        self.assertEqual(cycles, 6)
+        self.assertEqual(proc.pc, 3)
+        self.assertEqual(proc.total_cycles, 6)
+
+    def test_run_stops_when_pc_reaches_until_pc(self):
+        proc, mem = _make_processor()
+        proc.write_memory_bytes(0, [0x00, 0x00, 0x9b, 0x00, 0x10])  # br !1000h
+        reason, cycles = proc.run(1000, until_pc=0x1000)
+        self.assertEqual(reason, StopReason.UNTIL_PC)
+        self.assertEqual(proc.pc, 0x1000)
+        self.assertEqual(cycles, proc.total_cycles)
+
+    def test_run_accepts_set_of_until_pcs(self):
+        proc, mem = _make_processor()
+        proc.write_memory_bytes(0, [0x00, 0x00, 0x00, 0x00])
+        reason, cycles = proc.run(1000, until_pc=set([3, 2]))
+        self.assertEqual(reason, StopReason.UNTIL_PC)
+        self.assertEqual(proc.pc, 2)
+
+    def test_run_matches_step(self):
+        code = [0xa3, 0x05,         # mov b,#5
+                0x41,               # inc a
+                0x9e, 0x00, 0x20,   # mov !2000h,a
+                0x8b, 0xfa,         # dbnz b,$-4
+                0x71, 0x10]         # halt
+        stepped, _ = _make_processor()
+        stepped.write_memory_bytes(0, code)
+        while stepped.total_cycles < 100:
+            stepped.step()
+        ran, _ = _make_processor()
+        ran.write_memory_bytes(0, code)
+        reason, cycles = ran.run(100)
+        self.assertEqual(cycles, stepped.total_cycles)
+        self.assertEqual(ran.pc, stepped.pc)
+        self.assertEqual(ran.run_state, stepped.run_state)
+        self.assertEqual(ran.read_memory(0x2000), stepped.read_memory(0x2000))
+
+    # decoded instruction cache
+
+    def test_step_reuses_decoded_instruction(self):
+        proc, mem = _make_processor()
+        proc.write_memory_bytes(0, [0x61, 0xd8])  # sel rb1
+        proc.step()
+        self.assertIsNotNone(proc._decoded[0])
+        proc.pc = 0
+        proc.step()
+        self.assertEqual(proc.read_rb(), 1)
+
+    def test_step_sees_code_modified_by_write(self):
+        proc, mem = _make_processor()
+        proc.write_memory_bytes(0, [0x61, 0xd8])  # sel rb1
+        proc.step()
+        self.assertEqual(proc.read_rb(), 1)
+        proc.write_memory(1, 0xf0)  # sel rb2
+        self.assertIsNone(proc._decoded[0])
+        proc.pc = 0
+        proc.step()
+        self.assertEqual(proc.read_rb(), 2)
+
+    def test_step_sees_code_modified_by_load(self):
+        proc, mem = _make_processor()
+        proc.write_memory_bytes(0, [0x00])  # nop
+        proc.step()
+        mem.load(0, [0xa1, 0x42])  # mov a,#42h
+        proc.pc = 0
+        proc.step()
+        self.assertEqual(proc.read_gp_reg(Registers.A), 0x42)
+        self.assertEqual(proc.pc, 2)
+
+    def test_step_sees_code_modified_by_itself(self):
+        proc, mem = _make_processor()
+        code = [0xa1, 0xa2,         # mov a,#0a2h     (mov c,#imm)
+                0x9e, 0x05, 0x00,   # mov !0005h,a
+                0xa1, 0x42,         # mov a,#42h      (modified)
+               ]
+        proc.write_memory_bytes(0, code)
+        proc.pc = 5
+        proc.step()  # decode the original instruction at 0x0005
+        proc.pc = 0
+        proc.step()
+        proc.step()
+        proc.step()
+        self.assertEqual(proc.read_gp_reg(Registers.C), 0x42)
+        self.assertEqual(proc.read_gp_reg(Registers.A), 0xa2)
+
+    # opcode tables
+
+    def test_opcode_tables_are_shared_by_instances(self):
+        proc1, _ = _make_processor()
+        proc2, _ = _make_processor()
+        self.assertIs(proc1._opcodes_unprefixed, proc2._opcodes_unprefixed)
+        self.assertIs(proc1._opcodes_prefix_0x61,
+                      proc2._opcodes_prefix_0x61)
+        self.assertNotIn("_opcodes_unprefixed", vars(proc1))
+        self.assertIs(proc1._opcodes_by_prefix, proc2._opcodes_by_prefix)
+        self.assertIs(proc1._opcodes_by_prefix[0x61],
+                      proc1._opcodes_prefix_0x61)
+
+    def test_opcode_tables_use_subclass_handlers(self):
+        class NopCountingProcessor(Processor):
+            nops = 0
+            def _opcode_0x00(self, opcode):
+                self.nops += 1
+                super()._opcode_0x00(opcode)
+
+        proc = NopCountingProcessor()
+        proc.bus.add_device(MemoryDevice("test_memory", size=0x10000),
+                            (0x0000, 0xFFFF))
+        proc.step()
+        proc.step()
+        self.assertEqual(proc.nops, 2)
+        self.assertEqual(proc.pc, 2)
+        self.assertIs(Processor._opcodes_unprefixed[0x00],
+                      Processor._opcode_0x00)
+
+    def test_opcode_tables_bind_operands_of_subclass_handlers(self):
+        class IncLoggingProcessor(Processor):
+            incs = []
+            def _opcode_0x40_to_0x47_inc(self, opcode, reg):
+                self.incs.append(reg)
+                super()._opcode_0x40_to_0x47_inc(opcode, reg)
+
+        proc = IncLoggingProcessor()
+        proc.bus.add_device(MemoryDevice("test_memory", size=0x10000),
+                            (0x0000, 0xFFFF))
+        proc.write_memory_bytes(0, [0x41, 0x47])  # inc a, inc h
+        proc.step()
+        proc.step()
+        self.assertEqual(proc.incs, [Registers.A, Registers.H])
+        self.assertEqual(proc.read_gp_reg(Registers.A), 1)
+        self.assertEqual(proc.read_gp_reg(Registers.H), 1)
+
+    # call hooks
+
+    def test_hook_call_replaces_subroutine(self):
+        proc, mem = _make_processor()
+        def memset(proc):
+            hl = proc.read_gp_regpair(RegisterPairs.HL)
+            for offset in range(proc.read_gp_reg(Registers.C)):
+                proc.write_memory(hl + offset, proc.read_gp_reg(Registers.A))
+        proc.hook_call(0x2000, memset, cycles=100)
+        proc.write_memory(0x2000, 0xFF)  # not executed
+        proc.write_memory_bytes(0x1000, [0x9a, 0x00, 0x20])  # call !2000h
+        proc.write_gp_regpair(RegisterPairs.HL, 0xF000)
+        proc.write_gp_reg(Registers.C, 4)
+        proc.write_gp_reg(Registers.A, 0x55)
+        proc.write_sp(0xFE00)
+        proc.pc = 0x1000
+        proc.step()
+        self.assertEqual(proc.pc, 0x1003)
+        self.assertEqual(proc.read_sp(), 0xFE00)
+        self.assertEqual(proc.total_cycles, 7 + 100)
+        self.assertEqual([mem.read(a) for a in range(0xF000, 0xF006)],
+                         [0x55, 0x55, 0x55, 0x55, 0x00, 0x00])
+
+    def test_hook_call_for_callf_and_callt(self):
+        for code, cycles in (([0x1c, 0x34], 5),  # callf !0934h
+                             ([0xc1], 6)):       # callt [0040h]
+            proc, _ = _make_processor()
+            calls = []
+            proc.hook_call(0x0934, calls.append, cycles=10)
+            proc.write_memory_bytes(0x0040, [0x34, 0x09])
+            proc.write_memory_bytes(0x1000, code)
+            proc.write_sp(0xFE00)
+            proc.pc = 0x1000
+            proc.step()
+            self.assertEqual(calls, [proc])
+            self.assertEqual(proc.pc, 0x1000 + len(code))
+            self.assertEqual(proc.read_sp(), 0xFE00)
+            self.assertEqual(proc.total_cycles, cycles + 10)
+
+    def test_hook_call_charges_cycles_returned_by_function(self):
+        proc, _ = _make_processor()
+        proc.hook_call(0x2000, lambda proc: 42, cycles=100)
+        proc.write_memory_bytes(0x1000, [0x9a, 0x00, 0x20])  # call !2000h
+        proc.write_sp(0xFE00)
+        proc.pc = 0x1000
+        self.assertEqual(proc.run(1), (StopReason.MAX_CYCLES, 7 + 42))
+        self.assertEqual(proc.pc, 0x1003)
+
+    def test_unhook_call_restores_subroutine(self):
+        proc, _ = _make_processor()
+        calls = []
+        proc.hook_call(0x2000, calls.append)
+        proc.unhook_call(0x2000)
+        proc.write_memory_bytes(0x1000, [0x9a, 0x00, 0x20])  # call !2000h
+        proc.write_sp(0xFE00)
+        proc.pc = 0x1000
+        proc.step()
+        self.assertEqual(calls, [])
+        self.assertEqual(proc.pc, 0x2000)
+        self.assertEqual(proc.read_sp(), 0xFDFE)
+
+    # snapshots
+
+    def test_restore_returns_to_snapshot(self):
+        proc = make_processor()
+        proc.bus.device("rom").load(0x0100, [
+            0x16, 0x00, 0xf8,   # movw hl,#0f800h
+            0x87,               # mov a,[hl]
+            0x41,               # inc a
+            0x97,               # mov [hl],a
+            0x86,               # incw hl
+            0xb1,               # push ax
+            0xb0,               # pop ax
+            0xfa, 0xf9])        # br $-5
+        proc.write_sp(0xFE00)
+        proc.write_psw(0x08)    # register bank 1
+        proc.pc = 0x0100
+        proc.run(1000)
+        snapshot = proc.snapshot()
+        proc.run(5000)
+        expected = proc.snapshot()
+        proc.restore(snapshot)
+        self.assertEqual(proc.snapshot(), snapshot)
+        proc.run(5000)
+        self.assertEqual(proc.snapshot(), expected)
+
+    def test_restore_discards_decoded_code_that_changed(self):
+        proc, mem = _make_processor()
+        proc.write_memory_bytes(0x1000, [0x41, 0xfa, 0xfd])  # inc a; br $-1
+        proc.pc = 0x1000
+        snapshot = proc.snapshot()
+        proc.run(100)
+        proc.write_memory(0x1000, 0x51)  # dec a
+        proc.run(100)
+        proc.restore(snapshot)
+        proc.step()
+        self.assertEqual(proc.read_gp_reg(Registers.A), 1)
+
+    def test_restore_snapshot_of_different_machine_raises(self):
+        proc, _ = _make_processor()
+        snapshot = make_processor().snapshot()
+        self.assertRaises(ValueError, proc.restore, snapshot)
+
+    def test_restore_snapshot_that_does_not_match_changes_nothing(self):
+        proc = make_processor()
+        proc.write_memory(0xF000, 0x12)
+        proc.bus.tick(100)
+        snapshot_format, state, bus_state = marshal.loads(proc.snapshot())
+        kinds, device_states = bus_state[:2]
+        # the state of the last device does not match it
+        device_states = device_states[:-1] + ((device_states[-1], 0),)
+        snapshot = marshal.dumps((snapshot_format, state,
+                                  (kinds, device_states) + bus_state[2:]))
+        other = make_processor()
+        expected = other.snapshot()
+        self.assertRaises(ValueError, other.restore, snapshot)
+        self.assertEqual(other.snapshot(), expected)
+
+    def test_restore_not_a_snapshot_raises(self):
+        proc, _ = _make_processor()
+        self.assertRaises(ValueError, proc.restore, b"not a snapshot")
+
+    # clone
+
+    def test_clone_is_independent_copy(self):
+        proc = make_processor()
+        proc.bus.device("rom").load(0x0100, [
+            0x16, 0x00, 0xf8,   # movw hl,#0f800h
+            0x87,               # mov a,[hl]
+            0x41,               # inc a
+            0x97,               # mov [hl],a
+            0x86,               # incw hl
+            0xfa, 0xfa])        # br 0103h
+        proc.write_sp(0xFE00)
+        proc.pc = 0x0100
+        proc.run(1000)
+        clone = proc.clone()
+        self.assertEqual(clone.snapshot(), proc.snapshot())
+        clone.run(5000)
+        self.assertNotEqual(clone.snapshot(), proc.snapshot())
+        proc.run(5000)
+        self.assertEqual(clone.snapshot(), proc.snapshot())
+
+    def test_clone_shares_read_only_memory(self):
+        proc = make_processor()
+        clone = proc.clone()
+        self.assertIs(clone.bus.device("rom").data,
+                      proc.bus.device("rom").data)
+        self.assertIsNot(clone.bus.device("expansion_ram").data,
+                         proc.bus.device("expansion_ram").data)
+        clone.write_memory(0xF000, 0x42)
+        self.assertEqual(proc.read_memory(0xF000), 0x00)
+
+    def test_clone_devices_are_on_cloned_bus(self):
+        proc = make_processor()
+        clone = proc.clone()
+        for device in clone.bus._all_devices:
+            self.assertIs(device.bus, clone.bus)
+        self.assertIs(clone.bus.processor, clone)
+        self.assertIs(clone.bus.device("processor_status").processor, clone)
+
+    def test_clone_interrupts_requested_on_cloned_controller(self):
+        proc = make_processor()
+        clone = proc.clone()
+        clone.write_memory(0xFF80, 0x80)  # ADM00: start A/D conversion
+        ifs = [clone.bus.device("intc").read(r) for r in range(4)]
+        self.assertNotEqual(ifs, [0, 0, 0, 0])
+        self.assertEqual([proc.bus.device("intc").read(r) for r in range(4)],
+                         [0, 0, 0, 0])
+
+    def test_clone_copies_writable_memory_backed_by_buffer(self):
+        proc = Processor()
+        buffer = bytearray(0x10000)
+        proc.bus.add_device(MemoryDevice("ram", buffer=buffer), (0, 0xFFFF))
+        clone = proc.clone()
+        clone.write_memory(0x1000, 0x42)
+        self.assertEqual(buffer[0x1000], 0x00)
+        self.assertEqual(clone.read_memory(0x1000), 0x42)
+
+    def test_rom_buffer_shared_by_clone(self):
+        rom_data = bytearray([0xff]) * 0xF000
+        rom_data[0:4] = [0x00, 0x00, 0xfa, 0xfe]  # vector, br $
+        buffer = bytes(rom_data)
+        proc = make_processor(rom_buffer=buffer)
+        proc.reset()
+        clone = proc.clone()
+        self.assertIs(clone.bus.device("rom").data, proc.bus.device("rom").data)
+        self.assertEqual(clone.read_memory(0x0002), 0xfa)
+        clone.run(100)
+        self.assertEqual(clone.pc, 0x0002)
+
+    def test_clone_binds_data_access_to_cloned_bus(self):
+        proc = make_processor(cycle_mode=CycleMode.LITE, tick_quantum=64)
+        clone = proc.clone()
+        self.assertIs(clone._bus_read.__self__, clone.bus)
+        self.assertIs(clone.bus.tick.__self__, clone.bus)
+
+    def test_clone_discards_decoded_code_that_changes(self):
+        proc, mem = _make_processor()
+        proc.write_memory_bytes(0x1000, [0x41, 0xfa, 0xfd])  # inc a; br $-1
+        proc.pc = 0x1000
+        proc.step()
+        clone = proc.clone()
+        clone.write_memory(0x1000, 0x51)  # dec a
+        clone.pc = proc.pc = 0x1000
+        clone.step()
+        proc.step()
+        self.assertEqual(clone.read_gp_reg(Registers.A), 0)
+        self.assertEqual(proc.read_gp_reg(Registers.A), 2)
+
     # register banks
 
     def test_rb0_accesses_fef8_feff(self):
@@ -94,6 +445,59 @@ class ProcessorTests(unittest.TestCase):
         proc.write_rb(3)
         self.assertEqual(proc.read_psw(), 0b00101000)
 
+    def test_register_bank_follows_psw_written_through_bus(self):
+        proc, _ = _make_processor()
+        proc.write_memory(0xFEF1, 0x11) # rb1 A
+        proc.write_memory(0xFF1E, Flags.RBS0)
+        self.assertEqual(proc.read_gp_reg(Registers.A), 0x11)
+
+    def test_register_bank_follows_psw_written_by_instruction(self):
+        proc, _ = _make_processor()
+        proc.write_memory(0xFEE9, 0x22) # rb2 A
+        code = [0x11, 0x1e, Flags.RBS1] # mov psw,#20h
+        proc.write_memory_bytes(0, code)
+        proc.step()
+        self.assertEqual(proc.read_gp_reg(Registers.A), 0x22)
+
+    def test_registers_coherent_with_register_file_device(self):
+        proc = make_processor()
+        proc.write_rb(2)
+        proc.write_memory(0xFEE9, 0x42) # rb2 A
+        self.assertEqual(proc.read_gp_reg(Registers.A), 0x42)
+        proc.write_gp_regpair(RegisterPairs.HL, 0xABCD)
+        self.assertEqual(proc.read_memory(0xFEEE), 0xCD)
+        self.assertEqual(proc.read_memory(0xFEEF), 0xAB)
+
+    def test_registers_accessed_through_bus_without_memory(self):
+        proc = Processor()
+        proc.write_gp_reg(Registers.A, 0x42)
+        self.assertEqual(proc.read_gp_reg(Registers.A), 0)
+
+    # SP and PSW
+
+    def test_psw_written_through_to_memory(self):
+        proc, mem = _make_processor()
+        proc.write_psw(0x42)
+        self.assertEqual(mem.read(0xFF1E), 0x42)
+
+    def test_psw_follows_memory_written_through_bus(self):
+        proc, mem = _make_processor()
+        proc.write_memory(0xFF1E, 0xFF)
+        self.assertEqual(proc.read_psw(), 0xFB)  # bit 2 always reads 0
+
+    def test_sp_written_through_to_memory(self):
+        proc, mem = _make_processor()
+        proc.write_sp(0xFE1C)
+        self.assertEqual(mem.read(0xFF1C), 0x1C)
+        self.assertEqual(mem.read(0xFF1D), 0xFE)
+
+    def test_sp_follows_memory_written_by_instruction(self):
+        proc, mem = _make_processor()
+        code = [0xee, 0x1c, 0x34, 0x12] # movw sp,#1234h
+        proc.write_memory_bytes(0, code)
+        proc.step()
+        self.assertEqual(proc.read_sp(), 0x1234)
+
     # instructions
 
     # nop
@@ -1,10 +1,12 @@
 import unittest
+from k0emu import isa
 from k0emu.devices import MemoryDevice
-from k0emu.processor import Processor, Registers, RegisterPairs, Flags
+from k0emu.processor import (Processor, Registers, RegisterPairs, Flags,
+                             CycleMode)
 
 
-def _make_processor():
-    proc = Processor()
+def _make_processor(cycle_mode=None):
+    proc = Processor(cycle_mode=cycle_mode)
     mem = MemoryDevice("test_memory", size=0xFB00)
     proc.bus.add_device(mem, (0x0000, 0xFAFF))
     fast = MemoryDevice("fast_memory", size=0x0400, high_speed=True)
@@ -2067,3 +2069,54 @@ class CycleCountTests(unittest.TestCase):
         self.assertEqual(proc.total_cycles, 7)
 
 
+
+
+class LiteCycleModeTests(unittest.TestCase):
+
+    def test_default_mode_is_exact(self):
+        proc = Processor()
+        self.assertEqual(proc.cycle_mode, CycleMode.EXACT)
+
+    def test_exact_mode_counts_slow_data_access(self):
+        proc = _make_processor(CycleMode.EXACT)
+        proc.write_memory_bytes(0, [0x8e, 0x00, 0xFF])  # mov a,!0ff00h
+        proc.step()
+        self.assertEqual(proc.total_cycles, 9)
+
+    def test_lite_mode_ignores_slow_data_access(self):
+        proc = _make_processor(CycleMode.LITE)
+        proc.write_memory_bytes(0, [0x8e, 0x00, 0xFF])  # mov a,!0ff00h
+        proc.write_memory(0xFF00, 0x42)
+        proc.step()
+        self.assertEqual(proc.total_cycles, 8)
+        self.assertEqual(proc.read_gp_reg(Registers.A), 0x42)
+
+    def test_lite_mode_charges_table_cycles_for_every_instruction(self):
+        for instruction in isa.INSTRUCTIONS:
+            for opcode in instruction.opcodes:
+                prefix = [] if instruction.prefix is None else [
+                    instruction.prefix]
+                code = (prefix + [opcode, 0x20, 0x00, 0xF0])
+                code = code[:instruction.length]
+                proc = _make_processor(CycleMode.LITE)
+                proc.write_memory_bytes(0x1000, code)
+                proc.write_gp_regpair(RegisterPairs.HL, 0xF000)
+                proc.write_sp(0xFE00)
+                proc.pc = 0x1000
+                proc.step()
+                self.assertEqual(proc.total_cycles, instruction.cycles,
+                                 isa.describe(code))
+
+    def test_lite_mode_fast_forwards_idle_loop(self):
+        results = []
+        for fast_forward in (True, False):
+            proc = _make_processor(CycleMode.LITE)
+            proc.write_memory_bytes(0, [0x8e, 0x00, 0xFF,  # mov a,!0ff00h
+                                        0xfa, 0xfb])       # br $0
+            if not fast_forward:
+                proc._skip_idle_loop = lambda *args: 0
+            proc.run(max_cycles=1000)
+            results.append((proc.pc, proc.total_cycles,
+                            proc.read_gp_reg(Registers.A)))
+            self.assertEqual(proc.read_memory(0xFF00), 0)
+        self.assertEqual(results[0], results[1])
@@ -8,6 +8,7 @@ and validates flag preservation rules.
 import random
 import unittest
 from k0emu.devices import MemoryDevice
+from k0emu import processor
 from k0emu.processor import Processor, Registers, RegisterPairs, Flags, RunState
 
 
@@ -4606,6 +4607,105 @@ class TestAdjbs(unittest.TestCase):
         self.assertTrue(psw & Flags.Z)
 
 
+def _reference_adjba(a, cy, ac):
+    """Decimal adjust after addition, following the truth table in the
+    78K/0 instruction user's manual."""
+    low = a & 0x0F
+    high = a >> 4
+    if ac == 0:
+        if low <= 9:
+            if high <= 9 and cy == 0:
+                return a, 0, 0
+            return (a + 0x60) & 0xFF, 1, 0
+        if high < 9 and cy == 0:
+            return (a + 0x06) & 0xFF, 0, 1
+        return (a + 0x66) & 0xFF, 1, 1
+    if high <= 9 and cy == 0:
+        return (a + 0x06) & 0xFF, 0, 0
+    return (a + 0x66) & 0xFF, 1, 0
+
+
+def _reference_adjbs(a, cy, ac):
+    """Decimal adjust after subtraction, following the truth table in the
+    78K/0 instruction user's manual."""
+    adjust = (0x60 if cy else 0) | (0x06 if ac else 0)
+    return (a - adjust) & 0xFF, cy, 0
+
+
+class TestDecimalAdjustExhaustive(unittest.TestCase):
+    """ADJBA/ADJBS for all 256 values of A with every CY/AC combination."""
+
+    def _check(self, opcode2, reference):
+        proc, _ = _make_processor()
+        proc.write_memory_bytes(0, [0x61, opcode2])
+        for cy in (0, 1):
+            for ac in (0, 1):
+                for a in range(256):
+                    init_psw = Flags.IE | Flags.RBS1 | Flags.Z
+                    if cy:
+                        init_psw |= Flags.CY
+                    if ac:
+                        init_psw |= Flags.AC
+                    proc.write_psw(init_psw)
+                    proc.write_gp_reg(Registers.A, a)
+                    proc.pc = 0
+                    proc.step()
+
+                    exp_a, exp_cy, exp_ac = reference(a, cy, ac)
+                    msg = "a=0x%02x cy=%d ac=%d" % (a, cy, ac)
+                    psw = proc.read_psw()
+                    self.assertEqual(proc.read_gp_reg(Registers.A), exp_a, msg)
+                    self.assertEqual(bool(psw & Flags.CY), bool(exp_cy), msg)
+                    self.assertEqual(bool(psw & Flags.AC), bool(exp_ac), msg)
+                    self.assertEqual(bool(psw & Flags.Z), exp_a == 0, msg)
+                    self.assertEqual(psw & (Flags.IE | Flags.RBS1),
+                                     Flags.IE | Flags.RBS1, msg)
+
+    def test_adjba_all_1024(self):
+        self._check(0x80, _reference_adjba)
+
+    def test_adjbs_all_1024(self):
+        self._check(0x90, _reference_adjbs)
+
+
+def _reference_carry_table(operation):
+    """ADD or SUB lookup table built one entry at a time, as it was before
+    the rows were filled from slices."""
+    table = []
+    for carry in (0, 1):
+        for a in range(256):
+            for b in range(256):
+                flags = 0
+                if operation == "add":
+                    if (a & 0x0F) + (b & 0x0F) + carry > 0x0F:
+                        flags |= Flags.AC
+                    total = a + b + carry
+                    if total > 0xFF:
+                        flags |= Flags.CY
+                else:
+                    if ((a & 0x0F) - (b & 0x0F) - carry) & 0x10:
+                        flags |= Flags.AC
+                    total = a - b - carry
+                    if total < 0:
+                        flags |= Flags.CY
+                if total & 0xFF == 0:
+                    flags |= Flags.Z
+                table.append((total & 0xFF) | (flags << 8))
+    return table
+
+
+class TestCarryTablesExhaustive(unittest.TestCase):
+    """ADD/SUB lookup tables for all 131072 combinations of A, B, and CY."""
+
+    def test_add_table(self):
+        self.assertEqual(list(processor._ADD_TABLE),
+                         _reference_carry_table("add"))
+
+    def test_sub_table(self):
+        self.assertEqual(list(processor._SUB_TABLE),
+                         _reference_carry_table("sub"))
+
+
 class TestPrefix71BitOps(unittest.TestCase):
     """SET1/CLR1/MOV1/AND1/OR1/XOR1 on SFR and [HL] bits via prefix 0x71."""
 
@@ -5595,7 +5695,7 @@ class TestInterruptDelay(unittest.TestCase):
         proc._inst_cycles = 0
         opcode = proc._consume_byte()
         handler = proc._opcodes_unprefixed[opcode]
-        handler(opcode)
+        handler(proc, opcode)
         return proc._interrupt_delayed
 
     def test_reti_sets_interrupt_delayed(self):
@@ -1,6 +1,7 @@
 import unittest
-from k0emu.devices import MemoryDevice, InterruptControllerDevice, WatchTimerDevice
-from k0emu.processor import Processor, Flags, Registers, RunState
+from k0emu.devices import (MemoryDevice, InterruptControllerDevice,
+                           WatchTimerDevice, FreeRunningTimerDevice)
+from k0emu.processor import Processor, Flags, Registers, RunState, StopReason
 
 
 class _TestPeripheral(object):
@@ -363,6 +364,267 @@ class HaltTests(unittest.TestCase):
         # it executes the next instruction instead of vectoring
         self.assertEqual(proc.pc, 2)
 
+    # fast-forward
+
+    def _make_halted_processor(self):
+        proc, mem, intc, wt = _make_processor_with_timer()
+        mem.write(0, 0x71)
+        mem.write(1, 0x10)
+        mem.write(0x0024, 0x00)
+        mem.write(0x0025, 0x20)
+        wt.write(0, 0x01)  # INTWTNI0 every 2048 cycles
+        intc.write(intc.MK1L, intc.read(intc.MK1L) & 0xFE)
+        proc.write_psw(Flags.IE | Flags.ISP)
+        proc.write_sp(0xFE00)
+        proc.pc = 0
+        return proc
+
+    def test_step_fast_forwards_halt_to_next_event(self):
+        proc = self._make_halted_processor()
+        proc.step()
+        # the last HALT (3 cycles) that ends before the timer fires at 2048
+        self.assertEqual(proc.total_cycles, 2046)
+        self.assertEqual(proc.run_state, RunState.HALTED)
+        self.assertEqual(proc.pc, 0)
+
+    def test_step_fast_forward_wakes_at_same_cycle(self):
+        proc = self._make_halted_processor()
+        self._run_until_halt_wakes(proc)
+        # timer fires at the end of the HALT ending at 2049, the interrupt
+        # controller posts it at the end of the next one
+        self.assertEqual(proc.total_cycles, 2052)
+        self.assertEqual(proc.pc, 0x2000)
+
+    def test_run_does_not_fast_forward_past_max_cycles(self):
+        proc = self._make_halted_processor()
+        stop_reason, cycles = proc.run(1000)
+        self.assertEqual(stop_reason, StopReason.MAX_CYCLES)
+        self.assertEqual(cycles, 1002)
+        self.assertEqual(proc.total_cycles, 1002)
+
+    def test_run_fast_forward_wakes_at_same_cycle(self):
+        proc = self._make_halted_processor()
+        stop_reason, cycles = proc.run(100000, until_pc=0x2000)
+        self.assertEqual(stop_reason, StopReason.UNTIL_PC)
+        self.assertEqual(cycles, 2052)
+
+    def test_halt_not_fast_forwarded_without_events(self):
+        proc, mem, intc, wt = _make_processor_with_timer()
+        mem.write(0, 0x71)
+        mem.write(1, 0x10)
+        proc.pc = 0
+        proc.step()
+        self.assertEqual(proc.total_cycles, 3)
+        self.assertEqual(proc.run_state, RunState.HALTED)
+
+
+class IdleLoopTests(unittest.TestCase):
+    """Tests for fast-forwarding loops that poll for a device event."""
+
+    # bf IF1L.0,$0 polls for INTWTNI0 with interrupts disabled
+    POLL = [0x31, 0x07, 0xe2, 0xfc]
+
+    def _make_polling_processor(self, code=POLL, fast_forward=True):
+        proc, mem, intc, wt = _make_processor_with_timer()
+        for address, value in enumerate(code):
+            mem.write(address, value)
+        wt.write(0, 0x01)  # INTWTNI0 every 2048 cycles
+        proc.write_sp(0xFE00)
+        proc.pc = 0
+        if not fast_forward:
+            proc._skip_idle_loop = lambda *args: 0
+        return proc, mem
+
+    def _step_until_pc_leaves_loop(self, proc, max_steps=10000):
+        for steps in range(1, max_steps + 1):
+            proc.step()
+            if proc.pc >= len(self.POLL):
+                return steps
+        self.fail("loop did not exit within %d steps" % max_steps)
+
+    def test_step_fast_forwards_polling_loop(self):
+        proc, _ = self._make_polling_processor()
+        steps = self._step_until_pc_leaves_loop(proc)
+        self.assertLess(steps, 50)
+        self.assertGreater(proc.total_cycles, 2048)
+
+    def test_step_fast_forward_exits_at_same_cycle(self):
+        proc, _ = self._make_polling_processor()
+        self._step_until_pc_leaves_loop(proc)
+        expected, _ = self._make_polling_processor(fast_forward=False)
+        self._step_until_pc_leaves_loop(expected)
+        self.assertEqual(proc.total_cycles, expected.total_cycles)
+
+    def test_run_fast_forward_exits_at_same_cycle(self):
+        results = []
+        for fast_forward in (True, False):
+            proc, _ = self._make_polling_processor(fast_forward=fast_forward)
+            results.append(proc.run(100000, until_pc=4))
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[0][0], StopReason.UNTIL_PC)
+
+    def test_run_does_not_fast_forward_past_max_cycles(self):
+        results = []
+        for fast_forward in (True, False):
+            proc, _ = self._make_polling_processor(fast_forward=fast_forward)
+            results.append(proc.run(1000))
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[0][0], StopReason.MAX_CYCLES)
+
+    def test_run_stops_at_breakpoint_in_loop(self):
+        code = [0x00,                   # nop
+                0x31, 0x07, 0xe2, 0xfb]  # bf IF1L.0,$0
+        proc, _ = self._make_polling_processor(code)
+        for _ in range(30):
+            stop_reason, cycles = proc.run(100000, until_pc=1)
+            self.assertEqual(stop_reason, StopReason.UNTIL_PC)
+            self.assertLess(cycles, 20)
+
+    def test_loop_that_writes_memory_not_fast_forwarded(self):
+        code = [0x11, 0x20, 0x00,       # mov 0fe20h,#0
+                0x31, 0x07, 0xe2, 0xf9]  # bf IF1L.0,$0
+        proc, _ = self._make_polling_processor(code)
+        for _ in range(60):
+            proc.step()
+        expected, _ = self._make_polling_processor(code, fast_forward=False)
+        for _ in range(60):
+            expected.step()
+        self.assertEqual(proc.total_cycles, expected.total_cycles)
+        self.assertLess(proc.total_cycles, 2048)
+
+    def test_loop_that_changes_registers_not_fast_forwarded(self):
+        code = [0x41,                   # inc a
+                0x31, 0x07, 0xe2, 0xfb]  # bf IF1L.0,$0
+        proc, _ = self._make_polling_processor(code)
+        for _ in range(60):
+            proc.step()
+        self.assertLess(proc.total_cycles, 2048)
+
+    def test_loop_that_reads_volatile_device_not_fast_forwarded(self):
+        proc, mem, intc, wt = _make_processor_with_timer()
+        proc.bus.add_device(FreeRunningTimerDevice("tm"), (0xFF42, 0xFF43))
+        code = [0x31, 0x77, 0x43, 0xfc]  # bf 0ff43h.7,$0
+        for address, value in enumerate(code):
+            mem.write(address, value)
+        wt.write(0, 0x01)
+        proc.pc = 0
+        for _ in range(60):
+            proc.step()
+        self.assertLess(proc.total_cycles, 2048)
+
+    def test_loop_not_fast_forwarded_without_events(self):
+        proc, mem, intc, wt = _make_processor_with_timer()
+        for address, value in enumerate(self.POLL):
+            mem.write(address, value)
+        proc.pc = 0
+        for _ in range(60):
+            proc.step()
+        self.assertLess(proc.total_cycles, 2048)
+
+
+class DelayLoopTests(unittest.TestCase):
+    """Tests for fast-forwarding DBNZ delay loops."""
+
+    ISR_ADDR = 0x2000
+    WTNI_VECTOR = 0x0024
+
+    def _make_delay_processor(self, code, fast_forward=True):
+        proc, mem, intc, wt = _make_processor_with_timer()
+        for address, value in enumerate(code):
+            mem.write(address, value)
+        wt.write(0, 0x01)  # INTWTNI0 every 2048 cycles
+        proc.write_sp(0xFE00)
+        proc.pc = 0
+        # cycles skipped by each fast-forward
+        self.skipped = []
+        skip_delay_loop = proc._skip_delay_loop
+        def record(*args):
+            cycles = skip_delay_loop(*args) if fast_forward else 0
+            self.skipped.append(cycles)
+            return cycles
+        proc._skip_delay_loop = record
+        return proc, mem, intc
+
+    def test_dbnz_b_loop_fast_forwarded(self):
+        proc, _, _ = self._make_delay_processor([0x8b, 0xfe])  # dbnz b,$
+        proc.write_gp_reg(Registers.B, 0)
+        self.assertEqual(proc.run(100000, until_pc=2),
+                         (StopReason.UNTIL_PC, 1536))
+        self.assertEqual(proc.read_gp_reg(Registers.B), 0)
+        self.assertEqual(sum(self.skipped), 1524)
+
+    def test_dbnz_saddr_loop_fast_forwarded(self):
+        proc, mem, _ = self._make_delay_processor(
+            [0x04, 0x20, 0xfd])  # dbnz 0fe20h,$
+        mem.write(0xFE20, 10)
+        self.assertEqual(proc.run(100000, until_pc=3),
+                         (StopReason.UNTIL_PC, 100))
+        self.assertEqual(mem.read(0xFE20), 0)
+        self.assertEqual(sum(self.skipped), 80)
+
+    def test_loop_with_nops_fast_forwarded(self):
+        code = [0x00, 0x00,             # nop, nop
+                0x8b, 0xfc]             # dbnz b,$0
+        proc, _, _ = self._make_delay_processor(code)
+        proc.write_gp_reg(Registers.B, 100)
+        self.assertEqual(proc.run(100000, until_pc=4),
+                         (StopReason.UNTIL_PC, 1000))
+        self.assertEqual(sum(self.skipped), 980)
+
+    def test_sfr_counter_not_fast_forwarded(self):
+        proc, mem, _ = self._make_delay_processor(
+            [0x04, 0x00, 0xfd])  # dbnz 0ff00h,$
+        mem.write(0xFF00, 10)
+        self.assertEqual(proc.run(100000, until_pc=3),
+                         (StopReason.UNTIL_PC, 100))
+        self.assertEqual(sum(self.skipped), 0)
+
+    def test_step_does_not_fast_forward(self):
+        proc, _, _ = self._make_delay_processor([0x8b, 0xfe])  # dbnz b,$
+        proc.write_gp_reg(Registers.B, 0)
+        proc.step()
+        self.assertEqual(proc.pc, 0)
+        self.assertEqual(proc.read_gp_reg(Registers.B), 255)
+        self.assertEqual(proc.total_cycles, 6)
+        self.assertEqual(self.skipped, [])
+
+    def test_loop_stops_at_device_event(self):
+        code = [0x8b, 0xfe,             # dbnz b,$
+                0x8a, 0xfc]             # dbnz c,$0
+        results = []
+        for fast_forward in (True, False):
+            proc, mem, intc = self._make_delay_processor(code, fast_forward)
+            mem.write(self.WTNI_VECTOR, self.ISR_ADDR & 0xFF)
+            mem.write(self.WTNI_VECTOR + 1, self.ISR_ADDR >> 8)
+            intc.write(intc.MK1L, intc.read(intc.MK1L) & 0xFE)
+            proc.write_psw(Flags.IE | Flags.ISP)
+            results.append((proc.run(100000, until_pc=self.ISR_ADDR),
+                            proc.read_gp_reg(Registers.B),
+                            proc.read_gp_reg(Registers.C),
+                            proc.read_memory_word(0xFDFE)))
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[0][0][0], StopReason.UNTIL_PC)
+
+    def test_run_does_not_fast_forward_past_max_cycles(self):
+        results = []
+        for fast_forward in (True, False):
+            proc, _, _ = self._make_delay_processor([0x8b, 0xfe],
+                                                    fast_forward)
+            results.append((proc.run(1000), proc.read_gp_reg(Registers.B)))
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[0][0][0], StopReason.MAX_CYCLES)
+
+    def test_run_stops_at_breakpoint_in_loop(self):
+        code = [0x00,                   # nop
+                0x00,                   # nop
+                0x8b, 0xfc]             # dbnz b,$0
+        proc, _, _ = self._make_delay_processor(code)
+        proc.run(100000, until_pc=1)
+        for expected in range(255, 245, -1):
+            stop_reason, cycles = proc.run(100000, until_pc=1)
+            self.assertEqual(stop_reason, StopReason.UNTIL_PC)
+            self.assertEqual(proc.read_gp_reg(Registers.B), expected)
+
 
 class HaltReturnAddressTests(unittest.TestCase):
     """Tests that HALT pushes the correct return address.
@@ -613,16 +875,10 @@ class HaltReturnAddressTests(unittest.TestCase):
         """HALT re-executes many times before the timer fires.
         When it finally fires, the return address is still correct."""
         proc, mem, intc, wt = self._make_halt_test()
-        # Step 100 times — all should re-execute HALT
-        for _ in range(100):
-            proc.step()
-            if proc.pc != self.HALT_ADDR:
-                break
-        else:
-            # Timer hasn't fired after 100 steps; expected with 2048 interval
-            pass
-        # Now run to ISR
+        # step() fast-forwards through the HALT re-executions that end
+        # before the timer fires
         self._run_until_pc_at(proc, self.ISR_ADDR)
+        self.assertGreaterEqual(proc.total_cycles, wt.prescaler_interval)
         proc.step()  # EI
         proc.step()  # RETI
         self.assertEqual(proc.pc, self.AFTER_HALT)
@@ -723,6 +979,9 @@ class RunStateTests(unittest.TestCase):
     def test_halt_stays_halted_on_reexecution(self):
         """Repeated HALT re-executions remain HALTED."""
         proc, mem, intc, wt = self._make_halt_test()
+        # mask INTWTNI0 so that step() fast-forwarding to each timer
+        # event does not wake the CPU
+        intc.write(intc.MK1L, 0xFF)
         proc.step()
         self.assertEqual(proc.run_state, RunState.HALTED)
         proc.step()
@@ -939,3 +1198,60 @@ class InterruptHoldTests(unittest.TestCase):
         self.assertEqual(proc.pc, 1)
         proc.step()
         self.assertEqual(proc.pc, self.ISR_ADDR)
+
+
+class TickQuantumTests(unittest.TestCase):
+    """Tests for the interrupt latency of Bus.set_tick_quantum()."""
+
+    def _make_processor(self, tick_quantum, code):
+        proc, mem, intc, wt = _make_processor_with_timer()
+        proc.bus.set_tick_quantum(tick_quantum)
+        mem.load(0, code)
+        mem.write(0x0024, 0x00)
+        mem.write(0x0025, 0x20)
+        intc.write(intc.MK1L, intc.read(intc.MK1L) & 0xFE)
+        proc.write_psw(Flags.IE | Flags.ISP)
+        proc.write_sp(0xFE00)
+        proc.pc = 0
+        return proc, intc, wt
+
+    def test_processor_sets_tick_quantum(self):
+        proc = Processor(tick_quantum=64)
+        self.assertEqual(proc.bus.tick_quantum, 64)
+
+    def test_quantum_of_one_cycle_is_exact(self):
+        for tick_quantum in (None, 1):
+            proc, intc, wt = self._make_processor(tick_quantum,
+                                                  [0x00, 0xfa, 0xfd])
+            wt.write(0, 0x01)  # INTWTNI0 every 2048 cycles
+            proc.run(100000, until_pc=0x2000)
+            self.assertEqual(proc.total_cycles, 2050)
+
+    def test_interrupt_dispatched_up_to_two_quanta_late(self):
+        proc, intc, wt = self._make_processor(500, [0x00, 0xfa, 0xfd])
+        wt.write(0, 0x01)  # INTWTNI0 every 2048 cycles
+        proc.run(100000, until_pc=0x2000)
+        # the timer fires at the boundary after 2048, and the interrupt
+        # controller posts the interrupt at the boundary after that
+        self.assertEqual(proc.total_cycles, 3000)
+
+    def test_halt_fast_forwarded_to_quantum_boundary(self):
+        proc, intc, wt = self._make_processor(512, [0x71, 0x10])  # halt
+        wt.write(0, 0x01)  # INTWTNI0 every 2048 cycles
+        steps = 0
+        while proc.pc != 0x2000:
+            proc.step()
+            steps += 1
+        self.assertEqual(proc.total_cycles, 2562)
+        self.assertLess(steps, 5)
+
+    def test_posted_interrupt_dispatched_without_waiting_for_quantum(self):
+        proc, intc, wt = self._make_processor(512, [0x7a, 0x1e,  # ei
+                                                    0x00, 0x00])  # nop
+        proc.write_psw(Flags.ISP)
+        intc.write(intc.IF1L, 0x01)
+        proc.bus.tick(512)  # the interrupt controller posts it
+        proc.step()
+        self.assertEqual(proc.pc, 2)
+        proc.step()  # one instruction is executed after EI
+        self.assertEqual(proc.pc, 0x2000)
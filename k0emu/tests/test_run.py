@@ -1,4 +1,6 @@
 import io
+import os
+import tempfile
 import unittest
 from k0emu.devices import MemoryDevice
 from k0emu.processor import Processor
@@ -68,6 +70,40 @@ class RunTests(unittest.TestCase):
         self.assertIn("NOT IMPLEMENTED", lines[0])
 
 
+class WatchTests(unittest.TestCase):
+
+    def test_watch_saves_translation_cache(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            for _ in range(2):
+                output = io.StringIO()
+                runner = Runner(output=output, cache_dir=cache_dir)
+                runner.load(bytes([0x00, 0x00, 0x06]))  # nop, nop, undefined
+                runner.watch()
+                self.assertIn("Unimplemented opcode at 0002",
+                              output.getvalue())
+                self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+
+class AdvanceTests(unittest.TestCase):
+
+    def test_advance_restores_checkpoint_from_earlier_run(self):
+        rom_data = bytes([0x00, 0x00, 0xfa, 0xfe])  # nop, nop, br $
+        with tempfile.TemporaryDirectory() as cache_dir:
+            restored = []
+            for _ in range(2):
+                runner = Runner(output=io.StringIO(), cache_dir=cache_dir)
+                runner.load(rom_data)
+                restored.append(runner.advance("booted", 100000))
+                self.assertGreaterEqual(runner.proc.total_cycles, 100000)
+            self.assertEqual(restored, [False, True])
+
+    def test_advance_without_cache_runs(self):
+        runner = Runner(output=io.StringIO())
+        runner.load(bytes([0x00, 0x00, 0xfa, 0xfe]))  # nop, nop, br $
+        self.assertFalse(runner.advance("booted", 1000))
+        self.assertGreaterEqual(runner.proc.total_cycles, 1000)
+
+
 class PrintMemoryMapTests(unittest.TestCase):
 
     def test_prints_all_regions(self):
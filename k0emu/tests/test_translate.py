@@ -0,0 +1,452 @@
+import copy
+import os
+import random
+import tempfile
+import unittest
+from unittest import mock
+from k0emu.devices import (MemoryDevice, InterruptControllerDevice,
+                           WatchTimerDevice)
+from k0emu.processor import Processor, Flags, Registers, RunState, CycleMode
+from k0emu.translate import BlockTranslator, TranslationCache
+
+
+def _make_processor():
+    proc = Processor()
+    mem = MemoryDevice("test_memory", size=0x10000)
+    proc.bus.add_device(mem, (0x0000, 0xFFFF))
+    return proc, mem
+
+
+def _state(proc, mem):
+    return (proc.pc, proc.total_cycles, proc.run_state,
+            bytes(mem.read(address) for address in range(0x10000)))
+
+
+# register-only instructions that are compiled inline, plus a few that
+# call their handlers (memory, stack, and register bank selection)
+_INSTRUCTIONS = (
+    [[0x00], [0x01], [0x20], [0x21], [0x24], [0x25], [0x26], [0x27]] +
+    [[op] for op in (0x30, 0x32, 0x33, 0x34, 0x35, 0x36, 0x37)] +
+    [[op] for op in range(0x40, 0x48)] +
+    [[op] for op in range(0x50, 0x58)] +
+    [[op] for op in (0x60, 0x62, 0x63, 0x64, 0x65, 0x66, 0x67)] +
+    [[op] for op in (0x70, 0x72, 0x73, 0x74, 0x75, 0x76, 0x77)] +
+    [[op] for op in (0x80, 0x82, 0x84, 0x86, 0x90, 0x92, 0x94, 0x96)] +
+    [[op] for op in (0xc2, 0xc4, 0xc6, 0xd2, 0xd4, 0xd6, 0xe2, 0xe4, 0xe6)] +
+    [[op, None] for op in range(0xa0, 0xa8)] +
+    [[op, None, None] for op in (0x10, 0x12, 0x14, 0x16)] +
+    [[op, None] for op in (0x0d, 0x1d, 0x2d, 0x3d, 0x4d, 0x5d, 0x6d, 0x7d)] +
+    [[op, None, None] for op in (0xca, 0xda, 0xea)] +
+    [[0x61, op] for op in range(0x80) if op not in
+        (0x09, 0x19, 0x29, 0x39, 0x49, 0x59, 0x69, 0x79)] +
+    [[0x9e, 0x00, 0x20],    # mov !2000h,a
+     [0x8e, 0x01, 0x20],    # mov a,!2001h
+     [0xb1], [0xb0],        # push ax, pop ax
+     [0x61, 0xd0],          # sel rb0
+     [0x61, 0xd8]]          # sel rb1
+    )
+
+
+def _random_program(rand, count):
+    code = []
+    for _ in range(count):
+        inst = rand.choice(_INSTRUCTIONS)
+        code.extend(rand.randrange(256) if b is None else b for b in inst)
+    code.extend([0xfa, 0xfe])  # br $
+    return code
+
+
+class BlockTranslatorTests(unittest.TestCase):
+
+    # equivalence with step()
+
+    def test_random_programs_match_step(self):
+        rand = random.Random(78)
+        for _ in range(200):
+            code = _random_program(rand, rand.randrange(1, 40))
+            psw = rand.randrange(256) & ~(Flags.IE | Flags.UNUSED)
+            regs = [rand.randrange(256) for _ in range(32)]
+            results = []
+            for translated in (False, True):
+                proc, mem = _make_processor()
+                proc.write_memory_bytes(0x1000, code)
+                proc.write_memory_bytes(0xFEE0, regs)
+                proc.write_psw(psw)
+                proc.write_sp(0xFE00)
+                proc.pc = 0x1000
+                if translated:
+                    translator = BlockTranslator(proc)
+                    while proc.total_cycles < 300:
+                        translator.execute(300 - proc.total_cycles)
+                else:
+                    while proc.total_cycles < 300:
+                        proc.step()
+                results.append(_state(proc, mem))
+            self.assertEqual(results[0], results[1], code)
+
+    def test_execute_returns_next_pc_and_cycles(self):
+        proc, mem = _make_processor()
+        proc.write_memory_bytes(0, [0xa1, 0x42,     # mov a,#42h
+                                    0x9b, 0x00, 0x10])  # br !1000h
+        translator = BlockTranslator(proc)
+        pc, cycles = translator.execute(1000)
+        self.assertEqual(pc, 0x1000)
+        self.assertEqual(proc.pc, 0x1000)
+        self.assertEqual(cycles, proc.total_cycles)
+        self.assertEqual(proc.read_gp_reg(Registers.A), 0x42)
+
+    def test_execute_stops_after_max_cycles(self):
+        proc, mem = _make_processor()
+        proc.write_memory_bytes(0, [0x00, 0x00, 0x00, 0xfa, 0xfe])
+        translator = BlockTranslator(proc)
+        pc, cycles = translator.execute(3)
+        self.assertEqual(pc, 2)
+        self.assertEqual(cycles, 4)
+
+    def test_execute_steps_code_outside_memory(self):
+        proc = Processor()
+        translator = BlockTranslator(proc)
+        pc, cycles = translator.execute(1000)
+        self.assertEqual(pc, 1)  # unmapped bus reads 0x00 (nop)
+
+    # invalidation
+
+    def test_block_discarded_when_code_is_written(self):
+        proc, mem = _make_processor()
+        proc.write_memory_bytes(0, [0xa1, 0x42, 0xfa, 0xfe])  # mov a,#42h
+        translator = BlockTranslator(proc)
+        translator.execute(1000)
+        proc.write_memory(1, 0x99)
+        proc.pc = 0
+        translator.execute(1000)
+        self.assertEqual(proc.read_gp_reg(Registers.A), 0x99)
+
+    def test_block_discarded_when_code_is_loaded(self):
+        proc, mem = _make_processor()
+        proc.write_memory_bytes(0, [0xa1, 0x42, 0xfa, 0xfe])  # mov a,#42h
+        translator = BlockTranslator(proc)
+        translator.execute(1000)
+        mem.load(0, [0xa2, 0x42])  # mov c,#42h
+        proc.pc = 0
+        proc.write_gp_reg(Registers.A, 0)
+        translator.execute(1000)
+        self.assertEqual(proc.read_gp_reg(Registers.A), 0)
+        self.assertEqual(proc.read_gp_reg(Registers.C), 0x42)
+
+    def test_clone_does_not_share_blocks(self):
+        proc, mem = _make_processor()
+        proc.write_memory_bytes(0, [0xa1, 0x42, 0xfa, 0xfe])  # mov a,#42h
+        translator = BlockTranslator(proc)
+        translator.execute(1000)
+        block = translator._blocks[0]
+        clone = proc.clone()
+        clone_translator = BlockTranslator(clone)
+        clone.write_memory(1, 0x99)  # code modified in the clone only
+        self.assertTrue(block.live[0])
+        self.assertIs(translator._blocks[0], block)
+        clone.pc = 0
+        clone_translator.execute(1000)
+        self.assertEqual(clone.read_gp_reg(Registers.A), 0x99)
+        clone_block = clone_translator._blocks[0]
+        proc.write_memory(1, 0x77)  # code modified in the original only
+        self.assertTrue(clone_block.live[0])
+        self.assertIsNone(translator._blocks[0])
+        proc.pc = 0
+        translator.execute(1000)
+        self.assertEqual(proc.read_gp_reg(Registers.A), 0x77)
+
+    def test_copy_of_translator_starts_without_blocks(self):
+        proc, mem = _make_processor()
+        proc.write_memory_bytes(0, [0xa1, 0x42, 0xfa, 0xfe])  # mov a,#42h
+        translator = BlockTranslator(proc)
+        translator.execute(1000)
+        proc_copy, translator_copy = copy.deepcopy((proc, translator))
+        self.assertIs(translator_copy.processor, proc_copy)
+        self.assertEqual(translator_copy._blocks.count(None),
+                         len(translator_copy._blocks))
+        proc_copy.write_memory(1, 0x99)
+        self.assertTrue(translator._blocks[0].live[0])
+        proc_copy.pc = 0
+        translator_copy.execute(1000)
+        self.assertEqual(proc_copy.read_gp_reg(Registers.A), 0x99)
+
+    def test_block_that_modifies_itself(self):
+        proc, mem = _make_processor()
+        proc.write_memory_bytes(0, [0xa1, 0x55,         # mov a,#55h
+                                    0x9e, 0x06, 0x00,   # mov !0006h,a
+                                    0xa2, 0x00,         # mov c,#00h  (modified)
+                                    0xfa, 0xfe])        # br $
+        translator = BlockTranslator(proc)
+        while proc.pc != 7:
+            translator.execute(1000)
+        self.assertEqual(proc.read_gp_reg(Registers.C), 0x55)
+
+    # interrupts
+
+    def test_interrupt_dispatched_between_instructions(self):
+        proc = Processor()
+        mem = MemoryDevice("test_memory", size=0xFFE0)
+        proc.bus.add_device(mem, (0x0000, 0xFFDF))
+        intc = InterruptControllerDevice("intc")
+        proc.bus.add_device(intc, (0xFFE0, 0xFFEB))
+        proc.bus.set_interrupt_controller(intc)
+        intc.connect(self, 0, InterruptControllerDevice.INTP0)
+        intc.write(intc.MK0L, 0xFD)
+        proc.write_memory_bytes(0x0006, [0x00, 0x20])  # INTP0 vector
+        proc.write_memory_bytes(0x1000, [0x00, 0x00, 0x00, 0xfa, 0xfe])
+        proc.write_psw(Flags.IE | Flags.ISP)
+        proc.write_sp(0xFE00)
+        proc.pc = 0x1000
+        intc.interrupt(self, 0)
+        translator = BlockTranslator(proc)
+        pc, cycles = translator.execute(1000)
+        self.assertEqual(pc, 0x2000)
+        self.assertEqual(proc.read_memory_word(0xFDFD), 0x1001)
+
+    def test_halt_ends_block(self):
+        proc, mem = _make_processor()
+        proc.write_memory_bytes(0, [0x00, 0x71, 0x10])  # nop, halt
+        translator = BlockTranslator(proc)
+        pc, cycles = translator.execute(1000)
+        self.assertEqual(pc, 1)
+        self.assertEqual(proc.run_state, RunState.HALTED)
+
+    def test_halt_fast_forwarded_until_max_cycles(self):
+        proc = Processor()
+        mem = MemoryDevice("test_memory", size=0xFF41)
+        proc.bus.add_device(mem, (0x0000, 0xFF40))
+        wt = WatchTimerDevice("watch_timer")
+        proc.bus.add_device(wt, (0xFF41, 0xFF41))
+        wt.write(0, 0x01)  # event every 2048 cycles
+        proc.write_memory_bytes(0, [0x71, 0x10])  # halt
+        translator = BlockTranslator(proc)
+        pc, cycles = translator.execute(1000)
+        self.assertEqual(pc, 0)
+        self.assertEqual(cycles, 999)
+        self.assertEqual(proc.total_cycles, 999)
+
+    def test_polling_loop_fast_forwarded(self):
+        results = []
+        for fast_forward in (True, False):
+            proc = Processor()
+            mem = MemoryDevice("test_memory", size=0xFF41)
+            proc.bus.add_device(mem, (0x0000, 0xFF40))
+            intc = InterruptControllerDevice("intc")
+            proc.bus.add_device(intc, (0xFFE0, 0xFFEB))
+            proc.bus.set_interrupt_controller(intc)
+            wt = WatchTimerDevice("watch_timer")
+            proc.bus.add_device(wt, (0xFF41, 0xFF41))
+            intc.connect(wt, wt.INT_PRESCALER, intc.INTWTNI0)
+            wt.write(0, 0x01)  # INTWTNI0 every 2048 cycles
+            proc.write_memory_bytes(0, [0x31, 0x07, 0xe2, 0xfc,  # bf IF1L.0,$0
+                                        0xfa, 0xfe])             # br $
+            if not fast_forward:
+                proc._skip_idle_loop = lambda *args: 0
+            translator = BlockTranslator(proc)
+            executions = 0
+            while proc.pc < 4:
+                translator.execute(100000)
+                executions += 1
+            results.append((proc.total_cycles, executions))
+        self.assertEqual(results[0][0], results[1][0])
+        self.assertLess(results[0][1], 50)
+        self.assertGreater(results[1][1], 100)
+
+    def test_delay_loop_fast_forwarded(self):
+        results = []
+        for fast_forward in (True, False):
+            proc, mem = _make_processor()
+            proc.write_memory_bytes(0, [0x00,          # nop
+                                        0x8b, 0xfd,    # dbnz b,$0
+                                        0xfa, 0xfe])   # br $
+            if not fast_forward:
+                proc._skip_delay_loop = lambda *args: 0
+            translator = BlockTranslator(proc)
+            executions = 0
+            while proc.pc < 3:
+                translator.execute(100000)
+                executions += 1
+            results.append((proc.total_cycles, executions))
+        self.assertEqual(results[0][0], results[1][0])
+        self.assertLess(results[0][1], 5)
+        self.assertGreater(results[1][1], 100)
+
+
+def _make_rom_processor(rom_data, cycle_mode=None):
+    proc = Processor(cycle_mode=cycle_mode)
+    rom = MemoryDevice("rom", size=0x8000, writable=False)
+    proc.bus.add_device(rom, (0x0000, 0x7FFF))
+    ram = MemoryDevice("ram", size=0x8000)
+    proc.bus.add_device(ram, (0x8000, 0xFFFF))
+    rom.load(0, rom_data)
+    proc.write_sp(0xFE00)
+    return proc, rom, ram
+
+
+def _run(translator, max_cycles):
+    proc = translator.processor
+    while proc.total_cycles < max_cycles:
+        translator.execute(max_cycles - proc.total_cycles)
+
+
+class TranslationCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self._tempdir = tempfile.TemporaryDirectory()
+        self.directory = self._tempdir.name
+
+    def tearDown(self):
+        self._tempdir.cleanup()
+
+    def _files(self):
+        return sorted(os.listdir(self.directory))
+
+    # loading and saving
+
+    def test_warm_cache_skips_translation(self):
+        code = _random_program(random.Random(20), 200)
+        proc, rom, ram = _make_rom_processor(code)
+        translator = BlockTranslator(proc, TranslationCache(self.directory))
+        _run(translator, 3000)
+        translator.save_cache()
+
+        proc, rom, ram = _make_rom_processor(code)
+        translator = BlockTranslator(proc, TranslationCache(self.directory))
+        with mock.patch("k0emu.translate._generate",
+                        side_effect=AssertionError("block translated")):
+            _run(translator, 3000)
+
+    def test_cached_blocks_match_step(self):
+        code = _random_program(random.Random(21), 100)
+        proc, rom, ram = _make_rom_processor(code)
+        translator = BlockTranslator(proc, TranslationCache(self.directory))
+        _run(translator, 2000)
+        translator.save_cache()
+
+        proc, rom, ram = _make_rom_processor(code)
+        translator = BlockTranslator(proc, TranslationCache(self.directory))
+        _run(translator, 2000)
+        expected, _, expected_ram = _make_rom_processor(code)
+        while expected.total_cycles < proc.total_cycles:
+            expected.step()
+        self.assertEqual((proc.pc, proc.total_cycles, bytes(ram.data)),
+                         (expected.pc, expected.total_cycles,
+                          bytes(expected_ram.data)))
+
+    def test_one_file_for_each_rom_image(self):
+        for rom_data in ([0x00, 0xfa, 0xfe], [0x00, 0x00, 0xfa, 0xfe]):
+            proc, rom, ram = _make_rom_processor(rom_data)
+            translator = BlockTranslator(proc, TranslationCache(self.directory))
+            translator.execute(100)
+            translator.save_cache()
+        files = self._files()
+        self.assertEqual(len(files), 2)
+        self.assertTrue(all(name.endswith(TranslationCache.SUFFIX)
+                            for name in files))
+
+    def test_cycle_mode_is_part_of_key(self):
+        for cycle_mode in (CycleMode.EXACT, CycleMode.LITE):
+            proc, rom, ram = _make_rom_processor([0x00, 0xfa, 0xfe],
+                                                 cycle_mode)
+            translator = BlockTranslator(proc, TranslationCache(self.directory))
+            translator.execute(100)
+            translator.save_cache()
+        self.assertEqual(len(self._files()), 2)
+
+    def test_blocks_in_writable_memory_not_saved(self):
+        proc, rom, ram = _make_rom_processor([0x9b, 0x00, 0x80])  # br !8000h
+        ram.load(0, [0x00, 0xfa, 0xfe])  # nop, br $
+        translator = BlockTranslator(proc, TranslationCache(self.directory))
+        translator.execute(100)
+        translator.execute(100)
+        self.assertEqual(proc.pc, 0x8001)
+        translator.save_cache()
+        [name] = self._files()
+        records = TranslationCache(self.directory).load(
+            name[:-len(TranslationCache.SUFFIX)])
+        self.assertEqual(list(records), [0])
+
+    def test_saved_blocks_merged_with_loaded_blocks(self):
+        rom_data = [0x9b, 0x00, 0x10] + [0x00] * (0x1000 - 3) + [0xfa, 0xfe]
+        proc, rom, ram = _make_rom_processor(rom_data)
+        translator = BlockTranslator(proc, TranslationCache(self.directory))
+        translator.execute(100)
+        translator.save_cache()
+        proc, rom, ram = _make_rom_processor(rom_data)
+        translator = BlockTranslator(proc, TranslationCache(self.directory))
+        translator.execute(100)
+        translator.execute(100)
+        translator.save_cache()
+        [name] = self._files()
+        records = TranslationCache(self.directory).load(
+            name[:-len(TranslationCache.SUFFIX)])
+        self.assertEqual(sorted(records), [0, 0x1000])
+
+    def test_nothing_saved_without_rom_blocks(self):
+        proc, mem = _make_processor()
+        proc.write_memory_bytes(0, [0x00, 0xfa, 0xfe])
+        translator = BlockTranslator(proc, TranslationCache(self.directory))
+        translator.execute(100)
+        translator.save_cache()
+        self.assertEqual(self._files(), [])
+
+    def test_records_hold_source_not_code(self):
+        proc, rom, ram = _make_rom_processor([0x00, 0xfa, 0xfe])
+        translator = BlockTranslator(proc, TranslationCache(self.directory))
+        translator.execute(100)
+        translator.save_cache()
+        [name] = self._files()
+        records = TranslationCache(self.directory).load(
+            name[:-len(TranslationCache.SUFFIX)])
+        spans, handlers, source = records[0]
+        self.assertTrue(source.startswith("def block("))
+
+    # robustness
+
+    def test_malformed_record_is_translated_again(self):
+        rom_data = [0x00, 0xfa, 0xfe]
+        proc, rom, ram = _make_rom_processor(rom_data)
+        translator = BlockTranslator(proc, TranslationCache(self.directory))
+        translator.execute(100)
+        translator.save_cache()
+        [name] = self._files()
+        key = name[:-len(TranslationCache.SUFFIX)]
+        cache = TranslationCache(self.directory)
+        spans, handlers, source = cache.load(key)[0]
+        cache.store(key, {0: (spans, handlers, source, None)})  # old format
+        proc, rom, ram = _make_rom_processor(rom_data)
+        translator = BlockTranslator(proc, TranslationCache(self.directory))
+        translator.execute(100)
+        self.assertEqual(proc.pc, 0x0001)
+
+    def test_directory_created_owner_only(self):
+        cache = TranslationCache(os.path.join(self.directory, "sub"))
+        cache.store("k", {1: "one"})
+        mode = os.stat(cache.directory).st_mode & 0o777
+        self.assertEqual(mode & ~0o700, 0)
+
+    def test_unreadable_file_is_ignored(self):
+        cache = TranslationCache(self.directory)
+        with open(os.path.join(self.directory, "k" + cache.SUFFIX), "wb") as f:
+            f.write(b"\xff\x00garbage")
+        self.assertIsNone(cache.load("k"))
+        self.assertIsNone(cache.load("missing"))
+
+    def test_store_leaves_no_temporary_files(self):
+        cache = TranslationCache(os.path.join(self.directory, "sub"))
+        cache.store("k", {1: "one"})
+        self.assertEqual(os.listdir(cache.directory), ["k" + cache.SUFFIX])
+        self.assertEqual(cache.load("k"), {1: "one"})
+
+    def test_least_recently_used_files_evicted(self):
+        cache = TranslationCache(self.directory)
+        for index, key in enumerate(("a", "b", "c")):
+            cache.store(key, {0: os.urandom(40)})
+            path = os.path.join(self.directory, key + cache.SUFFIX)
+            os.utime(path, (index, index))
+        cache.max_size = os.path.getsize(path) * 7 // 2  # room for 3 files
+        cache.load("a")  # now the most recently used
+        cache.store("d", {0: os.urandom(40)})
+        self.assertEqual(self._files(), ["a" + cache.SUFFIX,
+                                         "c" + cache.SUFFIX,
+                                         "d" + cache.SUFFIX])
@@ -0,0 +1,631 @@
+"""Basic block translator.
+
+Translates straight-line runs of code (up to and including the next branch,
+call, return, or halt) into Python functions.  Register-only instructions
+are compiled inline with the registers and PSW held in local variables;
+all other instructions call their normal processor handler.  Peripherals
+are ticked and interrupts are checked after every instruction, so running
+a block has the same result as calling Processor.step() once for each of
+its instructions.
+
+Blocks translated from read-only memory can be saved to a TranslationCache
+and loaded by the next process that runs the same ROM image, so that it
+does not have to discover and generate them again.
+"""
+
+import copy
+import hashlib
+import sys
+
+from k0emu import isa
+from k0emu.cache import FileCache, fingerprint
+from k0emu.bus import Bus
+from k0emu.devices import MemoryDevice
+from k0emu.processor import Processor, RunState
+
+
+class BlockTranslator(object):
+    MAX_BLOCK_INSTRUCTIONS = 32
+
+    def __init__(self, processor, cache=None):
+        """cache is an optional TranslationCache to load blocks from, and to
+        save the blocks translated from read-only memory to with
+        save_cache()"""
+        self.processor = processor
+        self.cache = cache
+        self._blocks = [None] * Bus.ADDRESS_SPACE_SIZE
+        self._blocks_covering = {}  # address -> start addresses of blocks
+        self._cached_records = None  # start -> record loaded from the cache
+        self._cached_key = None  # cache key of the loaded records
+        self._rom_records = {}  # start -> record of blocks to be saved
+
+    def __deepcopy__(self, memo):
+        """Copy the translator for a copy of its processor, such as one
+        reached by Processor.clone() through the memory devices it watches.
+        The copy starts without translated blocks, since a block can only
+        be invalidated by the translator that made it."""
+        clone = object.__new__(type(self))
+        memo[id(self)] = clone
+        clone.__init__(copy.deepcopy(self.processor, memo), self.cache)
+        return clone
+
+    def execute(self, max_cycles):
+        """Execute the block at PC.  The block stops early once max_cycles
+        have elapsed, an interrupt is dispatched, or the processor is reset.
+        If it stops in HALT or branches back to a delay loop or an idle
+        polling loop, the processor is fast-forwarded as it would be by
+        Processor.run().
+        Returns a tuple of (next pc, cycles executed)."""
+        proc = self.processor
+        start = proc.pc
+        block = self._blocks[start]
+        if block is None:
+            block = self._translate(start)
+        if block is None:
+            stop_reason, cycles = proc.run(1)  # a single instruction
+            last = start
+        else:
+            pc, cycles = block(proc, max_cycles)
+            last = block.last
+        if cycles < max_cycles:
+            limit = proc.bus.cycles + max_cycles - cycles
+            if proc.run_state == RunState.HALTED:
+                cycles += proc._skip_halt(limit)
+            elif proc.pc <= start:  # backward branch
+                cycles += proc._skip_loop(last, limit)
+        return proc.pc, cycles
+
+    def invalidate(self):
+        """Discard all translated blocks"""
+        for block in self._blocks:
+            if block is not None:
+                block.live[0] = False
+        self._blocks = [None] * Bus.ADDRESS_SPACE_SIZE
+        self._blocks_covering = {}
+        self._cached_records = None
+        self._cached_key = None
+        self._rom_records = {}
+
+    def save_cache(self):
+        """Save the blocks translated from read-only memory to the cache,
+        along with those already in it for the same ROM image"""
+        if self.cache is None or not self._rom_records:
+            return
+        key = self._cache_key()
+        records = {}
+        if self._cached_key == key:
+            records.update(self._cached_records)
+        records.update(self._rom_records)
+        self.cache.store(key, records)
+
+    # translation
+
+    def _translate(self, start):
+        record = self._cached_record(start)
+        if record is None:
+            instructions = self._discover(start)
+            if not instructions:
+                return None
+            source, namespace = _generate(start, instructions)
+            spans = tuple((address, data)
+                          for address, inst, data, decoded in instructions)
+            handlers = tuple(("h%d" % index, address)
+                             for index, (address, inst, data, decoded)
+                             in enumerate(instructions)
+                             if "h%d" % index in namespace)
+            record = (spans, handlers, source)
+            if self.cache is not None and self._is_read_only(spans):
+                self._rom_records[start] = record
+        else:
+            spans, handlers, source = record
+            namespace = _namespace()
+            for name, address in handlers:
+                namespace[name] = self.processor._decode(address)[0]
+
+        exec(compile(source, "<block 0x%04x>" % start, "exec"), namespace)
+        block = namespace["block"]
+        block.live = namespace["live"]
+        block.source = source
+        block.last = spans[-1][0]  # address of the last instruction
+
+        bus = self.processor.bus
+        for address, data in spans:
+            for offset in range(len(data)):
+                byte_address = address + offset
+                device, register = bus.device_at(byte_address)
+                device.add_watcher(self._code_modified)
+                device.watch(register)
+                starts = self._blocks_covering.setdefault(byte_address, [])
+                starts.append(start)
+        self._blocks[start] = block
+        return block
+
+    def _discover(self, start):
+        """Return a list of (address, instruction, data, decoded) tuples for
+        the block starting at the given address, where instruction is its
+        isa.Description"""
+        proc = self.processor
+        view = _CodeView(proc.bus)
+        instructions = []
+        address = start
+        while len(instructions) < self.MAX_BLOCK_INSTRUCTIONS:
+            code = []
+            for offset in range(isa.MAX_LENGTH):
+                try:
+                    code.append(view[address + offset])
+                except _NotCode:
+                    break
+            try:
+                inst = isa.describe(code, address)
+            except ValueError:
+                break
+            data = bytes(code[:inst.length])
+            decoded = proc._decode(address)
+            handler, opcode, fetched, cycles = decoded
+            if handler is Processor._opcode_not_implemented:
+                break
+            instructions.append((address, inst, data, decoded))
+            if inst.flow != isa.Flow.CONTINUE:
+                break
+            address += inst.length
+        return instructions
+
+    def _code_modified(self, device, start, end):
+        """Watcher callback: discard blocks containing modified bytes"""
+        bus = self.processor.bus
+        for register in range(start, end):
+            address = bus.address_of(device, register)
+            for block_start in self._blocks_covering.pop(address, ()):
+                block = self._blocks[block_start]
+                if block is not None:
+                    block.live[0] = False
+                    self._blocks[block_start] = None
+                self._rom_records.pop(block_start, None)
+
+    # cache
+
+    def _cached_record(self, start):
+        """Return the cached (spans, handlers, source) record of the block
+        at start, if its bytes are still the same, or None.  spans are the
+        (address, bytes) of its instructions, handlers are the (name,
+        address) of the instructions that call their handlers, and source
+        is the source of the block function."""
+        if self.cache is None:
+            return None
+        if self._cached_records is None:
+            self._cached_key = self._cache_key()
+            self._cached_records = self.cache.load(self._cached_key) or {}
+        record = self._cached_records.get(start)
+        if not _is_record(record):
+            return None
+        view = _CodeView(self.processor.bus)
+        for address, data in record[0]:
+            for offset, value in enumerate(data):
+                try:
+                    if view[address + offset] != value:
+                        return None
+                except _NotCode:
+                    return None
+        return record
+
+    def _is_read_only(self, spans):
+        bus = self.processor.bus
+        for address, data in spans:
+            for offset in range(len(data)):
+                device, register = bus.device_at(address + offset)
+                if device.writable:
+                    return False
+        return True
+
+    def _cache_key(self):
+        """Hash of the read-only memory (the ROM image), the cycle mode, and
+        the code that generates and runs the blocks"""
+        digest = hashlib.sha256(_fingerprint())
+        digest.update(b"cycle mode %d" % self.processor.cycle_mode)
+        for start, end, device in self.processor.bus.memory_map():
+            if isinstance(device, MemoryDevice) and not device.writable:
+                digest.update(b"%s %d-%d " % (device.name.encode("utf-8"),
+                                              start, end))
+                digest.update(device.data)
+        return digest.hexdigest()
+
+
+# code may not be translated from the register banks or above, since the
+# registers and PSW are held in local variables while a block runs
+_CODE_LIMIT = Processor.REGISTER_FILE_ADDRESS
+
+
+def _is_record(record):
+    """Check the shape of a record loaded from the cache, which may have
+    been written by an older version"""
+    if not (isinstance(record, tuple) and len(record) == 3):
+        return False
+    spans, handlers, source = record
+    return (isinstance(spans, tuple) and len(spans) > 0 and
+            all(isinstance(span, tuple) and len(span) == 2 and
+                isinstance(span[0], int) and isinstance(span[1], bytes)
+                for span in spans) and
+            isinstance(handlers, tuple) and
+            all(isinstance(handler, tuple) and len(handler) == 2 and
+                isinstance(handler[0], str) and isinstance(handler[1], int)
+                for handler in handlers) and
+            isinstance(source, str))
+
+
+class _NotCode(Exception):
+    pass
+
+
+class _CodeView(object):
+    """Read-only view of the bytes on the bus that come from memory devices.
+    Used to read code without side effects on other devices."""
+
+    def __init__(self, bus):
+        self._bus = bus
+
+    def __getitem__(self, address):
+        device, register = self._bus.device_at(address & 0xFFFF)
+        if not isinstance(device, MemoryDevice) or address >= _CODE_LIMIT:
+            raise _NotCode()
+        return device.read(register)
+
+
+# cache
+
+class TranslationCache(FileCache):
+    """Directory of translated blocks saved by BlockTranslator.save_cache(),
+    with one file of records for each ROM image.
+
+    The records hold the Python source of the blocks, which is compiled and
+    run when they are loaded.  Anyone who can write to the directory can
+    therefore run code in the emulator, so it must only be writable by the
+    user running it.  The directory is created with owner-only permissions
+    if it does not exist."""
+
+    SUFFIX = ".k0blocks"
+
+    def load(self, key):
+        """Return the records saved for the key, or None if there are none
+        or they cannot be read"""
+        records = super().load(key)
+        if not isinstance(records, dict):
+            return None
+        return records
+
+
+_FINGERPRINT = None
+
+
+def _fingerprint():
+    """Hash of the sources of the modules that blocks are generated from,
+    and of the Python version"""
+    global _FINGERPRINT
+    if _FINGERPRINT is None:
+        _FINGERPRINT = fingerprint((sys.modules[__name__], isa,
+                                    sys.modules[Processor.__module__]))
+    return _FINGERPRINT
+
+
+# code generation
+
+_REG_NAMES = ("x", "a", "c", "b", "e", "d", "l", "h")
+_PAIR_NAMES = (("x", "a"), ("c", "b"), ("e", "d"), ("l", "h"))
+
+
+def _namespace():
+    return {"live": [True], "RUNNING": RunState.RUNNING}
+
+
+def _generate(start, instructions):
+    """Generate the source of a block function.  Returns a tuple of
+    (source, namespace) where namespace holds the handlers it calls."""
+    namespace = _namespace()
+
+    # work out which instructions are compiled inline and which registers
+    # they use, so only those registers are held in local variables
+    ops = []
+    for address, inst, data, decoded in instructions:
+        ops.append((address, inst, decoded, _inline_op(data)))
+    used = set()
+    for address, inst, decoded, inline in ops:
+        if inline is not None:
+            used.update(inline.reads)
+            used.update(inline.writes)
+    used = [name for name in _REG_NAMES if name in used]
+
+    w = _Writer()
+    w.line("def block(proc, max_cycles):")
+    w.indent += 1
+    w.line("bus = proc.bus")
+    w.line("tick = bus.tick")
+    w.line("regs = proc._regs")
+    w.line("resets = proc._resets")
+    w.line("cycles = 0")
+    w.line("proc.run_state = RUNNING")
+    _load(w, used)
+    dirty = set()
+
+    last = len(ops) - 1
+    for index, (address, inst, decoded, inline) in enumerate(ops):
+        next_address = (address + inst.length) & 0xFFFF
+        w.line("")
+        w.line("# %04x: %s" % (address, inst))
+
+        if inline is not None:
+            for line in inline.lines:
+                w.line(line)
+            dirty.update(inline.writes)
+            if inline.writes_psw:
+                dirty.add("psw")
+            w.line("proc._total_cycles += %d" % inline.cycles)
+            w.line("tick(%d)" % inline.cycles)
+            w.line("cycles += %d" % inline.cycles)
+            # a reset may have happened while the peripherals ticked
+            w.line("if proc._resets != resets:")
+            w.indent += 1
+            _flush(w, dirty - set(["psw"]))
+            w.line("return proc.pc, cycles")
+            w.indent -= 1
+            if index == last:
+                w.line("proc._inst_cycles = %d" % inline.cycles)
+                _flush(w, dirty)
+                w.line("proc.pc = 0x%04X" % next_address)
+                w.line("proc._service_interrupt()")
+                w.line("return proc.pc, cycles")
+            else:
+                w.line("if cycles >= max_cycles or "
+                       "(bus.pending_interrupt is not None and psw & 0x80):")
+                w.indent += 1
+                w.line("proc._inst_cycles = %d" % inline.cycles)
+                _flush(w, dirty)
+                w.line("proc.pc = 0x%04X" % next_address)
+                w.line("proc._service_interrupt()")
+                w.line("return proc.pc, cycles")
+                w.indent -= 1
+            continue
+
+        # everything else calls the processor's handler
+        handler, opcode, fetched, cycles = decoded
+        name = "h%d" % index
+        namespace[name] = handler
+        _flush(w, dirty)
+        dirty = set()
+        w.line("proc.pc = 0x%04X" % ((address + fetched) & 0xFFFF))
+        w.line("proc._inst_cycles = %d" % cycles)
+        w.line("%s(proc, 0x%02X)" % (name, opcode))
+        w.line("c = proc._inst_cycles")
+        w.line("proc._total_cycles += c")
+        w.line("tick(c)")
+        w.line("cycles += c")
+        w.line("proc._complete_instruction()")
+        if index == last:
+            w.line("return proc.pc, cycles")
+        else:
+            # stop if an interrupt was dispatched, the processor was reset,
+            # or the block was modified
+            w.line("if (proc.pc != 0x%04X or proc._resets != resets or "
+                   "cycles >= max_cycles or not live[0]):" % next_address)
+            w.line("    return proc.pc, cycles")
+            _load(w, used)
+
+    return w.source(), namespace
+
+
+def _load(w, used):
+    w.line("psw = proc._psw")
+    if used:
+        w.line("base = proc._bank_base")
+        for name in used:
+            w.line("%s = regs[base + %d]" % (name, _REG_NAMES.index(name)))
+
+
+def _flush(w, dirty):
+    for name in _REG_NAMES:
+        if name in dirty:
+            w.line("regs[base + %d] = %s" % (_REG_NAMES.index(name), name))
+    if "psw" in dirty:
+        w.line("proc.write_psw(psw)")
+
+
+class _Writer(object):
+    def __init__(self):
+        self.indent = 0
+        self._lines = []
+
+    def line(self, text):
+        if text:
+            text = "    " * self.indent + text
+        self._lines.append(text)
+
+    def source(self):
+        return "\n".join(self._lines) + "\n"
+
+
+# inline instructions
+
+class _Inline(object):
+    def __init__(self, cycles, lines, reads=(), writes=(), writes_psw=False):
+        self.cycles = cycles
+        self.lines = lines
+        self.reads = reads
+        self.writes = writes
+        self.writes_psw = writes_psw
+
+
+def _inline_op(data):
+    """Return an _Inline for a register-only instruction, given its bytes,
+    or None if the instruction must call its handler"""
+    opcode = data[0]
+    length = len(data)
+
+    if opcode == 0x61:
+        opcode2 = data[1]
+        if opcode2 < 0x80:
+            # 61 00..7f: alu reg,a / alu a,reg
+            op = _ALU_OPS[opcode2 >> 4]
+            reg = _REG_NAMES[opcode2 & 7]
+            if opcode2 & 8:
+                return op(length + 2, "a", reg)
+            return op(length + 2, reg, "a")
+        return None
+
+    if opcode == 0x00:  # nop
+        return _Inline(length + 1, [])
+    if opcode == 0x01:  # not1 cy
+        return _Inline(length + 1, ["psw ^= 0x01"], writes_psw=True)
+    if opcode == 0x20:  # set1 cy
+        return _Inline(length + 1, ["psw |= 0x01"], writes_psw=True)
+    if opcode == 0x21:  # clr1 cy
+        return _Inline(length + 1, ["psw &= 0xFE"], writes_psw=True)
+    if opcode in _ROTATES:
+        return _Inline(length + 1, _ROTATES[opcode], ("a",), ("a",), True)
+
+    reg = _REG_NAMES[opcode & 7]
+    if opcode in (0x30, 0x32, 0x33, 0x34, 0x35, 0x36, 0x37):  # xch a,r
+        return _Inline(length + 1, ["a, %s = %s, a" % (reg, reg)],
+                       ("a", reg), ("a", reg))
+    if opcode in (0x60, 0x62, 0x63, 0x64, 0x65, 0x66, 0x67):  # mov a,r
+        return _Inline(length + 1, ["a = %s" % reg], (reg,), ("a",))
+    if opcode in (0x70, 0x72, 0x73, 0x74, 0x75, 0x76, 0x77):  # mov r,a
+        return _Inline(length + 1, ["%s = a" % reg], ("a",), (reg,))
+    if 0x40 <= opcode <= 0x47:  # inc r
+        return _Inline(length + 1, [
+            "psw = psw & 0xAF | (0x10 if %s & 0x0F == 0x0F else 0)" % reg,
+            "%s = (%s + 1) & 0xFF" % (reg, reg),
+            "if not %s: psw |= 0x40" % reg,
+            ], (reg,), (reg,), True)
+    if 0x50 <= opcode <= 0x57:  # dec r
+        return _Inline(length + 1, [
+            "psw = psw & 0xAF | (0x10 if %s & 0x0F == 0 else 0)" % reg,
+            "%s = (%s - 1) & 0xFF" % (reg, reg),
+            "if not %s: psw |= 0x40" % reg,
+            ], (reg,), (reg,), True)
+    if 0xa0 <= opcode <= 0xa7:  # mov r,#byte
+        return _Inline(length + 2, ["%s = 0x%02X" % (reg, data[1])],
+                       (), (reg,))
+
+    low, high = _PAIR_NAMES[(opcode >> 1) & 3]
+    if opcode in (0x10, 0x12, 0x14, 0x16):  # movw rp,#word
+        return _Inline(length + 3, ["%s = 0x%02X" % (low, data[1]),
+                                    "%s = 0x%02X" % (high, data[2])],
+                       (), (low, high))
+    if opcode in (0x80, 0x82, 0x84, 0x86, 0x90, 0x92, 0x94, 0x96):
+        # incw rp / decw rp
+        delta = "+" if opcode < 0x90 else "-"
+        return _Inline(length + 3, [
+            "t = ((%s << 8 | %s) %s 1) & 0xFFFF" % (high, low, delta),
+            "%s = t & 0xFF" % low,
+            "%s = t >> 8" % high,
+            ], (low, high), (low, high))
+    if opcode in (0xc2, 0xc4, 0xc6):  # movw ax,rp
+        return _Inline(length + 3, ["x, a = %s, %s" % (low, high)],
+                       (low, high), ("x", "a"))
+    if opcode in (0xd2, 0xd4, 0xd6):  # movw rp,ax
+        return _Inline(length + 3, ["%s, %s = x, a" % (low, high)],
+                       ("x", "a"), (low, high))
+    if opcode in (0xe2, 0xe4, 0xe6):  # xchw ax,rp
+        return _Inline(length + 3,
+                       ["x, a, %s, %s = %s, %s, x, a" % (low, high, low, high)],
+                       ("x", "a", low, high), ("x", "a", low, high))
+
+    if opcode in (0x0d, 0x1d, 0x2d, 0x3d, 0x4d, 0x5d, 0x6d, 0x7d):
+        # alu a,#byte
+        op = _ALU_OPS[opcode >> 4]
+        return op(length + 2, "a", "0x%02X" % data[1])
+    if opcode in (0xca, 0xda, 0xea):  # addw/subw/cmpw ax,#word
+        return _word_op(length + 3, opcode, data[1] | data[2] << 8)
+    return None
+
+
+def _alu_add(cycles, dst, src, carry=False):
+    c = " + (psw & 1)" if carry else ""
+    lines = [
+        "t = %s + %s%s" % (dst, src, c),
+        "psw = (psw & 0xAE | (0x10 if (%s & 0x0F) + (%s & 0x0F)%s > 0x0F "
+        "else 0) | (1 if t > 0xFF else 0))" % (dst, src, c),
+        "%s = t & 0xFF" % dst,
+        "if not %s: psw |= 0x40" % dst,
+        ]
+    return _Inline(cycles, lines, _names(dst, src), (dst,), True)
+
+
+def _alu_addc(cycles, dst, src):
+    return _alu_add(cycles, dst, src, carry=True)
+
+
+def _alu_sub(cycles, dst, src, carry=False, store=True):
+    c = " - (psw & 1)" if carry else ""
+    lines = [
+        "t = %s - %s%s" % (dst, src, c),
+        "psw = (psw & 0xAE | (0x10 if ((%s & 0x0F) - (%s & 0x0F)%s) & 0x10 "
+        "else 0) | (1 if t < 0 else 0))" % (dst, src, c),
+        ]
+    if store:
+        lines.append("%s = t & 0xFF" % dst)
+        lines.append("if not %s: psw |= 0x40" % dst)
+        writes = (dst,)
+    else:
+        lines.append("if not t & 0xFF: psw |= 0x40")
+        writes = ()
+    return _Inline(cycles, lines, _names(dst, src), writes, True)
+
+
+def _alu_subc(cycles, dst, src):
+    return _alu_sub(cycles, dst, src, carry=True)
+
+
+def _alu_cmp(cycles, dst, src):
+    return _alu_sub(cycles, dst, src, store=False)
+
+
+def _alu_logic(operator):
+    def op(cycles, dst, src):
+        lines = [
+            "%s %s= %s" % (dst, operator, src),
+            "psw = psw & 0xBF | (0 if %s else 0x40)" % dst,
+            ]
+        return _Inline(cycles, lines, _names(dst, src), (dst,), True)
+    return op
+
+
+# indexed by the high nibble of the opcode: add, sub, addc, subc, cmp,
+# and, or, xor
+_ALU_OPS = (_alu_add, _alu_sub, _alu_addc, _alu_subc, _alu_cmp,
+            _alu_logic("&"), _alu_logic("|"), _alu_logic("^"))
+
+
+def _word_op(cycles, opcode, value):
+    if opcode == 0xca:  # addw
+        lines = ["t = (a << 8 | x) + 0x%04X" % value,
+                 "psw = psw & 0xAE | (1 if t > 0xFFFF else 0)"]
+    else:  # subw, cmpw
+        lines = ["t = (a << 8 | x) - 0x%04X" % value,
+                 "psw = psw & 0xAE | (1 if t < 0 else 0)"]
+    lines.append("t &= 0xFFFF")
+    lines.append("if not t: psw |= 0x40")
+    writes = ()
+    if opcode != 0xea:
+        lines.append("x = t & 0xFF")
+        lines.append("a = t >> 8")
+        writes = ("x", "a")
+    return _Inline(cycles, lines, ("x", "a"), writes, True)
+
+
+def _names(*operands):
+    return tuple(name for name in operands if name in _REG_NAMES)
+
+
+_ROTATES = {
+    0x24: ["t = a & 1",                         # ror a,1
+           "a = a >> 1 | t << 7",
+           "psw = psw & 0xFE | t"],
+    0x25: ["t = a & 1",                         # rorc a,1
+           "a = a >> 1 | (psw & 1) << 7",
+           "psw = psw & 0xFE | t"],
+    0x26: ["t = a >> 7",                        # rol a,1
+           "a = (a << 1) & 0xFF | t",
+           "psw = psw & 0xFE | t"],
+    0x27: ["t = a >> 7",                        # rolc a,1
+           "a = (a << 1) & 0xFF | (psw & 1)",
+           "psw = psw & 0xFE | t"],
+}
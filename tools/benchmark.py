@@ -0,0 +1,76 @@
+'''
+Usage: python tools/benchmark.py
+
+Measures the cost of creating a Processor and of executing instructions
+one step() at a time.  Run it from the root of the repository on the
+trees to be compared, in the same environment.
+'''
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from k0emu.devices import MemoryDevice
+from k0emu.processor import Processor
+
+
+STEP_CYCLES = 300000
+
+# increments a byte of RAM forever, with a push and pop in the loop
+_PROGRAM = [
+    0xee, 0x1c, 0x00, 0xfe,  # movw sp,#0fe00h
+    0x16, 0x00, 0xf0,        # movw hl,#0f000h
+    0x87,                    # mov a,[hl]
+    0x41,                    # inc a
+    0x97,                    # mov [hl],a
+    0xb1,                    # push ax
+    0xb0,                    # pop ax
+    0xfa, 0xf9]              # br 0007h
+
+
+def _make_processor():
+    proc = Processor()
+    mem = MemoryDevice("test_memory", size=0x10000)
+    proc.bus.add_device(mem, (0x0000, 0xFFFF))
+    return proc
+
+
+def construction_time(number=200):
+    """Average seconds to create a Processor"""
+    timer = timeit.Timer(Processor)
+    return min(timer.repeat(repeat=5, number=number)) / number
+
+
+def construction_memory(count=20):
+    """Average bytes allocated for each Processor that is kept alive"""
+    Processor()  # anything created once, such as tables, is not counted
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    processors = [Processor() for _ in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del processors
+    return (after - before) / count
+
+
+def step_time():
+    """Best seconds to step() through STEP_CYCLES cycles of a loop"""
+    def run():
+        proc = _make_processor()
+        proc.write_memory_bytes(0, _PROGRAM)
+        while proc.total_cycles < STEP_CYCLES:
+            proc.step()
+    return min(timeit.repeat(run, repeat=5, number=1))
+
+
+def main():
+    print("Processor() construction:    %8.0f us" % (construction_time() * 1e6))
+    print("tracemalloc per Processor:   %8.0f KB" % (construction_memory() / 1024))
+    print("step() loop, %dk cycles:   %8.3f s" % (STEP_CYCLES // 1000,
+                                                 step_time()))
+
+
+if __name__ == "__main__":
+    main()